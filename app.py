@@ -1,77 +1,190 @@
-from flask import Flask, render_template, request, redirect, session, url_for, jsonify, flash
+from flask import Flask, Response, render_template, request, redirect, session, url_for, jsonify, flash, g, stream_with_context
 from models import db
 from models.user import User
 from models.vault_item import VaultItem
 from models.notification import Notification
-from datetime import datetime, timedelta
-from patterns.observer import BookingSubject, UserObserver
+from models.expiry_index import ExpiryIndex
+from models.search_token import SearchToken
+from models.password_audit import PasswordAudit
+from models.vault_field import VaultField
+from models.vault_tombstone import VaultTombstone
+from models.notification_key import NotificationKey
+from models.session_state import SessionState
+from models.job_checkpoint import JobCheckpoint
 from patterns.data_proxy import DataProxy, mask_preview, mask_preview_dict
-from patterns.singleton import UserSession
-from patterns.password_builder import generate_password as builder_generate_password
+from patterns.session_registry import SessionRegistry
+from patterns.password_builder import generate_passwords as builder_generate_passwords
 from models.unmask_token import UnmaskToken
-from utils.crypto import load_key, encrypt_json, decrypt_json
+from utils.crypto import load_key, configure_bulk_decrypt, BULK_THRESHOLD, BULK_CHUNK_SIZE
+from utils.envelope import data_keys, decrypt_for, ensure_user_key
+from utils.blind_index import query_digests
+from utils.db_profile import apply_sqlite_profile
+from utils.jobs import build_scheduler
+from utils.metrics import (finish_request, http_requests, instrument_engine, instrument_templates, metrics,
+                           server_timing, start_request)
+from utils.migrations import run_migrations
+from utils.pagination import keyset_page
+from utils.profiling import RequestProfiler
+from utils.password_audit import SCORE_LABELS
+from utils.password_hashing import HashingBusy, hasher
+from utils.vault_sync import changes_since, item_etag, list_etag
+from utils.vault_storage import (encrypt_previews, item_cache, preview_token, read_field, read_item, read_items,
+                                 write_item)
+from utils.signed_token import issue_signed, validate_signed
+from utils.vault_io import EXPORT_FORMATS, IMPORT_FORMATS, ImportFormatError, export_vault, import_records, parse
+import hmac
+import json
 import os
+import time
 
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('MYPASS_SECRET', 'supersecretkey')
 
 basedir = os.path.abspath(os.path.dirname(__file__))
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'database', 'mypass.db')
+# MYPASS_DATABASE_URL points the app at another database (e.g. a benchmark copy)
+app.config['SQLALCHEMY_DATABASE_URI'] = (os.environ.get('MYPASS_DATABASE_URL')
+                                         or 'sqlite:///' + os.path.join(basedir, 'database', 'mypass.db'))
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# SQLite connection PRAGMAs, see utils/db_profile.py ('performance' or 'default')
+app.config['DB_PROFILE'] = os.environ.get('MYPASS_DB_PROFILE', 'performance')
+app.config['SQLITE_PRAGMAS'] = {}
+# 'thread' runs periodic jobs (expiry notifications) on a thread of the
+# `python app.py` development server; 'off' leaves them to `worker.py`. Importing
+# the app (WSGI servers, CLIs) never starts them; see start_background_jobs()
+app.config['EXPIRY_SCHEDULER'] = os.environ.get('MYPASS_EXPIRY_SCHEDULER', 'thread')
+app.config['EXPIRY_SCAN_INTERVAL'] = int(os.environ.get('MYPASS_EXPIRY_INTERVAL', 60))
+app.config['SESSION_INACTIVITY_TIMEOUT'] = int(os.environ.get('MYPASS_SESSION_TIMEOUT', 60))
+# notification push (/notifications/stream): poll interval and stream lifetime in
+# seconds; each open stream holds one server thread, the browser reconnects
+app.config['NOTIFY_POLL_INTERVAL'] = float(os.environ.get('MYPASS_NOTIFY_POLL', 2))
+app.config['NOTIFY_STREAM_MAX'] = float(os.environ.get('MYPASS_NOTIFY_STREAM_MAX', 300))
+# 'signed': stateless HMAC unmask tokens (no DB writes); 'db': audited rows in unmask_tokens
+app.config['UNMASK_TOKEN_MODE'] = os.environ.get('MYPASS_UNMASK_TOKEN_MODE', 'signed')
+# storage format for saved items: 'fields' (each field encrypted separately,
+# single-field reads) or 'blob' (one token per item); both are always readable
+app.config['VAULT_STORAGE_FORMAT'] = os.environ.get('MYPASS_STORAGE_FORMAT', 'fields')
+# ciphertext encoding for new writes: 'binary' (compressed AES-GCM payload in
+# BLOB columns) or 'fernet' (base64 text tokens); both are always readable
+app.config['PAYLOAD_FORMAT'] = os.environ.get('MYPASS_PAYLOAD_FORMAT', 'binary')
+# decrypted-item LRU cache for view/edit/copy (entries, seconds); 0 entries disables it
+app.config['ITEM_CACHE_SIZE'] = int(os.environ.get('MYPASS_ITEM_CACHE_SIZE', 256))
+app.config['ITEM_CACHE_TTL'] = float(os.environ.get('MYPASS_ITEM_CACHE_TTL', 120))
+# rows per transaction for bulk import and per decrypt batch for export
+app.config['IMPORT_CHUNK_SIZE'] = int(os.environ.get('MYPASS_IMPORT_CHUNK', 1000))
+# unwrapped per-user data keys kept in memory (entries, seconds)
+app.config['DATA_KEY_CACHE_SIZE'] = int(os.environ.get('MYPASS_DATA_KEY_CACHE_SIZE', 1024))
+app.config['DATA_KEY_CACHE_TTL'] = float(os.environ.get('MYPASS_DATA_KEY_CACHE_TTL', 600))
+# pool used by decrypt_many() for large batches: 'process', 'thread' or 'off'.
+# Off in the web app (no request decrypts a full batch, and worker processes
+# don't mix with a threaded server); CLI jobs such as transfer.py turn it on
+app.config['BULK_DECRYPT_MODE'] = os.environ.get('MYPASS_BULK_DECRYPT', 'off')
+app.config['BULK_DECRYPT_WORKERS'] = int(os.environ.get('MYPASS_BULK_DECRYPT_WORKERS', 0)) or None
+# batch size at which the pool takes over, and tokens per pool task
+app.config['BULK_DECRYPT_THRESHOLD'] = int(os.environ.get('MYPASS_BULK_DECRYPT_THRESHOLD', BULK_THRESHOLD))
+app.config['BULK_DECRYPT_CHUNK'] = int(os.environ.get('MYPASS_BULK_DECRYPT_CHUNK', BULK_CHUNK_SIZE))
+# account password hashing: a pinned werkzeug method (e.g. 'scrypt:65536:8:1'),
+# or the algorithm calibrated at startup to take about TARGET_MS (0 = werkzeug default)
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('MYPASS_HASH_METHOD', '')
+app.config['PASSWORD_HASH_ALGORITHM'] = os.environ.get('MYPASS_HASH_ALGORITHM', 'scrypt')
+app.config['PASSWORD_HASH_TARGET_MS'] = float(os.environ.get('MYPASS_HASH_TARGET_MS', 250))
+# hashing threads and how many more hashes may wait before requests get a 503
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('MYPASS_HASH_WORKERS', 0)) or max(1, (os.cpu_count() or 2) // 2)
+app.config['PASSWORD_HASH_QUEUE'] = int(os.environ.get('MYPASS_HASH_QUEUE', 32))
+# request/SQL/crypto instrumentation served at /metrics (Prometheus text);
+# with a token set, scrapers must send `Authorization: Bearer <token>`;
+# without one it only answers direct loopback requests
+app.config['METRICS_ENABLED'] = os.environ.get('MYPASS_METRICS', '1') in ('1', 'true', 'True')
+app.config['METRICS_TOKEN'] = os.environ.get('MYPASS_METRICS_TOKEN', '')
+# add a Server-Timing header (db, crypto, render, total) to every response
+app.config['SERVER_TIMING'] = os.environ.get('MYPASS_SERVER_TIMING', '0') in ('1', 'true', 'True')
+# on-demand profiling of single requests sent with `X-Profile: <token>` (or
+# ?_profile=<token>); off unless enabled and a token is set, see utils/profiling.py
+app.config['PROFILING_ENABLED'] = os.environ.get('MYPASS_PROFILING', '0') in ('1', 'true', 'True')
+app.config['PROFILING_TOKEN'] = os.environ.get('MYPASS_PROFILING_TOKEN', '')
+app.config['PROFILING_MODE'] = os.environ.get('MYPASS_PROFILING_MODE', 'cprofile')  # or 'sample'
+app.config['PROFILING_DIR'] = os.environ.get('MYPASS_PROFILING_DIR', os.path.join(basedir, 'profiles'))
+# at most MAX profiled requests per WINDOW seconds; only the newest KEEP files are kept
+app.config['PROFILING_MAX'] = int(os.environ.get('MYPASS_PROFILING_MAX', 6))
+app.config['PROFILING_WINDOW'] = float(os.environ.get('MYPASS_PROFILING_WINDOW', 60))
+app.config['PROFILING_KEEP'] = int(os.environ.get('MYPASS_PROFILING_KEEP', 100))
 
 db.init_app(app)
-
-
-def _infer_display_type(item_type, key):
-    k = (key or '').lower()
-    if 'passport' in k or 'license' in k or 'ssn' in k:
-        return 'Identity'
-    if 'card' in k or 'cvv' in k or (item_type and item_type.lower().startswith('credit') and 'expiry' in k):
-        return 'CreditCard'
-    return item_type or 'Item'
-
-
-def check_and_notify_expiries(user):
-    if not user:
-        return
-    items = VaultItem.query.filter_by(user_id=user.id).all()
-    subj = BookingSubject()
-    subj.attach(UserObserver(user))
-    now = datetime.utcnow()
-    for it in items:
-        try:
-            data = decrypt_json(it.encrypted_data) or {}
-        except Exception:
-            data = {}
-        for k, v in data.items():
-            if not v:
-                continue
-            key = (k or '').lower()
-            # determine if field looks like an expiry
-            is_expiry = False
-            if 'expiry' in key or 'exp' in key:
-                if key == 'expiry':
-                    if (it.item_type or '').lower().startswith('credit') or (it.item_type or '').lower() == 'identity':
-                        is_expiry = True
-                else:
-                    is_expiry = True
-            if not is_expiry:
-                continue
-            try:
-                exp_date = datetime.fromisoformat(v)
-            except Exception:
-                try:
-                    exp_date = datetime.fromisoformat(v + '-01')
-                except Exception:
-                    exp_date = None
-            if not exp_date:
-                continue
-            display_type = _infer_display_type(it.item_type, key)
-            if exp_date < now:
-                subj.status_changed(f'Item "{it.title}" ({display_type}) has expired ({k}).')
-            elif exp_date < now + timedelta(days=30):
-                subj.status_changed(f'Item "{it.title}" ({display_type}) will expire soon ({k}).')
+configure_bulk_decrypt(app.config['BULK_DECRYPT_MODE'], app.config['BULK_DECRYPT_WORKERS'],
+                       app.config['BULK_DECRYPT_THRESHOLD'], app.config['BULK_DECRYPT_CHUNK'])
+item_cache.max_entries = app.config['ITEM_CACHE_SIZE']
+item_cache.ttl = app.config['ITEM_CACHE_TTL']
+data_keys.max_entries = app.config['DATA_KEY_CACHE_SIZE']
+data_keys.ttl = app.config['DATA_KEY_CACHE_TTL']
+hasher.configure(app.config['PASSWORD_HASH_METHOD'], app.config['PASSWORD_HASH_ALGORITHM'],
+                 app.config['PASSWORD_HASH_TARGET_MS'], app.config['PASSWORD_HASH_WORKERS'],
+                 app.config['PASSWORD_HASH_QUEUE'])
+metrics.enabled = app.config['METRICS_ENABLED']
+metrics.add_collector('mypass_item_cache', 'Decrypted item cache', item_cache.stats)
+metrics.add_collector('mypass_data_key_cache', 'Unwrapped data key cache', data_keys.stats)
+metrics.add_collector('mypass_password_hashing', 'Password hashing pool', hasher.stats)
+instrument_templates(app)
+if app.config['PROFILING_ENABLED'] and app.config['PROFILING_TOKEN']:
+    app.wsgi_app = RequestProfiler(app.wsgi_app, app.config['PROFILING_TOKEN'], app.config['PROFILING_DIR'],
+                                   app.config['PROFILING_MODE'], app.config['PROFILING_MAX'],
+                                   app.config['PROFILING_WINDOW'], app.config['PROFILING_KEEP'])
+
+# per-session server state (inactivity lock, unmask quota) shared by all workers
+sessions = SessionRegistry(inactivity_timeout=app.config['SESSION_INACTIVITY_TIMEOUT'])
+
+
+# vault listing sort orders: keyset columns (unique together) and direction
+VAULT_SORTS = {
+    'title': ((VaultItem.title, VaultItem.id), False),
+    '-title': ((VaultItem.title, VaultItem.id), True),
+    'newest': ((VaultItem.id,), True),
+    'oldest': ((VaultItem.id,), False),
+}
+VAULT_ITEM_TYPES = ('Login', 'CreditCard', 'Identity', 'SecureNote')
+NOTIFICATIONS_PER_PAGE = 20
+# background requests that must not count as user activity for the auto-lock
+PASSIVE_ENDPOINTS = {'notification_stream'}
+
+
+def index_item(it, data):
+    # plaintext-free side indexes derived from an item's payload (caller commits)
+    ExpiryIndex.replace_for_item(it, data)
+    SearchToken.replace_for_item(it, data)
+    PasswordAudit.replace_for_item(it, data)
+
+
+def unindex_item(item_id):
+    ExpiryIndex.remove_for_item(item_id)
+    SearchToken.remove_for_item(item_id)
+    PasswordAudit.remove_for_item(item_id)
+
+
+def save_item_data(it, data):
+    # encrypt the payload and refresh the masked preview and side indexes (caller commits)
+    if it.id is None:
+        db.session.add(it); db.session.flush()
+    it.revision = User.next_change_seq(it.user_id)
+    binary = app.config['PAYLOAD_FORMAT'] == 'binary'
+    write_item(it, data, app.config['VAULT_STORAGE_FORMAT'], binary=binary)
+    encrypt_previews([it], [mask_preview_dict(data)], binary=binary)
+    index_item(it, data)
+
+
+def build_previews(items):
+    # listing only needs the small encrypted preview snapshot; items saved
+    # before previews existed are decrypted in full once and backfilled
+    tokens = [preview_token(it) for it in items]
+    previews = decrypt_for([it.user_id for it in items], tokens)
+    legacy = [i for i, token in enumerate(tokens) if not token]
+    if legacy:
+        payloads = read_items([items[i] for i in legacy])
+        snapshots = [mask_preview_dict(data or {}) for data in payloads]
+        encrypt_previews([items[i] for i in legacy], snapshots, binary=app.config['PAYLOAD_FORMAT'] == 'binary')
+        for i, snap in zip(legacy, snapshots):
+            previews[i] = snap
+        db.session.commit()
+    return [{'id': it.id, 'title': it.title, 'type': it.item_type, 'preview': preview or {}}
+            for it, preview in zip(items, previews)]
 
 
 def password_is_strong(pw: str) -> bool:
@@ -90,18 +203,19 @@ def home():
     if not user_id:
         return redirect(url_for('login'))
     user = User.query.get(user_id)
-    # If the server-side singleton/session references a user id that no longer
+    # If the server-side session references a user id that no longer
     # exists in the database (stale test state), clear the session and redirect
     # to login rather than raising an AttributeError.
     if not user:
         session.pop('user_id', None)
+        sessions.clear(session.pop('sid', None))
         return redirect(url_for('login'))
-    try:
-        check_and_notify_expiries(user)
-    except Exception:
-        pass
-    notes = Notification.query.filter_by(user_id=user.id, is_read=False).order_by(Notification.timestamp.desc()).all()
-    return render_template('home.html', user=user, notifications=notes)
+    # first page only; the rest comes from /api/notifications, new ones from the stream
+    page = keyset_page(Notification.query.filter_by(user_id=user.id, is_read=False), (Notification.id,), True,
+                       NOTIFICATIONS_PER_PAGE)
+    return render_template('home.html', user=user, notifications=page.items, next_cursor=page.next_cursor,
+                           unread=user.unread_notifications,
+                           latest_id=page.items[0].id if page.items else Notification.latest_id(user.id))
 
 
 @app.route('/register', methods=['GET', 'POST'])
@@ -120,6 +234,9 @@ def register():
         user.set_password(password)
         db.session.add(user)
         try:
+            db.session.flush()
+            # the data key wrap is bound to the user id
+            ensure_user_key(user)
             db.session.commit()
             # account created successfully
             return redirect(url_for('login'))
@@ -135,17 +252,16 @@ def login():
     if request.method == 'POST':
         user = User.query.filter_by(email=request.form['email']).first()
         if user and user.check_password(request.form['password']):
+            if user.password_needs_rehash():
+                # stored with outdated parameters: upgrade while we have the password
+                try:
+                    user.set_password(request.form['password'])
+                    db.session.commit()
+                except HashingBusy:
+                    pass  # try again on a later login
             session['user_id'] = user.id
-            # ensure server-side singleton session mirrors Flask session
-            try:
-                us = UserSession()
-                us.set_user(user.id)
-            except Exception:
-                pass
-            try:
-                check_and_notify_expiries(user)
-            except Exception:
-                pass
+            # start a server-side session for this login
+            session['sid'] = sessions.open(user.id)
             return redirect(url_for('home'))
         else:
             flash('Invalid email or password')
@@ -153,23 +269,89 @@ def login():
     return render_template('login.html')
 
 
+@app.before_request
+def start_request_timer():
+    # registered first so the timer also covers the session check below
+    g.request_started = time.perf_counter()
+    start_request()
+
+
+@app.after_request
+def record_request_metrics(resp):
+    started = g.pop('request_started', None)
+    if started is None or not metrics.enabled:
+        return resp
+    elapsed = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    http_requests.observe(elapsed, route, request.method, resp.status_code)
+    totals = finish_request()
+    if app.config['SERVER_TIMING']:
+        resp.headers['Server-Timing'] = server_timing(totals, elapsed)
+    return resp
+
+
+@app.teardown_request
+def finish_request_timer(exc):
+    # after_request is skipped when a view raises: count the request as a 500
+    started = g.pop('request_started', None)
+    if started is not None and metrics.enabled:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        http_requests.observe(time.perf_counter() - started, route, request.method, 500)
+    finish_request()
+
+
+def _direct_loopback() -> bool:
+    # a reverse proxy on the same host also connects from loopback, so
+    # forwarded requests don't count
+    if request.headers.get('X-Forwarded-For') or request.headers.get('Forwarded'):
+        return False
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    if not app.config['METRICS_ENABLED']:
+        return 'Not found', 404
+    token = app.config['METRICS_TOKEN']
+    if token:
+        sent = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+        if not hmac.compare_digest(sent.encode(), token.encode()):
+            return 'Forbidden', 403
+    elif not _direct_loopback():
+        return 'Not found', 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.errorhandler(HashingBusy)
+def hashing_busy(e):
+    # fail fast instead of queueing more slow hashes behind a login burst
+    db.session.rollback()
+    return 'Too many sign-in requests right now, please try again shortly.', 503, {'Retry-After': '1'}
+
+
 @app.before_request
 def enforce_session_timeout():
-    # server-side inactivity auto-lock using the Singleton UserSession
+    # server-side inactivity auto-lock using the shared SessionRegistry
     user_id = session.get('user_id')
-    us = UserSession()
     if user_id:
-        # if singleton tracks a different user, initialize it
-        if us.get_user_id() != user_id:
-            us.set_user(user_id)
-        # if locked, clear session and notify
-        if us.is_locked():
+        sid = session.get('sid')
+        # cookies issued before server-side sessions existed get one now
+        if not sid:
+            sid = session['sid'] = sessions.open(user_id)
+        state = sessions.get(sid)
+        # if locked (or the sid belongs to someone else), clear session and notify
+        if state is None or state.user_id != user_id:
             session.pop('user_id', None)
-            us.clear()
+            sessions.clear(session.pop('sid', None))
+            # drop decrypted payloads and the data key cached for this user
+            item_cache.clear_user(user_id)
+            data_keys.discard(user_id)
             flash('Session locked due to inactivity. Please log in again.', 'info')
             return redirect(url_for('login'))
         # otherwise refresh last activity
-        us.touch()
+        if request.endpoint not in PASSIVE_ENDPOINTS:
+            sessions.touch(sid)
+        g.session_user_id = user_id
 
 
 
@@ -208,12 +390,11 @@ def recover():
 
 @app.route('/logout')
 def logout():
-    session.pop('user_id', None)
-    try:
-        us = UserSession()
-        us.clear()
-    except Exception:
-        pass
+    user_id = session.pop('user_id', None)
+    sessions.clear(session.pop('sid', None))
+    if user_id:
+        item_cache.clear_user(user_id)
+        data_keys.discard(user_id)
     return redirect(url_for('login'))
 
 
@@ -222,15 +403,40 @@ def vault():
     user_id = current_user_id()
     if not user_id:
         return redirect(url_for('login'))
-    items = VaultItem.query.filter_by(user_id=user_id).all()
-    proxy = DataProxy()
-    previews = []
-    for it in items:
-        data = decrypt_json(it.encrypted_data) or {}
-        # provide both a masked dict for UI and a short string preview
-        masked_dict = mask_preview_dict(data) if 'mask_preview_dict' in globals() or hasattr(proxy, 'mask_preview') else {}
-        previews.append({'id': it.id, 'title': it.title, 'type': it.item_type, 'preview': masked_dict})
-    return render_template('vault.html', items=previews)
+    item_type = request.args.get('type') or ''
+    sort = request.args.get('sort', 'title')
+    if sort not in VAULT_SORTS:
+        sort = 'title'
+    try:
+        per_page = min(max(int(request.args.get('per_page', 50)), 1), 200)
+    except ValueError:
+        per_page = 50
+    q = VaultItem.query.filter_by(user_id=user_id)
+    if item_type:
+        q = q.filter_by(item_type=item_type)
+    columns, descending = VAULT_SORTS[sort]
+    page = keyset_page(q, columns, descending, per_page,
+                       after=request.args.get('after'), before=request.args.get('before'))
+    # only the rows on this page are decrypted and masked
+    return render_template('vault.html', items=build_previews(page.items), page=page,
+                           filters={'type': item_type, 'sort': sort, 'per_page': per_page},
+                           item_types=VAULT_ITEM_TYPES)
+
+
+@app.route('/vault/search')
+def vault_search():
+    user_id = current_user_id()
+    if not user_id:
+        return redirect(url_for('login'))
+    q = (request.args.get('q') or '').strip()
+    digests = query_digests(user_id, q)
+    if not digests:
+        return render_template('vault.html', items=[], query=q)
+    # indexed lookup on the blind index; only matching rows are decrypted
+    ids = SearchToken.matching_item_ids(user_id, digests)
+    items = (VaultItem.query.filter(VaultItem.user_id == user_id, VaultItem.id.in_(ids))
+             .order_by(VaultItem.title, VaultItem.id).all()) if ids else []
+    return render_template('vault.html', items=build_previews(items), query=q)
 
 
 @app.route('/vault/add', methods=['GET', 'POST'])
@@ -242,9 +448,9 @@ def add_item():
         item_type = request.form['item_type']
         title = request.form['title']
         data = {k: v for k, v in request.form.items() if k not in ('item_type', 'title')}
-        encrypted = encrypt_json(data)
-        it = VaultItem(user_id=user_id, item_type=item_type, title=title, encrypted_data=encrypted)
-        db.session.add(it); db.session.commit()
+        it = VaultItem(user_id=user_id, item_type=item_type, title=title)
+        save_item_data(it, data)
+        db.session.commit()
         return redirect(url_for('vault'))
     return render_template('add_item.html')
 
@@ -263,12 +469,12 @@ def vault_edit(item_id):
         data = {k: v for k, v in request.form.items() if k not in ('item_type', 'title')}
         it.item_type = item_type
         it.title = title
-        it.encrypted_data = encrypt_json(data)
+        save_item_data(it, data)
         db.session.commit()
         return redirect(url_for('vault'))
 
     # prepare fields for form prefill
-    data = decrypt_json(it.encrypted_data) or {}
+    data = read_item(it)
     return render_template('add_item.html', item=it, fields=data)
 
 
@@ -278,16 +484,10 @@ def view_item(item_id):
     it = VaultItem.query.get_or_404(item_id)
     if it.user_id != user_id:
         return 'Unauthorized', 403
-    data = decrypt_json(it.encrypted_data) or {}
-    proxy = DataProxy()
-    # masked mapping: field -> masked value
-    try:
-        from patterns.data_proxy import mask_preview_dict
-        masked_map = mask_preview_dict(data)
-    except Exception:
-        # fallback to string preview if helper missing
-        masked_map = {k: proxy._mask_value(v) if any(sub in (k or '').lower() for sub in proxy.SENSITIVE_SUBSTRINGS) else v for k, v in data.items()}
-    return render_template('view_item.html', item=it, data=data, masked=masked_map)
+    # masked mapping: field -> masked value, served from the preview snapshot
+    # so viewing never decrypts the secret fields themselves
+    masked_map = build_previews([it])[0]['preview']
+    return render_template('view_item.html', item=it, masked=masked_map)
 
 
 @app.route('/vault/delete/<int:item_id>')
@@ -296,19 +496,95 @@ def delete_item(item_id):
     it = VaultItem.query.get_or_404(item_id)
     if it.user_id != user_id:
         return 'Unauthorized', 403
+    unindex_item(it.id)
+    VaultField.remove_for_item(it.id)
+    item_cache.invalidate_item(it.id)
+    VaultTombstone.record(it)
     db.session.delete(it); db.session.commit()
     return redirect(url_for('vault'))
 
 
+@app.route('/vault/audit')
+def vault_audit():
+    user_id = current_user_id()
+    if not user_id:
+        return redirect(url_for('login'))
+    # answered from the password_audit index alone; nothing is decrypted
+    return render_template('audit.html', reused=PasswordAudit.reused(user_id),
+                           weak=PasswordAudit.weak(user_id), summary=PasswordAudit.summary(user_id),
+                           labels=SCORE_LABELS)
+
+
+@app.route('/vault/transfer')
+def vault_transfer():
+    if not current_user_id():
+        return redirect(url_for('login'))
+    return render_template('import_export.html')
+
+
+@app.route('/vault/import', methods=['POST'])
+def vault_import():
+    user_id = current_user_id()
+    if not user_id:
+        return redirect(url_for('login'))
+    upload = request.files.get('file')
+    fmt = request.form.get('format', 'auto')
+    if not upload or fmt not in IMPORT_FORMATS:
+        return render_template('import_export.html', error='Choose a file and a format.'), 400
+    try:
+        # the upload is parsed as a stream; rows are committed chunk by chunk
+        records = parse(upload.stream, fmt, upload.filename, request.form.get('passphrase'))
+        result = import_records(user_id, records, app.config['IMPORT_CHUNK_SIZE'],
+                                app.config['VAULT_STORAGE_FORMAT'],
+                                binary=app.config['PAYLOAD_FORMAT'] == 'binary')
+    except ImportFormatError as e:
+        db.session.rollback()
+        return render_template('import_export.html', error=f'Import failed: {e}'), 400
+    return render_template('import_export.html', result=result)
+
+
+@app.route('/vault/export', methods=['POST'])
+def vault_export():
+    user_id = current_user_id()
+    if not user_id:
+        return redirect(url_for('login'))
+    fmt = request.form.get('format', 'jsonl')
+    passphrase = request.form.get('passphrase') or None
+    if fmt not in EXPORT_FORMATS:
+        return render_template('import_export.html', error='Unknown export format.'), 400
+    if fmt == 'archive' and not passphrase:
+        return render_template('import_export.html', error='An archive needs a passphrase.'), 400
+    ext = {'csv': 'csv', 'jsonl': 'jsonl', 'archive': 'mypass'}[fmt]
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/octet-stream'
+    # streamed chunk by chunk; the vault is never held in memory as a whole
+    body = stream_with_context(export_vault(user_id, fmt, passphrase, app.config['IMPORT_CHUNK_SIZE']))
+    return Response(body, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=mypass-export.{ext}',
+                             'Cache-Control': 'no-store'})
+
+
 @app.route('/generate_password')
 def generate_password():
-    length = int(request.args.get('length', 16))
-    upper = request.args.get('upper', '1') in ('1', 'true', 'True')
-    lower = request.args.get('lower', '1') in ('1', 'true', 'True')
-    digits = request.args.get('digits', '1') in ('1', 'true', 'True')
-    symbols = request.args.get('symbols', '0') in ('1', 'true', 'True')
-    pwd = builder_generate_password(length=length, upper=upper, lower=lower, digits=digits, symbols=symbols)
-    return jsonify({'password': pwd})
+    def flag(name, default):
+        return request.args.get(name, default) in ('1', 'true', 'True')
+
+    def number(name, default, low, high):
+        try:
+            return min(max(int(request.args.get(name, default)), low), high)
+        except (TypeError, ValueError):
+            return default
+
+    # count > 1 lets the client prefetch a batch instead of one request per click
+    count = number('count', 1, 1, 100)
+    length = number('length', 16, 4, 128)
+    words = number('words', 6, 3, 20) if request.args.get('mode') == 'words' else 0
+    separator = (request.args.get('sep') or '-')[:3]
+    pwds = builder_generate_passwords(count, length=length, upper=flag('upper', '1'), lower=flag('lower', '1'),
+                                      digits=flag('digits', '1'), symbols=flag('symbols', '0'),
+                                      words=words, separator=separator)
+    resp = jsonify({'password': pwds[0], 'passwords': pwds})
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp
 
 
 @app.route('/notifications/clear', methods=['POST'])
@@ -317,7 +593,7 @@ def clear_notifications():
     if not user_id:
         return redirect(url_for('login'))
     try:
-        Notification.query.filter_by(user_id=user_id, is_read=False).update({'is_read': True})
+        Notification.mark_all_read(user_id)
         db.session.commit()
         flash('Notifications cleared.', 'success')
     except Exception:
@@ -326,6 +602,164 @@ def clear_notifications():
     return redirect(url_for('home'))
 
 
+@app.route('/api/notifications')
+def api_notifications():
+    user_id = current_user_id()
+    if not user_id:
+        return jsonify({'error': 'unauthorized'}), 401
+    try:
+        limit = min(max(int(request.args.get('limit', NOTIFICATIONS_PER_PAGE)), 1), 100)
+    except ValueError:
+        limit = NOTIFICATIONS_PER_PAGE
+    q = Notification.query.filter_by(user_id=user_id)
+    if request.args.get('unread', '1') != '0':
+        q = q.filter_by(is_read=False)
+    page = keyset_page(q, (Notification.id,), True, limit, after=request.args.get('cursor'))
+    return jsonify({'notifications': [n.to_dict() for n in page.items], 'next_cursor': page.next_cursor,
+                    'unread': Notification.unread_count(user_id)})
+
+
+def _sse(event: str, data, event_id: int = None) -> str:
+    head = f'id: {event_id}\n' if event_id is not None else ''
+    return f'{head}event: {event}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
+
+
+@app.route('/notifications/stream')
+def notification_stream():
+    """Server-Sent Events: new notifications and the unread count.
+
+    Polls the indexed "id > last seen" query every NOTIFY_POLL_INTERVAL
+    seconds and ends after NOTIFY_STREAM_MAX; EventSource reconnects on its
+    own and resumes from Last-Event-ID. Sends ``locked`` once the
+    server-side session is gone, so the page can go to the login screen.
+    """
+    user_id = current_user_id()
+    if not user_id:
+        return jsonify({'error': 'unauthorized'}), 401
+    sid = session.get('sid')
+    try:
+        last_id = int(request.headers.get('Last-Event-ID') or request.args.get('after') or 0)
+    except ValueError:
+        last_id = 0
+    if not last_id:
+        last_id = Notification.latest_id(user_id)
+    poll = app.config['NOTIFY_POLL_INTERVAL']
+    deadline = time.monotonic() + app.config['NOTIFY_STREAM_MAX']
+
+    def events(last_id):
+        unread = None
+        idle = 0.0
+        yield f'retry: {int(poll * 1000)}\n\n'
+        while time.monotonic() < deadline:
+            if sessions.get(sid) is None:
+                yield _sse('locked', {})
+                return
+            for note in Notification.since(user_id, last_id):
+                last_id = note.id
+                yield _sse('notification', note.to_dict(), note.id)
+                idle = 0.0
+            count = Notification.unread_count(user_id)
+            if count != unread:
+                unread = count
+                yield _sse('unread', {'count': count})
+                idle = 0.0
+            # end the read transaction so the next poll sees new commits
+            db.session.rollback()
+            if idle >= 15:
+                # comment line: keeps proxies from closing an idle stream
+                yield ': keep-alive\n\n'
+                idle = 0.0
+            time.sleep(poll)
+            idle += poll
+
+    resp = Response(stream_with_context(events(last_id)), mimetype='text/event-stream')
+    resp.headers['Cache-Control'] = 'no-store'
+    resp.headers['X-Accel-Buffering'] = 'no'
+    return resp
+
+
+# ------------------------------------------------------------------ JSON API v1
+# Items carry the masked preview only; secrets still go through
+# /vault/copy with unmask tokens. See utils/vault_sync.py for sequences and ETags.
+
+def _api_item(it, preview):
+    return {'id': it.id, 'type': it.item_type, 'title': it.title, 'revision': it.revision,
+            'preview': preview['preview']}
+
+
+def _api_limit(default, maximum):
+    try:
+        return min(max(int(request.args.get('limit', default)), 1), maximum)
+    except ValueError:
+        return default
+
+
+def _not_modified(etag):
+    resp = Response(status=304)
+    resp.set_etag(etag)
+    resp.headers['Cache-Control'] = 'private, no-cache'
+    return resp
+
+
+def _api_response(payload, etag):
+    resp = jsonify(payload)
+    resp.set_etag(etag)
+    # cacheable by the browser only, and always revalidated
+    resp.headers['Cache-Control'] = 'private, no-cache'
+    return resp
+
+
+@app.route('/api/v1/vault/items')
+def api_vault_items():
+    user_id = current_user_id()
+    if not user_id:
+        return jsonify({'error': 'unauthorized'}), 401
+    seq = User.current_change_seq(user_id)
+    etag = list_etag(user_id, seq)
+    if request.if_none_match.contains(etag):
+        return _not_modified(etag)
+    page = keyset_page(VaultItem.query.filter_by(user_id=user_id), (VaultItem.id,), False,
+                       _api_limit(50, 200), after=request.args.get('cursor'))
+    previews = build_previews(page.items)
+    return _api_response({'seq': seq, 'items': [_api_item(it, p) for it, p in zip(page.items, previews)],
+                          'next_cursor': page.next_cursor}, etag)
+
+
+@app.route('/api/v1/vault/items/<int:item_id>')
+def api_vault_item(item_id):
+    user_id = current_user_id()
+    if not user_id:
+        return jsonify({'error': 'unauthorized'}), 401
+    it = VaultItem.query.get(item_id)
+    if it is None or it.user_id != user_id:
+        return jsonify({'error': 'not_found'}), 404
+    etag = item_etag(it)
+    if request.if_none_match.contains(etag):
+        return _not_modified(etag)
+    return _api_response(_api_item(it, build_previews([it])[0]), etag)
+
+
+@app.route('/api/v1/vault/changes')
+def api_vault_changes():
+    user_id = current_user_id()
+    if not user_id:
+        return jsonify({'error': 'unauthorized'}), 401
+    try:
+        since = max(int(request.args.get('since', 0)), 0)
+    except ValueError:
+        return jsonify({'error': 'invalid_since'}), 400
+    etag = list_etag(user_id, User.current_change_seq(user_id))
+    if request.if_none_match.contains(etag):
+        return _not_modified(etag)
+    delta = changes_since(user_id, since, _api_limit(100, 500))
+    puts = [obj for _, obj in delta.changes if isinstance(obj, VaultItem)]
+    previews = dict(zip((it.id for it in puts), build_previews(puts)))
+    changes = [{'seq': rev, 'op': 'put', 'item': _api_item(obj, previews[obj.id])}
+               if isinstance(obj, VaultItem) else {'seq': rev, 'op': 'delete', 'id': obj.item_id}
+               for rev, obj in delta.changes]
+    return _api_response({'seq': delta.seq, 'more': delta.more, 'changes': changes}, etag)
+
+
 @app.route('/vault/copy/<int:item_id>/<path:field>')
 def vault_copy(item_id, field):
     user_id = current_user_id()
@@ -334,36 +768,30 @@ def vault_copy(item_id, field):
     it = VaultItem.query.get_or_404(item_id)
     if it.user_id != user_id:
         return jsonify({'value': None}), 403
-    data = decrypt_json(it.encrypted_data) or {}
-    # field may be url-encoded; match case-insensitively
-    val = None
-    for k, v in data.items():
-        if str(k).lower() == str(field).lower():
-            val = v
-            break
-
     # action: 'copy' or 'unmask' (default to copy)
     action = request.args.get('action', 'copy')
-    try:
-        us = UserSession()
-    except Exception:
-        us = None
 
     if action == 'unmask':
         # require a short-lived server-issued token for security
         token = request.args.get('token') or request.headers.get('X-Unmask-Token')
         if not token:
             return jsonify({'value': None, 'error': 'token_required'}), 400
-        ut = UnmaskToken.validate(token, user_id=user_id, item_id=item_id, field=field)
-        if not ut:
+        if app.config['UNMASK_TOKEN_MODE'] == 'db':
+            ut = UnmaskToken.validate(token, user_id=user_id, item_id=item_id, field=field)
+            if not ut:
+                return jsonify({'value': None, 'error': 'invalid_or_expired_token'}), 403
+            # mark token used
+            ut.used = True
+            db.session.commit()
+        elif not validate_signed(token, user_id=user_id, item_id=item_id, field=field):
             return jsonify({'value': None, 'error': 'invalid_or_expired_token'}), 403
-        # mark token used
-        ut.used = True
-        db.session.commit()
-        # optional: record server-side unmask quota in singleton
-        if us:
-            us.record_unmask()
+        # record server-side unmask quota for this session
+        if session.get('sid'):
+            sessions.record_unmask(session['sid'])
 
+    # only the requested field is decrypted (field-level items); the name
+    # may be url-encoded and is matched case-insensitively
+    val = read_field(it, field)
     return jsonify({'value': val})
 
 
@@ -379,30 +807,47 @@ def request_unmask_token(item_id, field):
     if it.user_id != user_id:
         return jsonify({'error': 'unauthorized'}), 403
     # issue token (short TTL)
-    ut = UnmaskToken.issue(user_id=user_id, item_id=item_id, field=field, ttl_seconds=30)
-    return jsonify({'token': ut.token, 'expires_at': ut.expires_at.isoformat()})
+    if app.config['UNMASK_TOKEN_MODE'] == 'db':
+        ut = UnmaskToken.issue(user_id=user_id, item_id=item_id, field=field, ttl_seconds=30)
+        token, expires_at = ut.token, ut.expires_at
+    else:
+        token, expires_at = issue_signed(user_id=user_id, item_id=item_id, field=field, ttl_seconds=30)
+    return jsonify({'token': token, 'expires_at': expires_at.isoformat()})
 
 
 def current_user_id():
-    """Resolve current user id using the server-side `UserSession` first,
-    falling back to the Flask `session` cookie. This makes the singleton the
-    authoritative source when initialized.
+    """Resolve current user id from the server-side session validated in
+    `enforce_session_timeout`, falling back to the Flask `session` cookie.
     """
-    try:
-        us = UserSession()
-        uid = us.get_user_id()
-        if uid:
-            return uid
-    except Exception:
-        pass
+    uid = g.get('session_user_id')
+    if uid:
+        return uid
     return session.get('user_id')
 
 
 with app.app_context():
     os.makedirs(os.path.join(basedir, 'database'), exist_ok=True)
+    apply_sqlite_profile(db.engine, app.config['DB_PROFILE'], app.config['SQLITE_PRAGMAS'])
+    instrument_engine(db.engine)
     db.create_all()
     load_key()
+    # bring existing databases up to date (indexes, backfills)
+    run_migrations()
+
+scheduler = build_scheduler(app)
+scheduler.add_job('session-sweep', sessions.sweep, 30)
+
+
+def start_background_jobs():
+    # explicit entry points only: one scheduler per deployment, not per import
+    if app.config['EXPIRY_SCHEDULER'] == 'thread':
+        scheduler.start()
+
 
 if __name__ == '__main__':
+    # the debug reloader imports this module in a watcher process and again
+    # in the serving child (WERKZEUG_RUN_MAIN=true); only the child runs jobs
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_jobs()
     app.run(debug=True)
 
@@ -0,0 +1 @@
+"""Micro-benchmarks and route load tests for MyPass. Run a module with ``python -m benchmarks.<name>``."""
@@ -0,0 +1,68 @@
+"""Inline vs pooled bulk decryption.
+
+    python -m benchmarks.bulk_decrypt --sizes 200,1000,2000,5000,20000 --workers 4
+
+Prints the time for each batch size on the inline path and on thread /
+process pools. The size where the process pool starts winning is the value
+to use for ``utils.crypto.BULK_THRESHOLD`` on that hardware; it only pays
+off with more than one core, since Fernet decryption holds the GIL.
+"""
+import argparse
+import json
+import os
+import time
+
+from cryptography.fernet import Fernet
+
+from utils.crypto import BULK_CHUNK_SIZE, BulkDecryptor
+
+
+def _sample_tokens(key: bytes, n: int) -> list:
+    f = Fernet(key)
+    item = {'username': 'user@example.com', 'password': 'S3cure-Passw0rd!', 'url': 'https://example.com/login',
+            'notes': 'lorem ipsum ' * 10}
+    return [f.encrypt(json.dumps(dict(item, id=i)).encode('utf-8')).decode('utf-8') for i in range(n)]
+
+
+def _time(decryptor: BulkDecryptor, tokens: list, key: bytes, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = decryptor.decrypt(tokens, key=key)
+        best = min(best, time.perf_counter() - start)
+        assert len(out) == len(tokens)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='200,1000,2000,5000,20000')
+    parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument('--chunk-size', type=int, default=BULK_CHUNK_SIZE)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    key = Fernet.generate_key()
+    sizes = [int(s) for s in args.sizes.split(',')]
+    tokens = _sample_tokens(key, max(sizes))
+    engines = {
+        'inline': BulkDecryptor('off'),
+        'thread': BulkDecryptor('thread', args.workers, threshold=0, chunk_size=args.chunk_size),
+        'process': BulkDecryptor('process', args.workers, threshold=0, chunk_size=args.chunk_size),
+    }
+    # warm the pools so start-up cost isn't counted against the first size
+    for engine in engines.values():
+        engine.decrypt(tokens[:args.chunk_size * 2], key=key)
+
+    print(f'cpus={os.cpu_count()} workers={args.workers} chunk={args.chunk_size}')
+    print(f'{"items":>8} {"inline ms":>10} {"thread ms":>10} {"process ms":>11} {"speedup":>8}')
+    for n in sizes:
+        t = {name: _time(engine, tokens[:n], key, args.repeat) for name, engine in engines.items()}
+        speedup = t['inline'] / t['process'] if t['process'] else 0.0
+        print(f'{n:>8} {t["inline"] * 1000:>10.1f} {t["thread"] * 1000:>10.1f} {t["process"] * 1000:>11.1f} {speedup:>7.2f}x')
+    for engine in engines.values():
+        engine.shutdown()
+
+
+if __name__ == '__main__':
+    main()
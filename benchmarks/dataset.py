@@ -0,0 +1,49 @@
+"""Deterministic synthetic vault items shared by the benchmarks."""
+import random
+import string
+from datetime import date, timedelta
+from typing import Dict, Tuple
+
+SITES = ('gmail', 'github', 'chase', 'amazon', 'netflix', 'spotify', 'dropbox', 'slack',
+         'paypal', 'twitter', 'linkedin', 'reddit', 'zoom', 'notion', 'figma', 'stripe')
+WORDS = ('alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel', 'india',
+         'juliet', 'kilo', 'lima', 'mike', 'november', 'oscar', 'papa', 'quebec', 'romeo')
+
+
+def _secret(rng: random.Random, n: int) -> str:
+    alphabet = string.ascii_letters + string.digits + '!@#$%^&*'
+    return ''.join(rng.choice(alphabet) for _ in range(n))
+
+
+def _expiry(rng: random.Random, month_only: bool = False) -> str:
+    # spread between ~2 years ago and ~5 years ahead so some are expired/expiring
+    d = date.today() + timedelta(days=rng.randint(-700, 1800))
+    return d.strftime('%Y-%m') if month_only else d.isoformat()
+
+
+def sample_item(rng: random.Random, i: int) -> Tuple[str, str, Dict[str, str]]:
+    """Return (item_type, title, fields) shaped like the add-item form."""
+    kind = rng.choices(('Login', 'CreditCard', 'Identity', 'SecureNote'), weights=(70, 10, 5, 15))[0]
+    site = rng.choice(SITES)
+    if kind == 'Login':
+        return kind, f'{site.title()} {i}', {
+            'username': f'{rng.choice(WORDS)}.{rng.choice(WORDS)}{rng.randint(1, 999)}@example.com',
+            'password': _secret(rng, rng.randint(12, 24)),
+            'url': f'https://{site}.com/login',
+        }
+    if kind == 'CreditCard':
+        return kind, f'{site.title()} card {i}', {
+            'card_number': ''.join(rng.choice(string.digits) for _ in range(16)),
+            'cvv': ''.join(rng.choice(string.digits) for _ in range(3)),
+            'expiry': _expiry(rng, month_only=True),
+        }
+    if kind == 'Identity':
+        return kind, f'Identity {i}', {
+            'ssn': f'{rng.randint(100, 999)}-{rng.randint(10, 99)}-{rng.randint(1000, 9999)}',
+            'passport': _secret(rng, 9).upper(),
+            'passport_expiry': _expiry(rng),
+            'license': _secret(rng, 8).upper(),
+            'license_expiry': _expiry(rng),
+        }
+    note = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(10, 120)))
+    return kind, f'Note {i}', {'notes': note}
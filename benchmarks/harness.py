@@ -0,0 +1,175 @@
+"""Shared pieces of the route benchmarks: app loading, request plans,
+latency statistics and JSON results.
+
+Seeded databases (``benchmarks.seed``) give every user the email
+``bench<n>@example.com`` and the password ``BENCH_PASSWORD``.
+"""
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+BENCH_PASSWORD = 'Bench-Passw0rd!'
+DEFAULT_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'database', 'bench.db')
+
+# one field per item type that the copy / unmask routes can ask for
+COPY_FIELDS = {'Login': 'username', 'CreditCard': 'card_number', 'Identity': 'passport', 'SecureNote': 'notes'}
+
+
+def bench_email(n: int) -> str:
+    return f'bench{n}@example.com'
+
+
+def load_app(db_path: str, **config):
+    """Import the Flask app against ``db_path``; ``config`` sets extra MYPASS_*
+    variables. Must run before anything else imports ``app``."""
+    os.environ['MYPASS_DATABASE_URL'] = 'sqlite:///' + os.path.abspath(db_path)
+    for key, value in config.items():
+        os.environ[key] = str(value)
+    import app as mypass
+    return mypass
+
+
+# ------------------------------------------------------------------ plans
+
+class UserPlan(NamedTuple):
+    email: str
+    items: List[Tuple[int, str]]     # (item id, field to copy)
+
+
+def build_plans(mypass, users: int, items_per_user: int = 20, seed: int = 1) -> List[UserPlan]:
+    """Sample ``users`` seeded users and some of their items."""
+    from models.user import User
+    from models.vault_item import VaultItem
+    rng = random.Random(seed)
+    plans = []
+    with mypass.app.app_context():
+        rows = (mypass.db.session.query(User.id, User.email)
+                .filter(User.email.like('bench%@example.com')).order_by(User.id).all())
+        if not rows:
+            raise SystemExit('no benchmark users in this database; run `python -m benchmarks.seed` first')
+        for uid, email in rng.sample(rows, min(users, len(rows))):
+            ids = (mypass.db.session.query(VaultItem.id, VaultItem.item_type)
+                   .filter(VaultItem.user_id == uid).order_by(VaultItem.id).all())
+            picked = rng.sample(ids, min(items_per_user, len(ids)))
+            plans.append(UserPlan(email, [(i, COPY_FIELDS.get(t, 'username')) for i, t in picked]))
+    return plans
+
+
+def visit(plan: UserPlan, rng: random.Random, views: int = 3) -> Iterator[Tuple[str, str, str]]:
+    """(route label, method, path) of one user session, login first."""
+    yield '/login', 'POST', '/login'
+    yield '/', 'GET', '/'
+    yield '/vault', 'GET', '/vault'
+    for item_id, field in rng.sample(plan.items, min(views, len(plan.items))):
+        yield '/vault/view/<id>', 'GET', f'/vault/view/{item_id}'
+        yield '/vault/copy/<id>/<field>', 'GET', f'/vault/copy/{item_id}/{field}?action=copy'
+        yield '/vault/request_unmask_token/<id>/<field>', 'POST', f'/vault/request_unmask_token/{item_id}/{field}'
+    yield '/generate_password', 'GET', '/generate_password'
+
+
+def login_form(plan: UserPlan) -> Dict[str, str]:
+    return {'email': plan.email, 'password': BENCH_PASSWORD}
+
+
+# ------------------------------------------------------------------ stats
+
+class Recorder:
+    """Latencies (seconds) and error counts per route label."""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    def add(self, route: str, elapsed: float, ok: bool = True) -> None:
+        self.samples[route].append(elapsed)
+        if not ok:
+            self.errors[route] += 1
+
+    def merge(self, other: 'Recorder') -> None:
+        for route, values in other.samples.items():
+            self.samples[route].extend(values)
+        for route, n in other.errors.items():
+            self.errors[route] += n
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    # nearest-rank on an already sorted list
+    if not sorted_values:
+        return 0.0
+    k = math.ceil(p / 100.0 * len(sorted_values)) - 1
+    return sorted_values[max(0, min(k, len(sorted_values) - 1))]
+
+
+def summarize(recorder: Recorder, wall: float) -> Dict[str, dict]:
+    """Per-route count, errors, p50/p95/p99/mean/max (ms) and requests/s."""
+    out = {}
+    for route in sorted(recorder.samples):
+        values = sorted(recorder.samples[route])
+        out[route] = {
+            'count': len(values),
+            'errors': recorder.errors.get(route, 0),
+            'p50_ms': percentile(values, 50) * 1000,
+            'p95_ms': percentile(values, 95) * 1000,
+            'p99_ms': percentile(values, 99) * 1000,
+            'mean_ms': sum(values) / len(values) * 1000,
+            'max_ms': values[-1] * 1000,
+            'rps': len(values) / wall if wall else 0.0,
+        }
+    total = sum(len(v) for v in recorder.samples.values())
+    out['ALL'] = {'count': total, 'errors': sum(recorder.errors.values()), 'rps': total / wall if wall else 0.0}
+    return out
+
+
+def print_report(summary: Dict[str, dict], baseline: Optional[Dict[str, dict]] = None) -> None:
+    header = f'{"route":<42} {"count":>7} {"err":>5} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"req/s":>9}'
+    if baseline:
+        header += f' {"p50 vs base":>12}'
+    print(header)
+    for route, s in summary.items():
+        if route == 'ALL':
+            continue
+        line = (f'{route:<42} {s["count"]:>7} {s["errors"]:>5} {s["p50_ms"]:>9.2f} {s["p95_ms"]:>9.2f} '
+                f'{s["p99_ms"]:>9.2f} {s["rps"]:>9.1f}')
+        base = (baseline or {}).get(route)
+        if base and base.get('p50_ms'):
+            line += f' {(s["p50_ms"] / base["p50_ms"] - 1) * 100:>+11.1f}%'
+        print(line)
+    total = summary['ALL']
+    print(f'{"ALL":<42} {total["count"]:>7} {total["errors"]:>5} {"":>9} {"":>9} {"":>9} {total["rps"]:>9.1f}')
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(path: str, kind: str, args: dict, summary: Dict[str, dict]) -> None:
+    """Write one run as JSON (with the git revision, to compare commits)."""
+    doc = {
+        'kind': kind,
+        'revision': _git_revision(),
+        'created_at': datetime.utcnow().isoformat() + 'Z',
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'args': args,
+        'routes': summary,
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(doc, f, indent=2, sort_keys=True)
+
+
+def load_baseline(path: Optional[str]) -> Optional[Dict[str, dict]]:
+    if not path:
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)['routes']
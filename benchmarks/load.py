@@ -0,0 +1,149 @@
+"""Concurrent HTTP load against a local MyPass server.
+
+    python -m benchmarks.load --db database/bench.db --concurrency 8 --duration 30 --json load.json
+    python -m benchmarks.load --url http://127.0.0.1:5000 --db database/bench.db --duration 30
+
+Without ``--url``, a threaded server for the seeded database is started
+in a separate process, so the clients don't compete with it for the GIL.
+``--concurrency`` client threads then replay user sessions (same route
+mix as ``benchmarks.routes``, each with its own cookie) for ``--duration``
+seconds. The report gives p50/p95/p99 and throughput per route, measured
+on the client, connection setup included. ``--json`` and ``--compare``
+work like in ``benchmarks.routes``.
+"""
+import argparse
+import http.cookiejar
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from .harness import (DEFAULT_DB, Recorder, build_plans, load_app, load_baseline, login_form, print_report,
+                      save_results, summarize, visit)
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # measure each route on its own instead of following redirects
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+def _request(opener, url: str, method: str, data: dict = None) -> int:
+    body = urllib.parse.urlencode(data).encode() if data is not None else (b'' if method == 'POST' else None)
+    req = urllib.request.Request(url, data=body, method=method)
+    try:
+        with opener.open(req, timeout=60) as resp:
+            resp.read()
+            return resp.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        return e.code
+
+
+def _client(base: str, plans, views: int, deadline: float, seed: int, recorder: Recorder) -> None:
+    rng = random.Random(seed)
+    while time.monotonic() < deadline:
+        plan = rng.choice(plans)
+        opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+                                             _NoRedirect)
+        for route, method, path in visit(plan, rng, views):
+            if time.monotonic() >= deadline:
+                return
+            start = time.perf_counter()
+            try:
+                status = _request(opener, base + path, method, login_form(plan) if route == '/login' else None)
+            except OSError:
+                status = 599
+            recorder.add(route, time.perf_counter() - start, status < 400)
+
+
+def _wait_for_port(host: str, port: int, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit(f'server on {host}:{port} did not come up')
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def serve(db: str, port: int) -> None:
+    from werkzeug.serving import make_server
+    # one access log line per request would cost more than some routes
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    mypass = load_app(db)
+    make_server('127.0.0.1', port, mypass.app, threaded=True).serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=DEFAULT_DB)
+    parser.add_argument('--url', help='target an already running server instead of starting one')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds')
+    parser.add_argument('--users', type=int, default=50, help='seeded users to sample')
+    parser.add_argument('--views', type=int, default=3, help='items viewed/copied per session')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='save results to this file')
+    parser.add_argument('--compare', help='earlier --json result to compare against')
+    parser.add_argument('--serve', type=int, metavar='PORT', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.db, args.serve)
+        return
+
+    # the plans come straight from the database file
+    plans = build_plans(load_app(args.db), args.users, seed=args.seed)
+    baseline = load_baseline(args.compare)
+    server = None
+    base = (args.url or '').rstrip('/')
+    if not base:
+        port = _free_port()
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        server = subprocess.Popen([sys.executable, '-m', 'benchmarks.load', '--db', os.path.abspath(args.db),
+                                   '--serve', str(port)], cwd=root)
+        _wait_for_port('127.0.0.1', port)
+        base = f'http://127.0.0.1:{port}'
+    try:
+        recorders = [Recorder() for _ in range(args.concurrency)]
+        deadline = time.monotonic() + args.duration
+        threads = [threading.Thread(target=_client, args=(base, plans, args.views, deadline, args.seed + i, r))
+                   for i, r in enumerate(recorders)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - start
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(10)
+
+    recorder = Recorder()
+    for r in recorders:
+        recorder.merge(r)
+    summary = summarize(recorder, wall)
+    print(f'{args.concurrency} clients for {wall:.1f}s against {base}')
+    print_report(summary, baseline)
+    if args.json:
+        save_results(args.json, 'load', vars(args), summary)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Password generation throughput: per-character ``secrets.choice`` vs batches.
+
+    python -m benchmarks.password_gen --count 20000 --length 16
+
+``legacy`` is the previous builder (one ``secrets.choice`` call per
+character, then a shuffle); ``build`` is one password per call through the
+current builder and ``build_many`` a whole batch from one entropy buffer.
+"""
+import argparse
+import secrets
+import string
+import time
+
+from patterns.password_builder import SYMBOLS, PasswordBuilder
+
+
+def legacy_build(length: int, upper: bool, lower: bool, digits: bool, symbols: bool) -> str:
+    pool = ''
+    required = []
+    if lower:
+        pool += string.ascii_lowercase
+        required.append(secrets.choice(string.ascii_lowercase))
+    if upper:
+        pool += string.ascii_uppercase
+        required.append(secrets.choice(string.ascii_uppercase))
+    if digits:
+        pool += string.digits
+        required.append(secrets.choice(string.digits))
+    if symbols:
+        pool += SYMBOLS
+        required.append(secrets.choice(SYMBOLS))
+    if not pool:
+        pool = string.ascii_letters + string.digits
+    chars = required + [secrets.choice(pool) for _ in range(length - len(required))]
+    secrets.SystemRandom().shuffle(chars)
+    return ''.join(chars)
+
+
+def _rate(fn, count: int) -> float:
+    start = time.perf_counter()
+    fn(count)
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=20000)
+    parser.add_argument('--length', type=int, default=16)
+    parser.add_argument('--symbols', action='store_true')
+    parser.add_argument('--words', type=int, default=6)
+    args = parser.parse_args()
+
+    builder = PasswordBuilder().set_length(args.length).with_symbols(args.symbols)
+    phrases = PasswordBuilder().with_words(args.words)
+    rows = [
+        ('legacy', _rate(lambda n: [legacy_build(args.length, True, True, True, args.symbols) for _ in range(n)],
+                         args.count)),
+        ('build', _rate(lambda n: [builder.build() for _ in range(n)], args.count)),
+        ('build_many', _rate(builder.build_many, args.count)),
+        (f'words x{args.words}', _rate(phrases.build_many, args.count)),
+    ]
+    print(f'{args.count} passwords, length={args.length}, symbols={args.symbols}, '
+          f'entropy={builder.entropy_bits():.0f} bits (words: {phrases.entropy_bits():.0f} bits)')
+    print(f'{"builder":<12} {"per sec":>10} {"speedup":>8}')
+    for name, rate in rows:
+        print(f'{name:<12} {rate:>10.0f} {rate / rows[0][1]:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Per-route latency through the Flask test client (no network, one thread).
+
+    python -m benchmarks.seed --db database/bench.db
+    python -m benchmarks.routes --db database/bench.db --sessions 200 --json routes.json
+    python -m benchmarks.routes --db database/bench.db --compare routes.json
+
+Every session logs in as a sampled seeded user, then opens `/` and
+`/vault`, views, copies and requests unmask tokens for a few items, and
+generates a password. The report gives p50/p95/p99 and throughput per
+route. ``--json`` saves the run (with the git revision) and ``--compare``
+prints the p50 change against a saved run.
+"""
+import argparse
+import random
+import time
+
+from .harness import (DEFAULT_DB, Recorder, build_plans, load_app, load_baseline, login_form, print_report,
+                      save_results, summarize, visit)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=DEFAULT_DB)
+    parser.add_argument('--users', type=int, default=20, help='seeded users to sample')
+    parser.add_argument('--sessions', type=int, default=100)
+    parser.add_argument('--views', type=int, default=3, help='items viewed/copied per session')
+    parser.add_argument('--warmup', type=int, default=5, help='sessions run before measuring')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='save results to this file')
+    parser.add_argument('--compare', help='earlier --json result to compare against')
+    args = parser.parse_args()
+
+    mypass = load_app(args.db)
+    plans = build_plans(mypass, args.users, seed=args.seed)
+    baseline = load_baseline(args.compare)
+    rng = random.Random(args.seed)
+    recorder = Recorder()
+
+    def run_session(plan, record: bool):
+        client = mypass.app.test_client()
+        for route, method, path in visit(plan, rng, args.views):
+            start = time.perf_counter()
+            if method == 'POST' and route == '/login':
+                resp = client.post(path, data=login_form(plan))
+            else:
+                resp = client.open(path, method=method)
+            elapsed = time.perf_counter() - start
+            if record:
+                recorder.add(route, elapsed, resp.status_code < 400)
+
+    for i in range(args.warmup):
+        run_session(plans[i % len(plans)], record=False)
+    start = time.perf_counter()
+    for i in range(args.sessions):
+        run_session(plans[i % len(plans)], record=True)
+    wall = time.perf_counter() - start
+
+    summary = summarize(recorder, wall)
+    print(f'{args.sessions} sessions over {len(plans)} users in {wall:.1f}s (test client, 1 thread)')
+    print_report(summary, baseline)
+    if args.json:
+        save_results(args.json, 'routes', vars(args), summary)
+
+
+if __name__ == '__main__':
+    main()
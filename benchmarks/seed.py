@@ -0,0 +1,80 @@
+"""Build a synthetic MyPass database for the route benchmarks.
+
+    python -m benchmarks.seed --db database/bench.db --users 200 --items 1000-5000
+
+Creates ``--users`` accounts (``bench<n>@example.com``, password
+``harness.BENCH_PASSWORD``) with a random number of vault items each, drawn
+from ``benchmarks.dataset``. The items have realistic expiry fields, some
+already expired. They are written through the bulk import path, so
+previews, the search and expiry indexes and the password audit are all
+built. Finally the expiry scan runs once to create notifications.
+
+All accounts share one precomputed password hash, because hashing every
+account with the real KDF would take longer than the rest of the seeding.
+At about 1,000 items/s per core, the full 10k users x 1-5k items takes
+hours. Use ``--users`` and ``--items`` to scale down.
+"""
+import argparse
+import os
+import random
+import time
+
+from .dataset import sample_item
+from .harness import BENCH_PASSWORD, DEFAULT_DB, bench_email, load_app
+
+
+def _records(rng: random.Random, n: int):
+    for i in range(n):
+        kind, title, fields = sample_item(rng, i)
+        yield {'item_type': kind, 'title': title, 'fields': fields}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=DEFAULT_DB)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--items', default='50-200', help='items per user, "min-max" or a single number')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--chunk', type=int, default=1000)
+    parser.add_argument('--append', action='store_true', help='add users to an existing database')
+    args = parser.parse_args()
+
+    low, _, high = args.items.partition('-')
+    low, high = int(low), int(high or low)
+    if os.path.exists(args.db) and not args.append:
+        raise SystemExit(f'{args.db} exists; delete it or pass --append')
+
+    mypass = load_app(args.db)
+    from models import db
+    from models.user import User
+    from utils.envelope import ensure_user_key
+    from utils.jobs import notify_expiries
+    from utils.vault_io import import_records
+
+    rng = random.Random(args.seed)
+    app = mypass.app
+    fmt = app.config['VAULT_STORAGE_FORMAT']
+    binary = app.config['PAYLOAD_FORMAT'] == 'binary'
+    start = time.perf_counter()
+    total = 0
+    with app.app_context():
+        first = User.query.filter(User.email.like('bench%@example.com')).count()
+        password_hash = mypass.hasher.hash(BENCH_PASSWORD)
+        for n in range(first, first + args.users):
+            user = User(email=bench_email(n), password_hash=password_hash,
+                        sec_q1='q1', sec_a1='a1', sec_q2='q2', sec_a2='a2', sec_q3='q3', sec_a3='a3')
+            db.session.add(user)
+            db.session.flush()
+            ensure_user_key(user)
+            db.session.commit()
+            result = import_records(user.id, _records(rng, rng.randint(low, high)), args.chunk, fmt, binary)
+            total += result.imported
+            elapsed = time.perf_counter() - start
+            print(f'user {n + 1 - first}/{args.users}: {total} items, {total / elapsed:.0f} items/s', flush=True)
+        notes = notify_expiries()
+    print(f'{args.users} users, {total} items, {notes} notifications in {time.perf_counter() - start:.1f}s '
+          f'-> {args.db}')
+
+
+if __name__ == '__main__':
+    main()
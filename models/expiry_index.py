@@ -0,0 +1,82 @@
+from collections import defaultdict
+
+from . import db
+from .vault_item import VaultItem
+from utils.vault_storage import read_items
+from utils.expiry import extract_expiry_fields
+
+
+class ExpiryIndex(db.Model):
+    """Plaintext copy of the expiry dates stored inside encrypted vault items.
+
+    Rows are rewritten whenever an item is saved so that expiry checks can
+    run as a single range query without decrypting anything.
+    """
+    __tablename__ = 'expiry_index'
+    id = db.Column(db.Integer, primary_key=True)
+    item_id = db.Column(db.Integer, nullable=False, index=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    field = db.Column(db.String(128), nullable=False)
+    expires_on = db.Column(db.DateTime, nullable=False)
+    display_type = db.Column(db.String(100))
+    # last state notified ('soon' / 'expired'), so scans skip reported rows;
+    # rewriting an item's rows resets it
+    notified_state = db.Column(db.String(16), nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_expiry_index_user_expires', 'user_id', 'expires_on'),
+        db.Index('ix_expiry_index_state_expires', 'notified_state', 'expires_on'),
+    )
+
+    @staticmethod
+    def rows_for_item(item, data: dict) -> list:
+        """Index rows for ``item`` as plain dicts (for bulk inserts)."""
+        return [{'item_id': item.id, 'user_id': item.user_id, 'field': field,
+                 'expires_on': expires_on, 'display_type': display_type}
+                for field, expires_on, display_type in extract_expiry_fields(item.item_type, data)]
+
+    @staticmethod
+    def replace_for_item(item, data: dict) -> None:
+        """Stage index rows for ``item`` (caller commits)."""
+        ExpiryIndex.remove_for_item(item.id)
+        rows = ExpiryIndex.rows_for_item(item, data)
+        # Core insert of the listed columns only: the backfill runs from
+        # migration 1, before later migrations add columns to this table
+        if rows:
+            db.session.execute(ExpiryIndex.__table__.insert(), rows)
+
+    @staticmethod
+    def mark_notified(pairs) -> None:
+        """Record the reported state of (row id, state) pairs (caller commits)."""
+        by_state = defaultdict(list)
+        for row_id, state in pairs:
+            by_state[state].append(row_id)
+        for state, ids in by_state.items():
+            db.session.execute(db.update(ExpiryIndex).where(ExpiryIndex.id.in_(ids))
+                               .values(notified_state=state))
+
+    @staticmethod
+    def remove_for_item(item_id: int) -> None:
+        ExpiryIndex.query.filter_by(item_id=item_id).delete()
+
+    @staticmethod
+    def backfill(chunk_size: int = 500) -> int:
+        """Index every existing vault item; used once when the table is created."""
+        count = 0
+        last_id = 0
+        while True:
+            # explicit columns: this runs from migrations, possibly before
+            # later migrations have added the model's newer columns
+            items = (db.session.query(VaultItem.id, VaultItem.user_id, VaultItem.item_type,
+                                      VaultItem.title, VaultItem.encrypted_data)
+                     .filter(VaultItem.id > last_id)
+                     .order_by(VaultItem.id).limit(chunk_size).all())
+            if not items:
+                break
+            payloads = read_items(items)
+            for it, data in zip(items, payloads):
+                ExpiryIndex.replace_for_item(it, data or {})
+            db.session.commit()
+            count += len(items)
+            last_id = items[-1].id
+        return count
@@ -0,0 +1,20 @@
+from datetime import datetime
+
+from . import db
+
+
+class JobCheckpoint(db.Model):
+    """Progress of a resumable batch job (e.g. re-encryption).
+
+    ``last_id`` is the highest row id fully processed; it is updated in the
+    same transaction as the rows of each chunk, so after a crash the job
+    resumes exactly where its last commit left off.
+    """
+    __tablename__ = 'job_checkpoints'
+    name = db.Column(db.String(64), primary_key=True)
+    params = db.Column(db.Text, nullable=False, default='')
+    last_id = db.Column(db.Integer, nullable=False, default=0)
+    processed = db.Column(db.Integer, nullable=False, default=0)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
@@ -1,4 +1,5 @@
 from . import db
+from .user import User
 from datetime import datetime
 
 class Notification(db.Model):
@@ -7,3 +8,58 @@ class Notification(db.Model):
     content = db.Column(db.Text)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     is_read = db.Column(db.Boolean, default=False)
+
+    __table_args__ = (
+        db.Index('ix_notification_user_read_ts', 'user_id', 'is_read', 'timestamp'),
+        # newest-first pages and "newer than" polls walk this one
+        db.Index('ix_notification_user_read_id', 'user_id', 'is_read', 'id'),
+    )
+
+    def to_dict(self) -> dict:
+        return {'id': self.id, 'content': self.content, 'is_read': bool(self.is_read),
+                'timestamp': self.timestamp.isoformat() if self.timestamp else None}
+
+    # The unread count is cached on User.unread_notifications. Every write
+    # goes through these helpers so the counter moves in the same transaction.
+
+    @staticmethod
+    def add_for_user(user_id: int, messages) -> int:
+        """Stage notifications for one user (caller commits)."""
+        rows = [{'user_id': user_id, 'content': m} for m in messages]
+        if not rows:
+            return 0
+        db.session.execute(db.insert(Notification), rows)
+        db.session.execute(db.update(User).where(User.id == user_id)
+                           .values(unread_notifications=User.unread_notifications + len(rows)))
+        return len(rows)
+
+    @staticmethod
+    def mark_all_read(user_id: int) -> int:
+        """Mark every unread notification read (caller commits)."""
+        count = Notification.query.filter_by(user_id=user_id, is_read=False).update({'is_read': True})
+        db.session.execute(db.update(User).where(User.id == user_id).values(unread_notifications=0))
+        return count
+
+    @staticmethod
+    def unread_count(user_id: int) -> int:
+        # primary key lookup instead of COUNT(*) over the notifications
+        return db.session.query(User.unread_notifications).filter(User.id == user_id).scalar() or 0
+
+    @staticmethod
+    def latest_id(user_id: int) -> int:
+        return db.session.query(db.func.max(Notification.id)).filter(Notification.user_id == user_id).scalar() or 0
+
+    @staticmethod
+    def since(user_id: int, last_id: int, limit: int = 50) -> list:
+        """Notifications newer than ``last_id``, oldest first (for push)."""
+        return (Notification.query.filter(Notification.user_id == user_id, Notification.id > last_id)
+                .order_by(Notification.id).limit(limit).all())
+
+    @staticmethod
+    def recount(user_id: int = None) -> None:
+        """Rebuild the cached unread counters from the notification rows."""
+        sql = ('UPDATE user SET unread_notifications = (SELECT count(*) FROM notification n '
+               'WHERE n.user_id = user.id AND n.is_read = 0)')
+        if user_id is not None:
+            sql += f' WHERE id = {int(user_id)}'
+        db.session.execute(db.text(sql))
@@ -0,0 +1,16 @@
+from datetime import datetime
+
+from . import db
+
+
+class NotificationKey(db.Model):
+    """Idempotency keys for generated notifications.
+
+    A notification is only written if its key could be inserted here, so the
+    same event (e.g. one item field expiring) is reported at most once.
+    """
+    __tablename__ = 'notification_keys'
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(255), unique=True, nullable=False, index=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,96 @@
+from collections import OrderedDict
+
+from . import db
+from .vault_item import VaultItem
+from utils.password_audit import WEAK_SCORE, item_password_entries
+from utils.vault_storage import read_items
+
+
+class PasswordAudit(db.Model):
+    """Keyed digest and strength score of one password field of a vault item.
+
+    Rewritten whenever the item is saved, so reuse and weak-password reports
+    are plain indexed queries without decrypting anything.
+    """
+    __tablename__ = 'password_audit'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    item_id = db.Column(db.Integer, nullable=False, index=True)
+    field = db.Column(db.String(128), nullable=False)
+    digest = db.Column(db.String(32), nullable=False)
+    score = db.Column(db.SmallInteger, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_password_audit_user_digest', 'user_id', 'digest'),
+        db.Index('ix_password_audit_user_score', 'user_id', 'score'),
+    )
+
+    @staticmethod
+    def rows_for_item(item, data: dict) -> list:
+        """Audit rows for ``item`` as plain dicts (for bulk inserts)."""
+        return [{'user_id': item.user_id, 'item_id': item.id, 'field': field, 'digest': digest, 'score': score}
+                for field, digest, score in item_password_entries(item.user_id, data)]
+
+    @staticmethod
+    def replace_for_item(item, data: dict) -> None:
+        """Stage audit rows for ``item`` (caller commits)."""
+        PasswordAudit.remove_for_item(item.id)
+        db.session.add_all([PasswordAudit(**row) for row in PasswordAudit.rows_for_item(item, data)])
+
+    @staticmethod
+    def remove_for_item(item_id: int) -> None:
+        PasswordAudit.query.filter_by(item_id=item_id).delete()
+
+    @staticmethod
+    def reused(user_id: int) -> list:
+        """Groups of (item_id, title, field) that share one password, largest first."""
+        shared = (db.session.query(PasswordAudit.digest)
+                  .filter(PasswordAudit.user_id == user_id)
+                  .group_by(PasswordAudit.digest)
+                  .having(db.func.count(db.distinct(PasswordAudit.item_id)) > 1))
+        rows = (db.session.query(PasswordAudit.digest, PasswordAudit.item_id, VaultItem.title, PasswordAudit.field)
+                .join(VaultItem, VaultItem.id == PasswordAudit.item_id)
+                .filter(PasswordAudit.user_id == user_id, PasswordAudit.digest.in_(shared))
+                .order_by(PasswordAudit.digest, VaultItem.title, PasswordAudit.item_id)
+                .all())
+        groups = OrderedDict()
+        for digest, item_id, title, field in rows:
+            groups.setdefault(digest, []).append((item_id, title, field))
+        return sorted(groups.values(), key=len, reverse=True)
+
+    @staticmethod
+    def weak(user_id: int, below: int = WEAK_SCORE) -> list:
+        """(item_id, title, field, score) of passwords scoring under ``below``."""
+        return (db.session.query(PasswordAudit.item_id, VaultItem.title, PasswordAudit.field, PasswordAudit.score)
+                .join(VaultItem, VaultItem.id == PasswordAudit.item_id)
+                .filter(PasswordAudit.user_id == user_id, PasswordAudit.score < below)
+                .order_by(PasswordAudit.score, VaultItem.title, PasswordAudit.item_id)
+                .all())
+
+    @staticmethod
+    def summary(user_id: int) -> dict:
+        total, weak = (db.session.query(db.func.count(PasswordAudit.id),
+                                        db.func.sum(db.case((PasswordAudit.score < WEAK_SCORE, 1), else_=0)))
+                       .filter(PasswordAudit.user_id == user_id).one())
+        return {'passwords': total or 0, 'weak': weak or 0}
+
+    @staticmethod
+    def backfill(chunk_size: int = 500) -> int:
+        count = 0
+        last_id = 0
+        while True:
+            # explicit columns: this runs from migrations, possibly before
+            # later migrations have added the model's newer columns
+            items = (db.session.query(VaultItem.id, VaultItem.user_id, VaultItem.item_type,
+                                      VaultItem.title, VaultItem.encrypted_data, VaultItem.encrypted_blob)
+                     .filter(VaultItem.id > last_id)
+                     .order_by(VaultItem.id).limit(chunk_size).all())
+            if not items:
+                break
+            payloads = read_items(items)
+            for it, data in zip(items, payloads):
+                PasswordAudit.replace_for_item(it, data or {})
+            db.session.commit()
+            count += len(items)
+            last_id = items[-1].id
+        return count
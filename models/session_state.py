@@ -0,0 +1,13 @@
+from . import db
+
+
+class SessionState(db.Model):
+    """Server-side state of one login session, shared by all worker processes."""
+    __tablename__ = 'session_state'
+    sid = db.Column(db.String(64), primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    # unix timestamps (float seconds)
+    last_activity = db.Column(db.Float, nullable=False, index=True)
+    # fixed-window unmask rate limiter
+    unmask_window_start = db.Column(db.Float, nullable=False, default=0.0)
+    unmask_count = db.Column(db.Integer, nullable=False, default=0)
@@ -17,8 +17,7 @@ class UnmaskToken(db.Model):
 
     @staticmethod
     def issue(user_id: int, item_id: int | None = None, field: str | None = None, ttl_seconds: int = 30):
-        # cleanup expired tokens first
-        UnmaskToken.cleanup_expired()
+        # expired rows are purged in bulk by the background scheduler
         token = secrets.token_urlsafe(32)
         now = datetime.utcnow()
         ut = UnmaskToken(token=token, user_id=user_id, item_id=item_id, field=field, expires_at=now + timedelta(seconds=ttl_seconds))
@@ -28,8 +27,6 @@ class UnmaskToken(db.Model):
 
     @staticmethod
     def validate(token: str, user_id: int, item_id: int | None = None, field: str | None = None):
-        # prune expired tokens first
-        UnmaskToken.cleanup_expired()
         now = datetime.utcnow()
         ut = UnmaskToken.query.filter_by(token=token, user_id=user_id, used=False).first()
         if not ut:
@@ -45,7 +42,10 @@ class UnmaskToken(db.Model):
 
     @staticmethod
     def cleanup_expired():
-        """Remove expired tokens from the database to keep table small."""
+        """Remove expired tokens from the database to keep table small.
+
+        Runs as a periodic background job rather than on every issue/validate.
+        """
         now = datetime.utcnow()
         try:
             UnmaskToken.query.filter(UnmaskToken.expires_at < now).delete()
@@ -1,5 +1,5 @@
 from . import db
-from werkzeug.security import generate_password_hash, check_password_hash
+from utils.password_hashing import hasher
 
 
 class User(db.Model):
@@ -14,8 +14,39 @@ class User(db.Model):
     sec_q3 = db.Column(db.String(255), nullable=False)
     sec_a3 = db.Column(db.String(255), nullable=False)
 
+    # per-user data key, wrapped by the master key (utils/envelope.py)
+    wrapped_key = db.Column(db.LargeBinary, nullable=True)
+
+    # cached count of unread notifications (kept by models/notification.py)
+    unread_notifications = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    # last value of the per-user change sequence: every vault add, edit and
+    # delete takes the next one (VaultItem.revision, VaultTombstone.revision)
+    change_seq = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    # hashing runs on the bounded pool in utils/password_hashing.py and
+    # raises HashingBusy when it is saturated
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return hasher.verify(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        # stored with an older algorithm or a cheaper cost than configured
+        return hasher.needs_rehash(self.password_hash)
+
+    @staticmethod
+    def next_change_seq(user_id: int, count: int = 1) -> int:
+        """Reserve ``count`` change sequence values; returns the last one.
+
+        The UPDATE takes SQLite's write lock first, so concurrent writers
+        never get the same value (caller commits).
+        """
+        db.session.execute(db.update(User).where(User.id == user_id)
+                           .values(change_seq=User.change_seq + count))
+        return db.session.query(User.change_seq).filter(User.id == user_id).scalar()
+
+    @staticmethod
+    def current_change_seq(user_id: int) -> int:
+        return db.session.query(User.change_seq).filter(User.id == user_id).scalar() or 0
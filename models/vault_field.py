@@ -0,0 +1,26 @@
+from . import db
+
+
+class VaultField(db.Model):
+    """One separately encrypted field of a vault item (field-level storage).
+
+    ``name`` is the normalized (lower-case) field name used for lookups,
+    ``label`` the key as it was submitted.
+    """
+    __tablename__ = 'vault_fields'
+    id = db.Column(db.Integer, primary_key=True)
+    item_id = db.Column(db.Integer, nullable=False)
+    name = db.Column(db.String(128), nullable=False)
+    label = db.Column(db.String(128), nullable=False)
+    position = db.Column(db.Integer, nullable=False, default=0)
+    # exactly one of these is set: Fernet text token or binary payload
+    ciphertext = db.Column(db.Text)
+    value_blob = db.Column(db.LargeBinary)
+
+    __table_args__ = (
+        db.UniqueConstraint('item_id', 'name', name='uq_vault_fields_item_name'),
+    )
+
+    @staticmethod
+    def remove_for_item(item_id: int) -> None:
+        VaultField.query.filter_by(item_id=item_id).delete()
@@ -4,5 +4,20 @@ class VaultItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, nullable=False)
     item_type = db.Column(db.String(100))
-    title = db.Column(db.String(255))
+    title = db.Column(db.String(255), default='')
+    # legacy Fernet text token
     encrypted_data = db.Column(db.Text)
+    # versioned binary payload (see utils/crypto.py); preferred when set
+    encrypted_blob = db.Column(db.LargeBinary)
+    # encrypted masked field map shown in the vault listing
+    preview = db.Column(db.Text)
+    # the same snapshot as a binary payload; preferred when set
+    preview_blob = db.Column(db.LargeBinary)
+    # owner's change sequence value at the last add/edit (see User.change_seq)
+    revision = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    __table_args__ = (
+        db.Index('ix_vault_item_user_type_title', 'user_id', 'item_type', 'title'),
+        db.Index('ix_vault_item_user_title', 'user_id', 'title'),
+        db.Index('ix_vault_item_user_revision', 'user_id', 'revision'),
+    )
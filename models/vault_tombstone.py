@@ -0,0 +1,36 @@
+from datetime import datetime
+
+from . import db
+from .user import User
+
+
+class VaultTombstone(db.Model):
+    """Deleted vault items, kept so delta sync can tell clients to drop them.
+
+    ``revision`` comes from the owner's change sequence, like
+    ``VaultItem.revision``, so a client that synced up to some value finds
+    deletions and edits with one range query each.
+    """
+    __tablename__ = 'vault_tombstones'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    item_id = db.Column(db.Integer, nullable=False)
+    revision = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_vault_tombstones_user_revision', 'user_id', 'revision'),
+    )
+
+    @staticmethod
+    def record(item) -> 'VaultTombstone':
+        """Stage a tombstone for ``item`` before it is deleted (caller commits)."""
+        stone = VaultTombstone(user_id=item.user_id, item_id=item.id, revision=User.next_change_seq(item.user_id))
+        db.session.add(stone)
+        return stone
+
+    @staticmethod
+    def since(user_id: int, revision: int, limit: int) -> list:
+        return (VaultTombstone.query
+                .filter(VaultTombstone.user_id == user_id, VaultTombstone.revision > revision)
+                .order_by(VaultTombstone.revision).limit(limit).all())
@@ -1,4 +1,5 @@
 from .singleton import UserSession
+from .session_registry import SessionRegistry
 from .mediator import UIMediator, UIComponent
 from .password_builder import PasswordBuilder
 from .data_proxy import mask_preview
@@ -6,6 +7,6 @@ from .observer import BookingSubject, UserObserver
 from .chain_of_responsibility import verify_security_answers
 
 __all__ = [
-    'UserSession', 'UIMediator', 'UIComponent', 'PasswordBuilder',
+    'UserSession', 'SessionRegistry', 'UIMediator', 'UIComponent', 'PasswordBuilder',
     'mask_preview', 'BookingSubject', 'UserObserver', 'verify_security_answers'
 ]
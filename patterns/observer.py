@@ -1,3 +1,5 @@
+from contextlib import contextmanager
+
 from models.notification import Notification
 from models import db
 
@@ -6,6 +8,10 @@ class BookingSubject:
     def __init__(self):
         # List of all observers (users who want updates)
         self.observers = []
+        # While batching, observers that support it only collect messages
+        self._batching = False
+        # Whether the last batch was committed
+        self.delivered = False
 
     def attach(self, obs):
         # Add a new observer
@@ -14,20 +20,86 @@ class BookingSubject:
     def status_changed(self, message):
         # Notify every observer about the update
         for o in self.observers:
-            o.update(message)
+            collect = getattr(o, 'collect', None) if self._batching else None
+            if collect:
+                collect(message)
+            else:
+                o.update(message)
+
+    @contextmanager
+    def batch(self):
+        # Collect all updates and deliver them in one transaction on exit:
+        #   with subject.batch():
+        #       subject.status_changed(...)
+        self._batching = True
+        try:
+            yield self
+        except Exception:
+            self._batching = False
+            self.discard()
+            raise
+        self._batching = False
+        self.close()
+
+    def close(self):
+        # Flush collected messages of every observer with a single commit
+        self.delivered = False
+        staged = False
+        for o in self.observers:
+            flush = getattr(o, 'flush', None)
+            if flush:
+                staged = flush(commit=False) or staged
+        if not staged:
+            return False
+        try:
+            db.session.commit()
+            self.delivered = True
+        except Exception:
+            db.session.rollback()
+        return self.delivered
+
+    def discard(self):
+        # Drop collected messages without writing them
+        for o in self.observers:
+            clear = getattr(o, 'discard', None)
+            if clear:
+                clear()
 
 
 class UserObserver:
     def __init__(self, user):
         # Store the user this observer represents
         self.user = user
+        # Messages collected while the subject is batching
+        self.pending = []
 
     def update(self, message):
         # Create a notification record for this user
         try:
-            note = Notification(user_id=self.user.id, content=message)
-            db.session.add(note)
+            Notification.add_for_user(self.user.id, [message])
             db.session.commit()
         except Exception:
             # If something fails, undo the database changes
             db.session.rollback()
+
+    def collect(self, message):
+        # Remember the message until the subject flushes
+        self.pending.append(message)
+
+    def flush(self, commit=True):
+        # Insert all collected messages at once; returns True if rows were staged
+        if not self.pending:
+            return False
+        messages = self.pending
+        self.pending = []
+        try:
+            Notification.add_for_user(self.user.id, messages)
+            if commit:
+                db.session.commit()
+        except Exception:
+            db.session.rollback()
+            return False
+        return True
+
+    def discard(self):
+        self.pending = []
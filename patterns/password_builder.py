@@ -1,6 +1,85 @@
-import secrets
+import math
+import os
 import string
-from typing import Optional
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+SYMBOLS = '!@#$%^&*()-_=+[]{};:,.<>?'
+
+# Word list for passphrases (one word per line), loaded on first use
+WORDLIST_PATH = os.path.join(os.path.dirname(__file__), 'wordlist.txt')
+
+
+class _CharSpec:
+    # Everything derived from one option set, computed once per process
+    __slots__ = ('pool', 'classes', 'table', 'rejected')
+
+    def __init__(self, classes: Tuple[str, ...]):
+        self.pool = ''.join(classes) or string.ascii_letters + string.digits
+        self.classes = tuple(frozenset(c) for c in classes)
+        # A random byte b below `limit` becomes pool[b % m]; bytes at or above
+        # it are dropped (rejection sampling), so every character is equally
+        # likely. bytes.translate() then maps a whole buffer in one C call.
+        m = len(self.pool)
+        limit = 256 - 256 % m
+        self.table = bytes(ord(self.pool[b % m]) if b < limit else 0 for b in range(256))
+        self.rejected = bytes(range(limit, 256))
+
+
+@lru_cache(maxsize=None)
+def _char_spec(upper: bool, lower: bool, digits: bool, symbols: bool) -> _CharSpec:
+    classes = []
+    if lower:
+        classes.append(string.ascii_lowercase)
+    if upper:
+        classes.append(string.ascii_uppercase)
+    if digits:
+        classes.append(string.digits)
+    if symbols:
+        classes.append(SYMBOLS)
+    return _CharSpec(tuple(classes))
+
+
+@lru_cache(maxsize=1)
+def load_wordlist(path: str = WORDLIST_PATH) -> Tuple[str, ...]:
+    # Read the passphrase word list once; duplicates would skew the odds
+    with open(path, encoding='utf-8') as f:
+        return tuple(dict.fromkeys(w.strip() for w in f if w.strip()))
+
+
+class EntropyBuffer:
+    """Unbiased random draws served from one ``os.urandom`` buffer."""
+
+    def __init__(self, block: int = 4096):
+        self.block = block
+        self._raw = b''
+        self._pos = 0
+        self._chars = {}
+
+    def _take(self, n: int) -> bytes:
+        if self._pos + n > len(self._raw):
+            self._raw = self._raw[self._pos:] + os.urandom(max(self.block, n))
+            self._pos = 0
+        out = self._raw[self._pos:self._pos + n]
+        self._pos += n
+        return out
+
+    def chars(self, spec: _CharSpec, n: int) -> str:
+        # n uniformly random characters from spec.pool
+        ready = self._chars.get(spec, '')
+        while len(ready) < n:
+            raw = self._take(n - len(ready) + 16)
+            ready += raw.translate(spec.table, spec.rejected).decode('ascii')
+        self._chars[spec] = ready[n:]
+        return ready[:n]
+
+    def below(self, m: int) -> int:
+        # uniform integer in [0, m) for m <= 65536
+        limit = 65536 - 65536 % m
+        while True:
+            x = int.from_bytes(self._take(2), 'big')
+            if x < limit:
+                return x % m
 
 
 class PasswordBuilder:
@@ -11,6 +90,9 @@ class PasswordBuilder:
         self.use_lower = True
         self.use_digits = True
         self.use_symbols = False
+        # Passphrase mode: number of words (0 = character password)
+        self.words = 0
+        self.separator = '-'
 
     def set_length(self, length: int) -> 'PasswordBuilder':
         # Make sure length isn't too small
@@ -37,46 +119,39 @@ class PasswordBuilder:
         self.use_symbols = bool(enable)
         return self
 
+    def with_words(self, count: int = 6, separator: str = '-') -> 'PasswordBuilder':
+        # Switch to diceware-style passphrases of `count` words
+        self.words = max(3, int(count))
+        self.separator = separator
+        return self
+
+    def entropy_bits(self) -> float:
+        # Upper bound on the guessing entropy of one result
+        if self.words:
+            return self.words * math.log2(len(load_wordlist()))
+        spec = _char_spec(self.use_upper, self.use_lower, self.use_digits, self.use_symbols)
+        return self.length * math.log2(len(spec.pool))
+
     def build(self) -> str:
-        # Build the character pool based on chosen options
-        pool = ''
-        if self.use_lower:
-            pool += string.ascii_lowercase
-        if self.use_upper:
-            pool += string.ascii_uppercase
-        if self.use_digits:
-            pool += string.digits
-        if self.use_symbols:
-            pool += '!@#$%^&*()-_=+[]{};:,.<>?'
-
-        # If everything is disabled, fall back to letters + digits
-        if not pool:
-            pool = string.ascii_letters + string.digits
-
-        # Make sure we include at least one character from each enabled type
-        password_chars = []
-        classes = []
-        if self.use_lower:
-            classes.append(string.ascii_lowercase)
-        if self.use_upper:
-            classes.append(string.ascii_uppercase)
-        if self.use_digits:
-            classes.append(string.digits)
-        if self.use_symbols:
-            classes.append('!@#$%^&*()-_=+[]{};:,.<>?')
-
-        # Add one guaranteed character from each class
-        for cls in classes:
-            password_chars.append(secrets.choice(cls))
-
-        # Fill the rest randomly until we reach the desired length
-        while len(password_chars) < self.length:
-            password_chars.append(secrets.choice(pool))
-
-        # Shuffle so the guaranteed chars aren't always in front
-        secrets.SystemRandom().shuffle(password_chars)
-
-        return ''.join(password_chars[: self.length])
+        return self.build_many(1)[0]
+
+    def build_many(self, n: int) -> List[str]:
+        # All results come from one entropy buffer and precomputed pools
+        buf = EntropyBuffer(block=max(4096, n * (self.length + 8)))
+        if self.words:
+            words = load_wordlist()
+            return [self.separator.join(words[buf.below(len(words))] for _ in range(self.words))
+                    for _ in range(n)]
+        spec = _char_spec(self.use_upper, self.use_lower, self.use_digits, self.use_symbols)
+        out = []
+        while len(out) < n:
+            candidate = buf.chars(spec, self.length)
+            # Keep only passwords that contain every enabled character class;
+            # redrawing (instead of forcing one of each in) keeps the result
+            # uniform over all valid passwords
+            if all(not cls.isdisjoint(candidate) for cls in spec.classes):
+                out.append(candidate)
+        return out
 
 
 def generate_password(length: Optional[int] = 16, upper: bool = True, lower: bool = True, digits: bool = True, symbols: bool = False) -> str:
@@ -90,3 +165,19 @@ def generate_password(length: Optional[int] = 16, upper: bool = True, lower: boo
         .with_symbols(symbols)
         .build()
     )
+
+
+def generate_passwords(count: int = 1, length: Optional[int] = 16, upper: bool = True, lower: bool = True,
+                       digits: bool = True, symbols: bool = False, words: int = 0, separator: str = '-') -> List[str]:
+    # Batch version of generate_password(); words > 0 gives passphrases
+    builder = (
+        PasswordBuilder()
+        .set_length(length)
+        .with_upper(upper)
+        .with_lower(lower)
+        .with_digits(digits)
+        .with_symbols(symbols)
+    )
+    if words:
+        builder.with_words(words, separator)
+    return builder.build_many(count)
@@ -0,0 +1,177 @@
+import secrets
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional
+
+from models import db
+from models.session_state import SessionState
+
+
+class TimerWheel:
+    """Hashed timer wheel used to expire per-session bookkeeping.
+
+    Scheduling and cancelling are O(1); ``advance`` only visits the slots
+    that elapsed since the previous call instead of scanning every entry.
+    """
+
+    def __init__(self, slots: int = 128, resolution: float = 1.0):
+        self.resolution = resolution
+        self._slots = [set() for _ in range(slots)]
+        self._deadlines: Dict[str, float] = {}
+        self._tick = int(time.time() / resolution)
+        self._lock = threading.Lock()
+
+    def _slot(self, deadline: float) -> set:
+        return self._slots[int(deadline / self.resolution) % len(self._slots)]
+
+    def schedule(self, key: str, deadline: float) -> None:
+        with self._lock:
+            old = self._deadlines.get(key)
+            if old is not None:
+                self._slot(old).discard(key)
+            self._deadlines[key] = deadline
+            self._slot(deadline).add(key)
+
+    def cancel(self, key: str) -> None:
+        with self._lock:
+            old = self._deadlines.pop(key, None)
+            if old is not None:
+                self._slot(old).discard(key)
+
+    def advance(self, now: Optional[float] = None) -> List[str]:
+        # Return (and forget) every key whose deadline has passed
+        now = time.time() if now is None else now
+        target = int(now / self.resolution)
+        expired = []
+        with self._lock:
+            steps = min(target - self._tick, len(self._slots))
+            for i in range(steps):
+                slot = self._slots[(self._tick + 1 + i) % len(self._slots)]
+                for key in list(slot):
+                    # keys a full revolution (or more) ahead stay put
+                    if self._deadlines[key] <= now:
+                        slot.discard(key)
+                        del self._deadlines[key]
+                        expired.append(key)
+            self._tick = max(self._tick, target)
+        return expired
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+
+class SessionRegistry:
+    """
+    Per-session replacement for the global `UserSession` singleton.
+
+    Each login gets its own session id (sid). State lives in the
+    `session_state` table so every worker process sees the same inactivity
+    lock and unmask quota. Within a process, work on a session is guarded
+    by one of a fixed set of striped locks instead of a global lock, and a
+    timer wheel expires the local bookkeeping of idle sessions.
+
+    A plain class: app.py holds the process-wide instance, and tests or
+    CLIs can build their own with different settings.
+    """
+
+    def __init__(self, inactivity_timeout: int = 60, stripes: int = 16,
+                 touch_interval: float = 5.0, unmask_quota: int = 5, unmask_window: int = 60):
+        self.inactivity_timeout = inactivity_timeout
+        # Activity is persisted at most this often per session, so a lock
+        # may trigger up to `touch_interval` seconds early
+        self.touch_interval = touch_interval
+        self.unmask_quota = unmask_quota
+        self.unmask_window = unmask_window
+        self._stripes = [threading.Lock() for _ in range(stripes)]
+        self._last_write: Dict[str, float] = {}
+        self._wheel = TimerWheel()
+
+    def _lock_for(self, sid: str) -> threading.Lock:
+        return self._stripes[zlib.crc32(sid.encode('utf-8')) % len(self._stripes)]
+
+    def _forget(self, sid: str) -> None:
+        self._last_write.pop(sid, None)
+        self._wheel.cancel(sid)
+
+    def open(self, user_id: int) -> str:
+        # Start a new session for a user and return its id
+        sid = secrets.token_urlsafe(24)
+        now = time.time()
+        db.session.add(SessionState(sid=sid, user_id=user_id, last_activity=now))
+        db.session.commit()
+        with self._lock_for(sid):
+            self._last_write[sid] = now
+        self._wheel.schedule(sid, now + self.inactivity_timeout)
+        return sid
+
+    def get(self, sid: Optional[str]) -> Optional[SessionState]:
+        # Return the session row if it exists and isn't locked
+        if not sid:
+            return None
+        state = db.session.get(SessionState, sid)
+        if state is None or time.time() - state.last_activity > self.inactivity_timeout:
+            return None
+        return state
+
+    def get_user_id(self, sid: Optional[str]):
+        state = self.get(sid)
+        return state.user_id if state else None
+
+    def is_locked(self, sid: Optional[str]) -> bool:
+        return self.get(sid) is None
+
+    def touch(self, sid: str) -> None:
+        # Refresh last activity; writes are coalesced to one per touch_interval
+        now = time.time()
+        with self._lock_for(sid):
+            last = self._last_write.get(sid)
+            if last is not None and now - last < self.touch_interval:
+                return
+            SessionState.query.filter_by(sid=sid).update({'last_activity': now})
+            db.session.commit()
+            self._last_write[sid] = now
+        self._wheel.schedule(sid, now + self.inactivity_timeout)
+        for expired in self._wheel.advance(now):
+            with self._lock_for(expired):
+                self._last_write.pop(expired, None)
+
+    def clear(self, sid: Optional[str]) -> None:
+        # Log out one session
+        if not sid:
+            return
+        with self._lock_for(sid):
+            SessionState.query.filter_by(sid=sid).delete()
+            db.session.commit()
+            self._forget(sid)
+
+    def can_unmask(self, sid: str) -> bool:
+        state = self.get(sid)
+        if state is None:
+            return False
+        if time.time() - state.unmask_window_start > self.unmask_window:
+            return True
+        return state.unmask_count < self.unmask_quota
+
+    def record_unmask(self, sid: str) -> None:
+        # Single UPDATE so concurrent workers can't lose increments
+        now = time.time()
+        expired = SessionState.unmask_window_start < now - self.unmask_window
+        with self._lock_for(sid):
+            SessionState.query.filter_by(sid=sid).update({
+                'unmask_count': db.case((expired, 1), else_=SessionState.unmask_count + 1),
+                'unmask_window_start': db.case((expired, now), else_=SessionState.unmask_window_start),
+            }, synchronize_session=False)
+            db.session.commit()
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Drop idle sessions: local entries via the timer wheel, rows in bulk."""
+        now = time.time() if now is None else now
+        for sid in self._wheel.advance(now):
+            with self._lock_for(sid):
+                self._last_write.pop(sid, None)
+        removed = (SessionState.query
+                   .filter(SessionState.last_activity < now - self.inactivity_timeout)
+                   .delete(synchronize_session=False))
+        db.session.commit()
+        return removed
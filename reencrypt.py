@@ -0,0 +1,49 @@
+"""Re-encrypt vault items into the current storage layout and keys.
+
+    python reencrypt.py                       # resume (or start) the job
+    python reencrypt.py --format blob --payload fernet
+    python reencrypt.py --restart --workers 4 --chunk 500
+
+Moves items onto their owner's data key (needed before ``rotate_key.py``
+can run), converts between the ``fields``/``blob`` storage formats and
+binary/Fernet payloads. Safe to run next to the web app: every chunk is
+one short transaction, and progress is checkpointed so an interrupted run
+continues where it stopped. See utils/reencrypt.py.
+"""
+import argparse
+import sys
+
+from app import app
+from utils.reencrypt import Reencryptor, Target
+from utils.vault_storage import FORMATS
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-encrypt MyPass vault items.')
+    parser.add_argument('--format', choices=FORMATS, default=app.config['VAULT_STORAGE_FORMAT'])
+    parser.add_argument('--payload', choices=('binary', 'fernet'), default=app.config['PAYLOAD_FORMAT'])
+    parser.add_argument('--chunk', type=int, default=200, help='items per transaction')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: CPU count)')
+    parser.add_argument('--pause', type=float, default=0.0, help='seconds to sleep between chunks')
+    parser.add_argument('--force', action='store_true', help='also rewrite items already in the target layout')
+    parser.add_argument('--restart', action='store_true', help='ignore the saved checkpoint')
+    args = parser.parse_args()
+
+    def report(p):
+        print(f'\rid {p.last_id}: {p.scanned} scanned, {p.rewritten} rewritten, '
+              f'{p.conflicts} changed meanwhile, {p.failed} failed ({p.rows_per_sec:.0f} rows/s)',
+              end='', file=sys.stderr)
+
+    job = Reencryptor(Target(args.format, args.payload == 'binary'), args.chunk, args.workers,
+                      args.pause, args.force)
+    with app.app_context():
+        result = job.run(restart=args.restart, progress=report)
+    print(f'\rdone: {result.scanned} scanned, {result.rewritten} rewritten, {result.rows} rows '
+          f'in {result.elapsed:.1f}s ({result.rows_per_sec:.0f} rows/s); '
+          f'{result.conflicts} changed meanwhile, {result.failed} failed', file=sys.stderr)
+    if result.failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
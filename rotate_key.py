@@ -0,0 +1,35 @@
+"""Rotate the master key in ``secret.key``.
+
+    python rotate_key.py
+
+Only the per-user data keys stored on the ``user`` table are rewrapped
+under the new master key; vault rows are not rewritten. The new key is
+staged in ``secret.key.new`` first, so an interrupted run can simply be
+started again. The replaced key is kept in ``secret.key.old``, so data
+keys that a running process wrapped just before the switch stay readable;
+the next rotation rewraps them before it overwrites that file. Rows still
+encrypted directly under the old master key (saved before per-user keys
+existed) block the rotation; move them onto data keys with
+``python reencrypt.py`` first.
+"""
+import argparse
+import sys
+
+from app import app
+from utils.envelope import RotationBlocked, rotate_master_key
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rotate the MyPass master key.')
+    parser.add_argument('--chunk', type=int, default=500, help='users rewrapped per transaction')
+    args = parser.parse_args()
+    with app.app_context():
+        try:
+            count = rotate_master_key(args.chunk)
+        except RotationBlocked as e:
+            sys.exit(f'rotation refused: {e}')
+    print(f'master key rotated; {count} data keys rewrapped')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,27 @@
+// Generated passwords are fetched in batches and handed out one per click;
+// each distinct option string keeps its own queue
+const PASSWORD_BATCH = 10;
+const passwordQueues = {};
+
+async function nextGeneratedPassword(query = ''){
+  const queue = passwordQueues[query] || (passwordQueues[query] = []);
+  if (!queue.length){
+    const sep = query ? '&' : '';
+    const res = await fetch(`/generate_password?count=${PASSWORD_BATCH}${sep}${query}`, {cache: 'no-store'});
+    const j = await res.json();
+    queue.push(...(j.passwords || (j.password ? [j.password] : [])));
+  }
+  return queue.shift();
+}
+
 function setupPasswordGenerator(){
   const btn = document.getElementById('generate-password');
   const pw = document.getElementById('password');
   if (!btn || !pw) return;
   btn.addEventListener('click', async (e)=>{
     e.preventDefault();
-    const res = await fetch('/generate_password');
-    const j = await res.json();
-    if (j.password) { pw.value = j.password; }
+    const password = await nextGeneratedPassword();
+    if (password) { pw.value = password; }
   });
 }
 
@@ -191,12 +206,11 @@ const PasswordGeneratorComponent = {
   receive(event, payload){
     if (event === 'generatePassword'){
       // payload: {length, upper, lower, digits, symbols, targetId}
-      fetch(`/generate_password?length=${payload.length}&upper=${payload.upper?1:0}&lower=${payload.lower?1:0}&digits=${payload.digits?1:0}&symbols=${payload.symbols?1:0}`)
-        .then(r => r.json())
-        .then(j => {
-          if (j.password && payload.targetId){
+      nextGeneratedPassword(`length=${payload.length}&upper=${payload.upper?1:0}&lower=${payload.lower?1:0}&digits=${payload.digits?1:0}&symbols=${payload.symbols?1:0}`)
+        .then(password => {
+          if (password && payload.targetId){
             const el = document.getElementById(payload.targetId);
-            if (el){ el.value = j.password; el.dispatchEvent(new Event('input')); }
+            if (el){ el.value = password; el.dispatchEvent(new Event('input')); }
           }
         }).catch(()=>{});
     }
@@ -258,11 +272,10 @@ function setupPasswordGenerator(){
   btn.addEventListener('click', async (e) => {
     e.preventDefault();
     try{
-      const res = await fetch('/generate_password');
-      const j = await res.json();
-      if (j.password){
-        pwField.value = j.password;
-        updatePasswordHint(j.password);
+      const password = await nextGeneratedPassword();
+      if (password){
+        pwField.value = password;
+        updatePasswordHint(password);
         pwField.focus();
       }
     }catch(err){
@@ -284,12 +297,11 @@ function setupRecoverPasswordGenerator(){
   btn.addEventListener('click', async (e)=>{
     e.preventDefault();
     try{
-      const res = await fetch('/generate_password');
-      const j = await res.json();
-      if (j.password){
-        pwField.value = j.password;
+      const password = await nextGeneratedPassword();
+      if (password){
+        pwField.value = password;
         // update recover hint consistently using shared helper
-        updatePasswordHint(j.password, 'recover-password-hint');
+        updatePasswordHint(password, 'recover-password-hint');
         pwField.focus();
       }
     }catch(err){
@@ -330,6 +342,58 @@ function setupTogglePasswordButtons(){
   });
 }
 
+// Notifications on the home page: new ones arrive over Server-Sent Events,
+// older ones are paged in from /api/notifications
+function formatNotificationTime(iso){
+  // same 'YYYY-MM-DD HH:MM' (UTC) as the server-rendered list
+  return iso ? iso.slice(0, 16).replace('T', ' ') : '';
+}
+
+function notificationItem(n){
+  const li = document.createElement('li');
+  li.className = 'small-muted';
+  li.textContent = `${formatNotificationTime(n.timestamp)} — ${n.content}`;
+  return li;
+}
+
+function setupNotifications(){
+  const list = document.getElementById('notifications-list');
+  if (!list) return;
+  const count = document.getElementById('notification-count');
+  const more = document.getElementById('notifications-more');
+
+  if (more){
+    more.addEventListener('click', async () => {
+      more.disabled = true;
+      const res = await fetch(`/api/notifications?cursor=${encodeURIComponent(more.dataset.cursor)}`,
+                              {credentials: 'same-origin'});
+      if (!res.ok) { more.disabled = false; return; }
+      const j = await res.json();
+      j.notifications.forEach(n => list.appendChild(notificationItem(n)));
+      if (j.next_cursor) { more.dataset.cursor = j.next_cursor; more.disabled = false; }
+      else { more.remove(); }
+    });
+  }
+
+  if (!window.EventSource || !list.dataset.stream) return;
+  const source = new EventSource(`${list.dataset.stream}?after=${list.dataset.latest || 0}`);
+  source.addEventListener('notification', ev => {
+    const empty = list.querySelector('[data-empty]');
+    if (empty) empty.remove();
+    list.insertBefore(notificationItem(JSON.parse(ev.data)), list.firstChild);
+    const form = document.querySelector('form[action$="/notifications/clear"]');
+    if (form) form.style.display = '';
+  });
+  source.addEventListener('unread', ev => {
+    if (count) count.textContent = `(${JSON.parse(ev.data).count} unread)`;
+  });
+  source.addEventListener('locked', () => {
+    source.close();
+    window.location.href = '/login';
+  });
+  window.addEventListener('beforeunload', () => source.close());
+}
+
 function init(){
   setupAutoLock();
   initCopyUnmaskHandlers();
@@ -337,6 +401,7 @@ function init(){
   setupPasswordGenerator();
   setupRecoverPasswordGenerator();
   setupTogglePasswordButtons();
+  setupNotifications();
 }
 
 if (document.readyState === 'loading') {
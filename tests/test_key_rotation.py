@@ -0,0 +1,181 @@
+"""Master key rotation (utils/envelope.py) against a throwaway database and
+key file; the repository's own ``database/`` and ``secret.key`` are never
+written.
+
+    python -m pytest tests
+"""
+import os
+
+import pytest
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet
+
+from utils import crypto, envelope
+
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    url = 'sqlite:///' + str(tmp_path_factory.mktemp('db') / 'mypass.db')
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv('MYPASS_DATABASE_URL', url)
+        import app as module
+    assert module.app.config['SQLALCHEMY_DATABASE_URI'] == url
+    return module.app
+
+
+@pytest.fixture
+def key_path(tmp_path, monkeypatch):
+    path = str(tmp_path / 'secret.key')
+    with open(path, 'wb') as f:
+        f.write(Fernet.generate_key())
+    monkeypatch.setattr(crypto, 'KEY_PATH', path)
+    monkeypatch.setattr(envelope, 'KEY_PATH', path)
+    monkeypatch.setattr(envelope, 'PENDING_KEY_PATH', path + '.new')
+    monkeypatch.setattr(envelope, 'RETIRED_KEY_PATH', path + '.old')
+    crypto._keyring.reset()
+    envelope.data_keys.clear()
+    yield path
+    crypto._keyring.reset()
+    envelope.data_keys.clear()
+
+
+@pytest.fixture
+def ctx(app, key_path):
+    from models import db
+    from models.user import User
+    from models.vault_item import VaultItem
+    with app.app_context():
+        yield db
+        db.session.rollback()
+        db.session.query(VaultItem).delete()
+        db.session.query(User).delete()
+        db.session.commit()
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _user(db, email):
+    from models.user import User
+    user = User(email=email, password_hash='x', sec_q1='q', sec_a1='a', sec_q2='q', sec_a2='a',
+                sec_q3='q', sec_a3='a')
+    db.session.add(user)
+    db.session.flush()
+    envelope.ensure_user_key(user)
+    db.session.commit()
+    return user.id
+
+
+def _wrapped(db, user_id):
+    from models.user import User
+    return bytes(db.session.get(User, user_id).wrapped_key)
+
+
+def _kid(wrapped):
+    return wrapped[1:9]
+
+
+def _reread(user_ids, tokens):
+    # a new process: nothing cached
+    envelope.data_keys.clear()
+    crypto._keyring.reset()
+    return envelope.decrypt_for(user_ids, tokens)
+
+
+def test_rotate_and_still_decrypt(ctx, key_path):
+    a, b = _user(ctx, 'a@example.com'), _user(ctx, 'b@example.com')
+    tokens = envelope.encrypt_for([a, b], [{'password': 'pa'}, {'password': 'pb'}])
+    old_master = _read(key_path)
+
+    assert envelope.rotate_master_key(chunk_size=1) == 2
+
+    new_master = _read(key_path)
+    assert new_master != old_master
+    assert _read(key_path + '.old') == old_master
+    assert not os.path.exists(key_path + '.new')
+    for uid in (a, b):
+        assert _kid(_wrapped(ctx, uid)) == envelope.master_key_id(new_master)
+    assert _reread([a, b], tokens) == [{'password': 'pa'}, {'password': 'pb'}]
+
+
+def test_resume_after_crash_reuses_pending_key(ctx, key_path, monkeypatch):
+    a, b = _user(ctx, 'a@example.com'), _user(ctx, 'b@example.com')
+    tokens = envelope.encrypt_for([a, b], [{'password': 'pa'}, {'password': 'pb'}])
+    old_master = _read(key_path)
+
+    def crash(src, dst):
+        raise OSError('killed before the switch')
+
+    with monkeypatch.context() as mp:
+        mp.setattr(envelope.os, 'replace', crash)
+        with pytest.raises(OSError):
+            envelope.rotate_master_key()
+    assert _read(key_path) == old_master
+    pending = _read(key_path + '.new')
+
+    # and one key is still under the old master, as if the crash came mid-chunk
+    from models.user import User
+    dk = envelope.unwrap_key(_wrapped(ctx, b), b)
+    ctx.session.execute(ctx.update(User).where(User.id == b)
+                        .values(wrapped_key=envelope.wrap_key(dk, b, old_master)))
+    ctx.session.commit()
+    assert _reread([a, b], tokens) == [{'password': 'pa'}, {'password': 'pb'}]
+
+    assert envelope.rotate_master_key() == 1
+    assert _read(key_path) == pending
+    assert not os.path.exists(key_path + '.new')
+    assert _reread([a, b], tokens) == [{'password': 'pa'}, {'password': 'pb'}]
+
+
+def test_key_wrapped_mid_rotation_stays_readable(ctx, key_path):
+    a = _user(ctx, 'a@example.com')
+    old_master = _read(key_path)
+
+    # while a rotation is staged, new keys go under the pending key
+    pending = Fernet.generate_key()
+    with open(key_path + '.new', 'wb') as f:
+        f.write(pending)
+    b = _user(ctx, 'b@example.com')
+    assert _kid(_wrapped(ctx, b)) == envelope.master_key_id(pending)
+    token = envelope.encrypt_for([b], [{'password': 'pb'}])[0]
+    assert _reread([b], [token]) == [{'password': 'pb'}]
+
+    # a process that missed the switch wraps under the key being retired
+    dk = envelope.generate_data_key()
+    stale = envelope.wrap_key(dk, a, old_master)
+    envelope.rotate_master_key()
+    assert _read(key_path) == pending
+    crypto._keyring.reset()
+    assert envelope.unwrap_key(stale, a) == dk
+    assert _reread([b], [token]) == [{'password': 'pb'}]
+
+
+def test_rotation_blocked_by_master_key_rows(ctx, key_path):
+    from models.vault_item import VaultItem
+    a = _user(ctx, 'a@example.com')
+    ctx.session.add(VaultItem(user_id=a, item_type='login', encrypted_data=crypto.encrypt_json({'password': 'p'})))
+    ctx.session.commit()
+    old_master = _read(key_path)
+
+    with pytest.raises(envelope.RotationBlocked):
+        envelope.rotate_master_key()
+    assert _read(key_path) == old_master
+    assert not os.path.exists(key_path + '.new')
+    assert _kid(_wrapped(ctx, a)) == envelope.master_key_id(old_master)
+
+
+def test_wrapped_key_is_bound_to_its_user(ctx, key_path):
+    from models.user import User
+    a, b = _user(ctx, 'a@example.com'), _user(ctx, 'b@example.com')
+    stolen = _wrapped(ctx, a)
+    assert envelope.unwrap_key(stolen, a)
+    with pytest.raises(InvalidTag):
+        envelope.unwrap_key(stolen, b)
+
+    ctx.session.execute(ctx.update(User).where(User.id == b).values(wrapped_key=stolen))
+    ctx.session.commit()
+    envelope.data_keys.clear()
+    with pytest.raises(InvalidTag):
+        envelope.user_key(b)
@@ -0,0 +1,88 @@
+"""Bulk vault import/export from the command line.
+
+    python transfer.py import --email me@example.com --file export.csv
+    python transfer.py import --email me@example.com --file backup.mypass
+    python transfer.py export --email me@example.com --format archive --out backup.mypass
+
+Uses the same streaming pipeline as the web routes (see utils/vault_io.py).
+Archive passphrases are read from ``MYPASS_ARCHIVE_PASSPHRASE`` or prompted for.
+"""
+import argparse
+import getpass
+import os
+import sys
+import time
+
+# exports decrypt whole chunks: spread them over worker processes
+os.environ.setdefault('MYPASS_BULK_DECRYPT', 'process')
+
+from app import app  # noqa: E402
+from models.user import User  # noqa: E402
+from utils.vault_io import EXPORT_FORMATS, IMPORT_FORMATS, ImportFormatError, export_vault, import_records, parse  # noqa: E402
+
+
+def _passphrase(confirm=False):
+    value = os.environ.get('MYPASS_ARCHIVE_PASSPHRASE')
+    if value:
+        return value
+    value = getpass.getpass('Archive passphrase: ')
+    if confirm and getpass.getpass('Repeat passphrase: ') != value:
+        sys.exit('passphrases do not match')
+    return value
+
+
+def do_import(args, user):
+    is_archive = args.format == 'archive' or (args.format == 'auto' and args.file.endswith('.mypass'))
+    passphrase = _passphrase() if is_archive else None
+    start = time.perf_counter()
+
+    def progress(imported, skipped):
+        rate = imported / max(time.perf_counter() - start, 1e-9)
+        print(f'\r{imported} imported, {skipped} skipped ({rate:.0f} items/s)', end='', file=sys.stderr)
+
+    with open(args.file, 'rb') as f:
+        result = import_records(user.id, parse(f, args.format, args.file, passphrase), args.chunk,
+                                app.config['VAULT_STORAGE_FORMAT'],
+                                binary=app.config['PAYLOAD_FORMAT'] == 'binary', progress=progress)
+    print(f'\r{result.imported} imported, {result.skipped} skipped in '
+          f'{time.perf_counter() - start:.1f}s', file=sys.stderr)
+
+
+def do_export(args, user):
+    passphrase = _passphrase(confirm=True) if args.format == 'archive' else None
+    out = open(args.out, 'w', encoding='utf-8', newline='') if args.out != '-' else sys.stdout
+    try:
+        for part in export_vault(user.id, args.format, passphrase, args.chunk):
+            out.write(part)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import or export a MyPass vault.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    imp = sub.add_parser('import', help='import items from a file')
+    imp.add_argument('--file', required=True)
+    imp.add_argument('--format', choices=IMPORT_FORMATS, default='auto')
+    exp = sub.add_parser('export', help='export all items to a file')
+    exp.add_argument('--out', default='-', help="output file ('-' for stdout)")
+    exp.add_argument('--format', choices=EXPORT_FORMATS, default='archive')
+    for p in (imp, exp):
+        p.add_argument('--email', required=True, help='account to import into / export from')
+        p.add_argument('--chunk', type=int, default=app.config['IMPORT_CHUNK_SIZE'],
+                       help='items per transaction / decrypt batch')
+    args = parser.parse_args()
+
+    with app.app_context():
+        user = User.query.filter_by(email=args.email).first()
+        if user is None:
+            sys.exit(f'no account for {args.email}')
+        try:
+            do_import(args, user) if args.command == 'import' else do_export(args, user)
+        except ImportFormatError as e:
+            sys.exit(f'import failed: {e}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Keyed-HMAC blind index for searching encrypted vault items.
+
+Titles and non-sensitive field values are split into lowercase terms.
+Every prefix of a term (from MIN_PREFIX up to MAX_PREFIX characters) is
+stored as a truncated HMAC, so both exact and prefix queries become an
+indexed equality lookup. Terms longer than MAX_PREFIX are additionally
+stored whole, which keeps exact matches on long words working. The HMAC
+key is derived from the user's data key (utils/envelope.py), so equal terms
+of different users never share a digest and master key rotation leaves the
+index valid.
+"""
+import hmac
+import re
+from typing import Iterable, List, Optional, Set
+
+from patterns.data_proxy import DataProxy
+from utils.envelope import index_key
+
+MIN_PREFIX = 2
+MAX_PREFIX = 12
+
+# Free-form fields that may hold secrets even though DataProxy shows them
+EXCLUDED_FIELDS = ('notes',)
+
+_TERM_RE = re.compile(r'[0-9a-z]+')
+
+
+def tokenize(text) -> List[str]:
+    return _TERM_RE.findall(str(text or '').lower())
+
+
+def is_searchable_field(key) -> bool:
+    key = (key or '').lower()
+    if key in EXCLUDED_FIELDS:
+        return False
+    return not any(sub in key for sub in DataProxy.SENSITIVE_SUBSTRINGS)
+
+
+def _digest(hkey: bytes, user_id: int, kind: str, term: str) -> str:
+    msg = f'{user_id}:{kind}:{term}'.encode('utf-8')
+    # one-shot hmac.digest() runs entirely in OpenSSL (imports hash many terms)
+    return hmac.digest(hkey, msg, 'sha256').hex()[:32]
+
+
+def _term_digests(hkey: bytes, user_id: int, term: str) -> Iterable[str]:
+    for n in range(MIN_PREFIX, min(len(term), MAX_PREFIX) + 1):
+        yield _digest(hkey, user_id, 'p', term[:n])
+    if len(term) > MAX_PREFIX:
+        yield _digest(hkey, user_id, 'e', term)
+
+
+def item_digests(user_id: int, title, data: dict, memo: Optional[dict] = None) -> Set[str]:
+    """All blind index digests for an item's title and searchable fields.
+
+    Bulk callers can pass the same ``memo`` dict for many items of one user:
+    terms shared between items (domains, 'com', 'login', ...) are then
+    hashed only once.
+    """
+    hkey = index_key(user_id, 'blind-index')
+    terms = set(tokenize(title))
+    for k, v in (data or {}).items():
+        if v and is_searchable_field(k):
+            terms.update(tokenize(v))
+    out = set()
+    for term in terms:
+        if memo is None:
+            out.update(_term_digests(hkey, user_id, term))
+            continue
+        digests = memo.get(term)
+        if digests is None:
+            digests = memo[term] = tuple(_term_digests(hkey, user_id, term))
+        out.update(digests)
+    return out
+
+
+def query_digests(user_id: int, query: str) -> List[str]:
+    """One digest per query term; terms shorter than MIN_PREFIX are ignored."""
+    hkey = index_key(user_id, 'blind-index')
+    out = []
+    for term in tokenize(query):
+        if len(term) < MIN_PREFIX:
+            continue
+        kind = 'e' if len(term) > MAX_PREFIX else 'p'
+        out.append(_digest(hkey, user_id, kind, term))
+    return out
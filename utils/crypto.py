@@ -1,9 +1,57 @@
+import hashlib
+import hmac
 import os
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 import json
 
+from utils.metrics import count_items, timed
+
 KEY_PATH = os.path.join(os.path.dirname(__file__), '..', 'secret.key')
 
+# How often (in seconds) the key ring re-checks secret.key for changes
+KEY_CHECK_INTERVAL = 2.0
+
+# Batches of at least BULK_THRESHOLD tokens are split into BULK_CHUNK_SIZE
+# chunks and decrypted on a worker pool; smaller ones stay inline. The only
+# measurement so far (benchmarks/bulk_decrypt.py, single core) put the pool's
+# break-even near 2000 tokens before any parallel gain; 1000 is not a measured
+# cutover, it is the default export/import chunk (MYPASS_IMPORT_CHUNK), so that
+# CLI jobs reach the pool at all. Re-run the benchmark on the deployment
+# hardware and set MYPASS_BULK_DECRYPT_THRESHOLD / _CHUNK from it.
+BULK_THRESHOLD = 1000
+BULK_CHUNK_SIZE = 500
+
+# Binary payload format: 1 header byte | 12-byte nonce | AES-256-GCM
+# ciphertext+tag (the header byte is authenticated as associated data).
+# Legacy Fernet text tokens remain readable everywhere.
+PAYLOAD_RAW = 0x01    # body is compact JSON
+PAYLOAD_ZLIB = 0x02   # body is zlib-compressed compact JSON
+_NONCE_SIZE = 12
+# Key type: set in the header of payloads sealed under a per-user data key
+# (see utils/envelope.py) instead of the master key. Fernet text tokens
+# under a data key carry DATA_KEY_PREFIX instead.
+PAYLOAD_DATA_KEY = 0x10
+DATA_KEY_PREFIX = 'k:'
+
+def _derive(key: bytes, purpose: str) -> bytes:
+    return hmac.new(key, b'mypass:' + purpose.encode('utf-8'), hashlib.sha256).digest()
+
+
+class Ciphers:
+    """Everything derived from one key (the master key or a user data key)."""
+    __slots__ = ('key', 'fernet', 'aead')
+
+    def __init__(self, key: bytes):
+        self.key = key
+        self.fernet = Fernet(key)
+        self.aead = AESGCM(_derive(key, 'payload-v1'))
+
+
 def load_key():
     if not os.path.exists(KEY_PATH):
         key = Fernet.generate_key()
@@ -13,22 +61,276 @@ def load_key():
     with open(KEY_PATH, 'rb') as f:
         return f.read()
 
+
+class KeyRing:
+    """Process-wide cache of the Fernet instance built from ``secret.key``.
+
+    The key file is read once and the same ``Fernet`` / AES-GCM objects
+    are reused for every call. The file is stat'ed at most every ``check_interval`` seconds
+    and reloaded only when it has changed (e.g. after a key rotation).
+    """
+
+    def __init__(self, check_interval: float = KEY_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._ciphers = None
+        self._stamp = None
+        self._checked_at = 0.0
+
+    @staticmethod
+    def _stat():
+        try:
+            st = os.stat(KEY_PATH)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def ciphers(self, fresh: bool = False) -> Ciphers:
+        # fresh=True stats the file now instead of trusting the last check
+        now = time.monotonic()
+        c = self._ciphers
+        if c is not None and not fresh and now - self._checked_at < self.check_interval:
+            return c
+        with self._lock:
+            stamp = self._stat()
+            if self._ciphers is None or stamp != self._stamp:
+                self._ciphers = Ciphers(load_key())
+                # stat again: load_key() may have just created the file
+                self._stamp = self._stat()
+            self._checked_at = now
+            return self._ciphers
+
+    def fernet(self) -> Fernet:
+        return self.ciphers().fernet
+
+    def key(self, fresh: bool = False) -> bytes:
+        # Raw master key bytes (refreshed the same way as the Fernet)
+        return self.ciphers(fresh).key
+
+    def reset(self) -> None:
+        # Drop the cached key so the next call re-reads secret.key
+        with self._lock:
+            self._ciphers = None
+            self._stamp = None
+            self._checked_at = 0.0
+
+
+_keyring = KeyRing()
+
+
 def _fernet():
-    key = load_key()
-    return Fernet(key)
+    return _keyring.fernet()
 
-def encrypt_json(obj):
+def derive_key(purpose: str) -> bytes:
+    """32-byte sub-key of the master key for a named purpose (e.g. HMAC
+    signing), so secret.key itself is never used for two things."""
+    return _derive(_keyring.key(), purpose)
+
+def _dumps(obj):
     try:
-        data = json.dumps(obj).encode('utf-8')
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
     except Exception:
-        data = str(obj).encode('utf-8')
-    return _fernet().encrypt(data).decode('utf-8')
+        return str(obj).encode('utf-8')
+
+def _seal(c: Ciphers, obj, flags: int = 0) -> bytes:
+    body = _dumps(obj)
+    packed = zlib.compress(body, 6)
+    # short payloads usually grow when compressed; keep whichever is smaller
+    kind, body = (PAYLOAD_ZLIB, packed) if len(packed) < len(body) else (PAYLOAD_RAW, body)
+    header = bytes([kind | flags])
+    nonce = os.urandom(_NONCE_SIZE)
+    return header + nonce + c.aead.encrypt(nonce, body, header)
+
+def _open(c: Ciphers, blob) -> object:
+    blob = bytes(blob)
+    kind = blob[0] & ~PAYLOAD_DATA_KEY
+    if kind not in (PAYLOAD_RAW, PAYLOAD_ZLIB):
+        raise ValueError(f'unknown payload version {kind}')
+    body = c.aead.decrypt(blob[1:1 + _NONCE_SIZE], blob[1 + _NONCE_SIZE:], blob[:1])
+    if kind == PAYLOAD_ZLIB:
+        body = zlib.decompress(body)
+    return json.loads(body.decode('utf-8'))
+
+def uses_data_key(token) -> bool:
+    """Whether ``token`` was encrypted under a user data key."""
+    if isinstance(token, (bytes, bytearray, memoryview)):
+        return len(token) > 0 and bool(token[0] & PAYLOAD_DATA_KEY)
+    return isinstance(token, str) and token.startswith(DATA_KEY_PREFIX)
 
-def decrypt_json(token):
+def _decrypt_strict(c: Ciphers, token, data_key: Ciphers = None):
+    # binary payloads (bytes) or Fernet text tokens (str), under the master
+    # key ``c`` or, if the token says so, under ``data_key``; raises on failure
+    if uses_data_key(token):
+        if data_key is None:
+            raise ValueError('token is sealed under a data key')
+        c = data_key
+        if isinstance(token, str):
+            token = token[len(DATA_KEY_PREFIX):]
+    if isinstance(token, (bytes, bytearray, memoryview)):
+        return _open(c, token)
+    data = c.fernet.decrypt(token.encode('utf-8'))
+    return json.loads(data.decode('utf-8'))
+
+def _decrypt_with(c: Ciphers, token, data_key: Ciphers = None):
     if not token:
         return {}
     try:
-        data = _fernet().decrypt(token.encode('utf-8'))
-        return json.loads(data.decode('utf-8'))
+        return _decrypt_strict(c, token, data_key)
     except Exception:
         return {}
+
+# The encrypt_* helpers use the master key unless a user's ``data_key``
+# (utils.envelope.user_key) is given; decrypt_* need the same data key for
+# tokens sealed under it and read master-key tokens either way.
+
+@timed('encrypt')
+def encrypt_json(obj, data_key: Ciphers = None):
+    if data_key is None:
+        return _fernet().encrypt(_dumps(obj)).decode('utf-8')
+    return DATA_KEY_PREFIX + data_key.fernet.encrypt(_dumps(obj)).decode('utf-8')
+
+@timed('decrypt')
+def decrypt_json(token, data_key: Ciphers = None):
+    """Decrypt a Fernet text token or a binary payload."""
+    if not token:
+        return {}
+    return _decrypt_with(_keyring.ciphers(), token, data_key)
+
+@timed('decrypt')
+def decrypt_strict(token, data_key: Ciphers = None):
+    """Like ``decrypt_json`` but raises instead of returning ``{}`` on a bad
+    token (for jobs that must not overwrite what they could not read)."""
+    return _decrypt_strict(_keyring.ciphers(), token, data_key)
+
+@timed('encrypt', count_items)
+def encrypt_many(objs, data_key: Ciphers = None):
+    """Encrypt a sequence of objects, resolving the key only once."""
+    if data_key is None:
+        f = _fernet()
+        return [f.encrypt(_dumps(obj)).decode('utf-8') for obj in objs]
+    f = data_key.fernet
+    return [DATA_KEY_PREFIX + f.encrypt(_dumps(obj)).decode('utf-8') for obj in objs]
+
+@timed('encrypt')
+def encrypt_payload(obj, data_key: Ciphers = None) -> bytes:
+    """Encrypt to the compact binary payload format (for LargeBinary columns)."""
+    if data_key is None:
+        return _seal(_keyring.ciphers(), obj)
+    return _seal(data_key, obj, PAYLOAD_DATA_KEY)
+
+@timed('encrypt', count_items)
+def encrypt_payloads(objs, data_key: Ciphers = None) -> list:
+    if data_key is None:
+        c = _keyring.ciphers()
+        return [_seal(c, obj) for obj in objs]
+    return [_seal(data_key, obj, PAYLOAD_DATA_KEY) for obj in objs]
+
+_worker_ciphers = None
+
+def process_pool(workers: int, initializer=None, initargs=()) -> ProcessPoolExecutor:
+    """Worker processes for bulk decryption and the re-encryption job.
+
+    One policy for both: the platform's default start method. Forking a
+    process that already runs threads (a threaded server, the scheduler) is
+    unsafe on macOS, where spawn is the default. Spawned workers re-import
+    the entry script; importing ``app`` starts no background jobs, and its
+    migrations are no-ops by then."""
+    return ProcessPoolExecutor(workers, initializer=initializer, initargs=initargs)
+
+
+def _init_bulk_worker(key):
+    # runs once in every pool process
+    global _worker_ciphers
+    _worker_ciphers = Ciphers(key)
+
+def _decrypt_chunk(tokens, data_key=None):
+    dk = Ciphers(data_key) if data_key else None
+    return [_decrypt_with(_worker_ciphers, token, dk) for token in tokens]
+
+
+class BulkDecryptor:
+    """Decrypts large batches on a bounded pool of workers.
+
+    ``mode`` is ``'process'`` (scales across cores), ``'thread'`` (only
+    helps where decryption releases the GIL) or ``'off'``. Batches below
+    ``threshold`` and single-worker setups always use the inline path. If
+    the pool breaks, the batch falls back to inline decryption.
+    """
+
+    def __init__(self, mode: str = 'process', workers: int = None,
+                 threshold: int = BULK_THRESHOLD, chunk_size: int = BULK_CHUNK_SIZE):
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_key = None
+        self.configure(mode, workers, threshold, chunk_size)
+
+    def configure(self, mode: str = 'process', workers: int = None,
+                  threshold: int = BULK_THRESHOLD, chunk_size: int = BULK_CHUNK_SIZE) -> None:
+        self.shutdown()
+        self.mode = mode
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.threshold = threshold
+        self.chunk_size = chunk_size
+
+    def _executor(self, key: bytes):
+        with self._lock:
+            # a rotated key needs fresh worker processes
+            if self._pool is None or self._pool_key != key:
+                self._shutdown_locked()
+                if self.mode == 'thread':
+                    self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='mypass-decrypt')
+                else:
+                    self._pool = process_pool(self.workers, _init_bulk_worker, (key,))
+                self._pool_key = key
+            return self._pool
+
+    def decrypt(self, tokens, key: bytes = None, data_key: Ciphers = None) -> list:
+        tokens = list(tokens)
+        if self.mode == 'off' or self.workers <= 1 or len(tokens) < self.threshold:
+            c = Ciphers(key) if key else _keyring.ciphers()
+            return [_decrypt_with(c, token, data_key) for token in tokens]
+        key = key or _keyring.key()
+        chunks = [tokens[i:i + self.chunk_size] for i in range(0, len(tokens), self.chunk_size)]
+        try:
+            pool = self._executor(key)
+            if self.mode == 'thread':
+                c = Ciphers(key)
+                parts = pool.map(lambda chunk: [_decrypt_with(c, t, data_key) for t in chunk], chunks)
+            else:
+                # workers only hold the master key; a data key travels with each chunk
+                dk = data_key.key if data_key else None
+                parts = pool.map(_decrypt_chunk, chunks, [dk] * len(chunks))
+            out = []
+            for part in parts:
+                out.extend(part)
+            return out
+        except Exception:
+            self.shutdown()
+            c = Ciphers(key)
+            return [_decrypt_with(c, token, data_key) for token in tokens]
+
+    def _shutdown_locked(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = None
+        self._pool_key = None
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._shutdown_locked()
+
+
+_bulk = BulkDecryptor()
+
+
+def configure_bulk_decrypt(mode: str = 'process', workers: int = None,
+                           threshold: int = BULK_THRESHOLD, chunk_size: int = BULK_CHUNK_SIZE) -> None:
+    _bulk.configure(mode, workers, threshold, chunk_size)
+
+@timed('decrypt', count_items)
+def decrypt_many(tokens, data_key: Ciphers = None):
+    """Decrypt a sequence of tokens in order; bad tokens decode to ``{}``.
+
+    Large batches are spread over the bulk decryption pool.
+    """
+    return _bulk.decrypt(tokens, data_key=data_key)
@@ -0,0 +1,40 @@
+from sqlalchemy import event
+
+# PRAGMAs applied to every new SQLite connection, per profile
+PROFILES = {
+    # SQLite defaults (rollback journal, full fsync)
+    'default': {},
+    # WAL lets readers run alongside one writer; NORMAL sync is durable
+    # across application crashes and only fsyncs at checkpoints
+    'performance': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'cache_size': -20000,       # ~20 MB page cache
+        'mmap_size': 268435456,     # 256 MB memory-mapped I/O
+        'temp_store': 'MEMORY',
+        'foreign_keys': 'ON',
+    },
+}
+
+
+def apply_sqlite_profile(engine, profile: str = 'performance', overrides: dict = None) -> dict:
+    """Register a connect hook that sets the profile's PRAGMAs.
+
+    Must be called before the engine opens its first connection.
+    """
+    if engine.dialect.name != 'sqlite':
+        return {}
+    pragmas = dict(PROFILES[profile])
+    pragmas.update(overrides or {})
+    if not pragmas:
+        return pragmas
+
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        for name, value in pragmas.items():
+            cur.execute(f'PRAGMA {name}={value}')
+        cur.close()
+
+    return pragmas
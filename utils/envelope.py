@@ -0,0 +1,298 @@
+"""Envelope encryption: per-user data keys wrapped by the master key.
+
+Every user has a random data key. Vault payloads, field values, previews
+and the blind index of that user are keyed from it, and the data key
+itself is stored on the ``User`` row wrapped (AES-GCM) under a key derived
+from ``secret.key``. Rotating the master key therefore only rewraps one
+small key per user; the vault rows are not touched.
+
+Wrapped key layout: 1 version byte | 8-byte master key id | 12-byte nonce |
+AES-GCM ciphertext+tag. The header and the user id are authenticated, so
+a wrapped key cannot be copied to another user's row.
+
+Rows written before data keys existed (or for a user without one) remain
+under the master key; they are moved onto data keys when re-saved or by
+``reencrypt.py``, and a rotation refuses to start while any are left.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import List, Optional
+
+from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from sqlalchemy import text
+
+from models import db
+from models.user import User
+from utils.crypto import (KEY_PATH, PAYLOAD_RAW, PAYLOAD_ZLIB, Ciphers, _derive, _keyring, decrypt_many,
+                          encrypt_many, encrypt_payloads, uses_data_key)
+
+WRAP_VERSION = 0x01
+_KEY_ID_SIZE = 8
+_NONCE_SIZE = 12
+
+# a rotation writes the new master key here first, so an interrupted
+# rotation can be resumed and half-rewrapped keys stay readable meanwhile
+PENDING_KEY_PATH = KEY_PATH + '.new'
+# the key a rotation replaced; keys wrapped under it by a process that
+# had not yet noticed the rotation stay readable until the next rotation
+# (or a re-run of this one) rewraps them
+RETIRED_KEY_PATH = KEY_PATH + '.old'
+
+
+class RotationBlocked(RuntimeError):
+    """Rows are still encrypted directly under the master key."""
+
+
+def master_key_id(master: bytes) -> bytes:
+    return _derive(master, 'key-id')[:_KEY_ID_SIZE]
+
+
+def _kek(master: bytes) -> AESGCM:
+    return AESGCM(_derive(master, 'key-wrap-v1'))
+
+
+def generate_data_key() -> bytes:
+    # same shape as secret.key, so a data key builds a full Ciphers
+    return Fernet.generate_key()
+
+
+def wrap_key(data_key: bytes, user_id: int, master: bytes = None) -> bytes:
+    if master is None:
+        # during a rotation new keys go straight under the new master key;
+        # otherwise re-stat secret.key so a rotation that just finished in
+        # another process is never missed
+        master = _read_key_file(PENDING_KEY_PATH) or _keyring.key(fresh=True)
+    header = bytes([WRAP_VERSION]) + master_key_id(master)
+    nonce = os.urandom(_NONCE_SIZE)
+    return header + nonce + _kek(master).encrypt(nonce, data_key, header + str(user_id).encode())
+
+
+def _read_key_file(path: str) -> Optional[bytes]:
+    try:
+        with open(path, 'rb') as f:
+            return f.read() or None
+    except OSError:
+        return None
+
+
+def _pending_master() -> Optional[bytes]:
+    return _read_key_file(PENDING_KEY_PATH)
+
+
+def unwrap_key(wrapped: bytes, user_id: int) -> bytes:
+    wrapped = bytes(wrapped)
+    if wrapped[0] != WRAP_VERSION:
+        raise ValueError(f'unknown wrapped key version {wrapped[0]}')
+    header, kid = wrapped[:1 + _KEY_ID_SIZE], wrapped[1:1 + _KEY_ID_SIZE]
+    master = _keyring.key()
+    if master_key_id(master) != kid:
+        # another process may have just finished a rotation
+        _keyring.reset()
+        master = _keyring.key()
+    if master_key_id(master) != kid:
+        # or one is in progress, or the key was wrapped just before one ended
+        for path in (PENDING_KEY_PATH, RETIRED_KEY_PATH):
+            master = _read_key_file(path)
+            if master is not None and master_key_id(master) == kid:
+                break
+        else:
+            raise ValueError(f'data key of user {user_id} is wrapped by an unknown master key')
+    body = wrapped[1 + _KEY_ID_SIZE:]
+    return _kek(master).decrypt(body[:_NONCE_SIZE], body[_NONCE_SIZE:], header + str(user_id).encode())
+
+
+class DataKeyCache:
+    """Bounded, TTL'd LRU of unwrapped data keys (as ``Ciphers``)."""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[int, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Optional[Ciphers]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[1] < time.monotonic():
+                self._entries.pop(user_id, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, user_id: int, ciphers: Ciphers) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[user_id] = (ciphers, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, user_id: int) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries),
+                    'max_entries': self.max_entries, 'ttl': self.ttl}
+
+
+data_keys = DataKeyCache()
+
+
+def user_key(user_id: int) -> Optional[Ciphers]:
+    """The user's data key, or None if they have none (master key is used)."""
+    c = data_keys.get(user_id)
+    if c is not None:
+        return c
+    wrapped = db.session.query(User.wrapped_key).filter(User.id == user_id).scalar()
+    if wrapped is None:
+        return None
+    c = Ciphers(unwrap_key(wrapped, user_id))
+    data_keys.put(user_id, c)
+    return c
+
+
+def ensure_user_key(user: User) -> None:
+    """Give a flushed ``user`` a data key if it has none (caller commits)."""
+    if user.wrapped_key is None:
+        user.wrapped_key = wrap_key(generate_data_key(), user.id)
+
+
+def index_key(user_id: int, purpose: str) -> bytes:
+    """Sub-key for keyed hashes of one user's data (e.g. the blind index).
+
+    Derived from the data key, so it survives master key rotation.
+    """
+    c = user_key(user_id)
+    return _derive(c.key if c is not None else _keyring.key(), purpose)
+
+
+# ---------------------------------------------------------------- batches
+
+def encrypt_for(user_ids: List[int], objs: list, binary: bool = True) -> list:
+    """Encrypt ``objs[i]`` under the data key of ``user_ids[i]`` (one pass
+    per user), as binary payloads or Fernet text tokens."""
+    out = [None] * len(objs)
+    groups = defaultdict(list)
+    for i, uid in enumerate(user_ids):
+        groups[uid].append(i)
+    for uid, idx in groups.items():
+        dk = user_key(uid)
+        plain = [objs[i] for i in idx]
+        for i, token in zip(idx, encrypt_payloads(plain, dk) if binary else encrypt_many(plain, dk)):
+            out[i] = token
+    return out
+
+
+def decrypt_for(user_ids: List[int], tokens: list) -> list:
+    """Decrypt ``tokens[i]`` owned by ``user_ids[i]``; any mix of key types."""
+    out = [None] * len(tokens)
+    groups = defaultdict(list)
+    for i, uid in enumerate(user_ids):
+        groups[uid].append(i)
+    for uid, idx in groups.items():
+        group = [tokens[i] for i in idx]
+        # only look the data key up when needed: master-key rows are read by
+        # migrations that run before the wrapped_key column exists
+        dk = user_key(uid) if any(uses_data_key(t) for t in group) else None
+        for i, value in zip(idx, decrypt_many(group, dk)):
+            out[i] = value
+    return out
+
+
+# --------------------------------------------------------------- rotation
+
+def backfill_user_keys(chunk_size: int = 500) -> int:
+    """Create data keys for users that have none; returns how many."""
+    count = 0
+    while True:
+        # ids only: this runs from migrations, before later ones add User columns
+        ids = [uid for (uid,) in db.session.query(User.id).filter(User.wrapped_key.is_(None))
+               .order_by(User.id).limit(chunk_size)]
+        if not ids:
+            return count
+        for uid in ids:
+            db.session.execute(db.update(User).where(User.id == uid)
+                               .values(wrapped_key=wrap_key(generate_data_key(), uid)))
+        db.session.commit()
+        count += len(ids)
+
+
+def count_master_key_rows() -> int:
+    """Vault rows whose ciphertext is still under the master key itself."""
+    kinds = ', '.join(f"'{k:02X}'" for k in (PAYLOAD_RAW, PAYLOAD_ZLIB))
+    sql = f'''SELECT
+        (SELECT count(*) FROM vault_item
+         WHERE (encrypted_data IS NOT NULL AND encrypted_data NOT LIKE 'k:%')
+            OR (encrypted_blob IS NOT NULL AND hex(substr(encrypted_blob, 1, 1)) IN ({kinds}))
+            OR (preview IS NOT NULL AND preview != '' AND preview NOT LIKE 'k:%')
+            OR (preview_blob IS NOT NULL AND hex(substr(preview_blob, 1, 1)) IN ({kinds})))
+      + (SELECT count(*) FROM vault_fields
+         WHERE (ciphertext IS NOT NULL AND ciphertext NOT LIKE 'k:%')
+            OR (value_blob IS NOT NULL AND hex(substr(value_blob, 1, 1)) IN ({kinds})))'''
+    return db.session.execute(text(sql)).scalar() or 0
+
+
+def _write_key_file(path: str, key: bytes) -> None:
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(key)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def rotate_master_key(chunk_size: int = 500) -> int:
+    """Replace ``secret.key`` with a new master key, rewrapping every user's
+    data key under it (committed per chunk). Safe to re-run after a crash:
+    the pending key is reused. Returns the number of rewrapped keys."""
+    backfill_user_keys(chunk_size)
+    remaining = count_master_key_rows()
+    if remaining:
+        raise RotationBlocked(f'{remaining} vault rows are still encrypted under the master key '
+                              '(run reencrypt.py first)')
+    new_master = _pending_master()
+    if new_master is None:
+        # stragglers of the previous rotation first: its retired key is
+        # about to be overwritten
+        _rewrap_all(_keyring.key(fresh=True), chunk_size)
+        new_master = Fernet.generate_key()
+        _write_key_file(PENDING_KEY_PATH, new_master)
+    count = _rewrap_all(new_master, chunk_size)
+    _write_key_file(RETIRED_KEY_PATH, _keyring.key(fresh=True))
+    os.replace(PENDING_KEY_PATH, KEY_PATH)
+    _keyring.reset()
+    return count
+
+
+def _rewrap_all(master: bytes, chunk_size: int) -> int:
+    # rewrap every data key not yet under ``master`` (committed per chunk)
+    target = master_key_id(master)
+    count = 0
+    last_id = 0
+    while True:
+        rows = (db.session.query(User.id, User.wrapped_key)
+                .filter(User.id > last_id, User.wrapped_key.isnot(None))
+                .order_by(User.id).limit(chunk_size).all())
+        if not rows:
+            return count
+        for uid, wrapped in rows:
+            if bytes(wrapped)[1:1 + _KEY_ID_SIZE] == target:
+                continue  # already there, e.g. done before an interruption
+            rewrapped = wrap_key(unwrap_key(wrapped, uid), uid, master)
+            db.session.execute(db.update(User).where(User.id == uid).values(wrapped_key=rewrapped))
+            count += 1
+        db.session.commit()
+        last_id = rows[-1].id
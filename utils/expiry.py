@@ -0,0 +1,47 @@
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+
+def infer_display_type(item_type, key):
+    k = (key or '').lower()
+    if 'passport' in k or 'license' in k or 'ssn' in k:
+        return 'Identity'
+    if 'card' in k or 'cvv' in k or (item_type and item_type.lower().startswith('credit') and 'expiry' in k):
+        return 'CreditCard'
+    return item_type or 'Item'
+
+
+def is_expiry_field(item_type, key) -> bool:
+    # determine if field looks like an expiry
+    key = (key or '').lower()
+    if 'expiry' not in key and 'exp' not in key:
+        return False
+    if key == 'expiry':
+        kind = (item_type or '').lower()
+        return kind.startswith('credit') or kind == 'identity'
+    return True
+
+
+def parse_expiry(value) -> Optional[datetime]:
+    # accept full ISO dates as well as month inputs (YYYY-MM)
+    try:
+        return datetime.fromisoformat(value)
+    except Exception:
+        try:
+            return datetime.fromisoformat(value + '-01')
+        except Exception:
+            return None
+
+
+def extract_expiry_fields(item_type, data: dict) -> List[Tuple[str, datetime, str]]:
+    """Return ``(field, expires_on, display_type)`` for every expiry-like
+    field in a decrypted item payload."""
+    out = []
+    for k, v in (data or {}).items():
+        if not v or not is_expiry_field(item_type, k):
+            continue
+        exp_date = parse_expiry(v)
+        if not exp_date:
+            continue
+        out.append((k, exp_date, infer_display_type(item_type, (k or '').lower())))
+    return out
@@ -0,0 +1,120 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+def fingerprint(item) -> str:
+    """Hash of the stored ciphertext; changes whenever the item is re-saved.
+
+    The preview is re-encrypted on every save, so it also versions
+    field-level items whose payload lives in another table.
+    """
+    h = hashlib.sha256()
+    h.update((item.encrypted_data or '').encode('utf-8'))
+    h.update(b'\0')
+    h.update(getattr(item, 'encrypted_blob', None) or b'')
+    h.update(b'\0')
+    h.update((getattr(item, 'preview', None) or '').encode('utf-8'))
+    h.update(b'\0')
+    h.update(getattr(item, 'preview_blob', None) or b'')
+    return h.hexdigest()
+
+
+class _Entry:
+    __slots__ = ('user_id', 'item_id', 'data', 'fields', 'expires_at')
+
+    def __init__(self, user_id, item_id, expires_at):
+        self.user_id = user_id
+        self.item_id = item_id
+        self.data: Optional[dict] = None      # full payload once known
+        self.fields: Dict[str, Any] = {}      # normalized name -> value
+        self.expires_at = expires_at
+
+
+class DecryptedItemCache:
+    """Bounded, TTL'd LRU cache of decrypted item payloads.
+
+    Keys are (user_id, item_id, ciphertext fingerprint), so an edited item
+    can never be served stale. Entries are dropped on logout / inactivity
+    lock (``clear_user``) and on edit / delete (``invalidate_item``).
+    Decrypted secrets only stay in memory for ``ttl`` seconds.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 120.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[Tuple[int, int, str], _Entry]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, item):
+        return (item.user_id, item.id, fingerprint(item))
+
+    def _lookup(self, key) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _entry_for(self, key) -> _Entry:
+        entry = self._lookup(key)
+        if entry is None:
+            entry = self._entries[key] = _Entry(key[0], key[1], time.monotonic() + self.ttl)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def get_item(self, item) -> Optional[dict]:
+        with self._lock:
+            entry = self._lookup(self._key(item))
+            if entry is not None and entry.data is not None:
+                self.hits += 1
+                return dict(entry.data)
+            self.misses += 1
+            return None
+
+    def put_item(self, item, data: dict) -> None:
+        with self._lock:
+            entry = self._entry_for(self._key(item))
+            entry.data = dict(data)
+            entry.fields = {str(k).lower(): v for k, v in data.items()}
+
+    def get_field(self, item, name: str) -> Tuple[bool, Any]:
+        # (found, value); a complete payload also answers for absent fields
+        with self._lock:
+            entry = self._lookup(self._key(item))
+            if entry is not None and (name in entry.fields or entry.data is not None):
+                self.hits += 1
+                return True, entry.fields.get(name)
+            self.misses += 1
+            return False, None
+
+    def put_field(self, item, name: str, value: Any) -> None:
+        with self._lock:
+            self._entry_for(self._key(item)).fields[name] = value
+
+    def invalidate_item(self, item_id: int) -> None:
+        with self._lock:
+            for key in [k for k in self._entries if k[1] == item_id]:
+                del self._entries[key]
+
+    def clear_user(self, user_id: int) -> None:
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == user_id]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries),
+                    'max_entries': self.max_entries, 'ttl': self.ttl}
@@ -0,0 +1,97 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from models import db
+from models.user import User
+from models.vault_item import VaultItem
+from models.expiry_index import ExpiryIndex
+from models.notification_key import NotificationKey
+from models.unmask_token import UnmaskToken
+from patterns.observer import BookingSubject, UserObserver
+
+# How far ahead an expiry counts as "will expire soon"
+EXPIRY_HORIZON = timedelta(days=30)
+
+
+def _expiry_key(ex: ExpiryIndex, state: str) -> str:
+    # the date is part of the key so editing an expiry re-arms the notification
+    return f'expiry:{ex.item_id}:{ex.field}:{state}:{ex.expires_on.date().isoformat()}'
+
+
+def _existing_keys(keys, chunk_size: int = 500) -> set:
+    found = set()
+    for i in range(0, len(keys), chunk_size):
+        chunk = keys[i:i + chunk_size]
+        found.update(k for (k,) in db.session.query(NotificationKey.key).filter(NotificationKey.key.in_(chunk)))
+    return found
+
+
+def notify_expiries(now: datetime = None, user_id: int = None) -> int:
+    """Notify users about expired / soon-to-expire items.
+
+    Reads only the plaintext expiry index and writes at most one
+    notification per (item, field, state). Returns the number of new
+    notifications.
+    """
+    now = now or datetime.utcnow()
+    # only rows whose state moved past the one already reported: the
+    # backlog of expiries notified long ago is never read again
+    q = (db.session.query(ExpiryIndex, VaultItem.title)
+         .join(VaultItem, VaultItem.id == ExpiryIndex.item_id)
+         .filter(db.or_(db.and_(ExpiryIndex.notified_state.is_(None),
+                                ExpiryIndex.expires_on < now + EXPIRY_HORIZON),
+                        db.and_(ExpiryIndex.notified_state == 'soon', ExpiryIndex.expires_on < now))))
+    if user_id is not None:
+        q = q.filter(ExpiryIndex.user_id == user_id)
+    rows = q.order_by(ExpiryIndex.user_id, ExpiryIndex.item_id, ExpiryIndex.id).all()
+
+    pending = []
+    for ex, title in rows:
+        if ex.expires_on < now:
+            state, msg = 'expired', f'Item "{title}" ({ex.display_type}) has expired ({ex.field}).'
+        else:
+            state, msg = 'soon', f'Item "{title}" ({ex.display_type}) will expire soon ({ex.field}).'
+        pending.append((ex.user_id, ex.id, state, _expiry_key(ex, state), msg))
+    if not pending:
+        return 0
+
+    seen = _existing_keys([key for _, _, _, key, _ in pending])
+    # reported before this column existed, or by a run that crashed after
+    # its commit: just record the state
+    ExpiryIndex.mark_notified([(ex_id, state) for _, ex_id, state, key, _ in pending if key in seen])
+    db.session.commit()
+    pending = [p for p in pending if p[3] not in seen]
+    users = {u.id: u for u in User.query.filter(User.id.in_({p[0] for p in pending}))}
+
+    by_user = defaultdict(list)
+    for uid, ex_id, state, key, msg in pending:
+        by_user[uid].append((ex_id, state, key, msg))
+
+    sent = 0
+    for uid, entries in by_user.items():
+        user = users.get(uid)
+        if not user:
+            continue
+        subj = BookingSubject()
+        subj.attach(UserObserver(user))
+        # keys, notifications and the reported states commit together in
+        # one transaction; if another worker claimed a key first the whole
+        # batch is retried on the next run
+        with subj.batch():
+            for _, _, key, msg in entries:
+                db.session.add(NotificationKey(key=key, user_id=uid))
+                subj.status_changed(msg)
+            ExpiryIndex.mark_notified([(ex_id, state) for ex_id, state, _, _ in entries])
+        if subj.delivered:
+            sent += len(entries)
+    return sent
+
+
+def build_scheduler(app) -> 'Scheduler':
+    """Scheduler with the app's periodic jobs registered (not started)."""
+    from utils.scheduler import Scheduler
+    from utils.signed_token import sweep_used_tokens
+    return (Scheduler(app)
+            .add_job('expiry-notifications', notify_expiries, app.config['EXPIRY_SCAN_INTERVAL'])
+            .add_job('unmask-token-purge', UnmaskToken.cleanup_expired, 60)
+            .add_job('used-token-sweep', sweep_used_tokens, 30))
@@ -0,0 +1,290 @@
+"""In-process metrics with Prometheus text exposition.
+
+Histograms and counters live in one ``Registry`` per process (``metrics``).
+They are fed by:
+
+* the request hooks in ``app.py``: latency per route, method and status;
+* ``instrument_engine``: SQLAlchemy cursor events, i.e. query count and
+  time per statement kind;
+* ``timed`` on the encrypt/decrypt helpers of ``utils.crypto``;
+* the scheduler: job durations and failures.
+
+Cache and pool statistics are read only when ``/metrics`` is scraped,
+through ``Registry.add_collector``.
+
+Besides the process-wide totals, the time spent in the database, crypto
+and templates is also summed per request thread (``request_timings``),
+which is what the optional ``Server-Timing`` header reports.
+
+With several server worker processes each one has its own registry, so
+scrape every worker or run one worker per scrape target.
+"""
+import bisect
+import functools
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# seconds; roughly Prometheus' defaults with more resolution below 10 ms
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _number(v) -> str:
+    if v == float('inf'):
+        return '+Inf'
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, v in sorted(self._values.items()):
+                lines.append(f'{self.name}{_labels(self.label_names, labels)} {_number(v)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(labels)
+            if s is None:
+                s = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            s[0][i] += 1
+            s[1] += value
+            s[2] += 1
+
+    def snapshot(self, *labels) -> Optional[Tuple[int, float]]:
+        """(count, sum) of one series."""
+        with self._lock:
+            s = self._series.get(labels)
+            return (s[2], s[1]) if s else None
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._series.items())
+        for labels, (counts, total, count) in series:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f'{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.label_names, labels)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.label_names, labels)} {count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.enabled = True
+        self._metrics: list = []
+        self._collectors: List[Tuple[str, str, Callable[[], dict]]] = []
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+        m = Counter(name, help, labels)
+        self._metrics.append(m)
+        return m
+
+    def histogram(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        m = Histogram(name, help, labels, buckets)
+        self._metrics.append(m)
+        return m
+
+    def add_collector(self, prefix: str, help: str, stats: Callable[[], dict]) -> None:
+        """Export the numeric values of ``stats()`` as ``<prefix>_<key>`` gauges
+        when scraped (e.g. ``item_cache.stats``)."""
+        self._collectors.append((prefix, help, stats))
+
+    def render(self) -> str:
+        lines = []
+        for m in self._metrics:
+            lines.extend(m.render())
+        for prefix, help, stats in self._collectors:
+            for key, value in sorted(stats().items()):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f'{prefix}_{key}'
+                lines.extend((f'# HELP {name} {help}: {key}', f'# TYPE {name} gauge', f'{name} {_number(value)}'))
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Registry()
+
+http_requests = metrics.histogram('mypass_http_request_duration_seconds', 'Request latency by route',
+                                  ('route', 'method', 'status'))
+db_queries = metrics.histogram('mypass_db_query_duration_seconds', 'SQL statement latency by statement kind',
+                               ('statement',))
+crypto_calls = metrics.histogram('mypass_crypto_duration_seconds', 'Time per encrypt/decrypt helper call',
+                                 ('operation',))
+crypto_items = metrics.counter('mypass_crypto_items_total', 'Objects encrypted or decrypted', ('operation',))
+template_renders = metrics.histogram('mypass_template_render_duration_seconds', 'Template rendering time',
+                                     ('template',))
+job_runs = metrics.histogram('mypass_job_duration_seconds', 'Scheduled job run time', ('job',),
+                             buckets=DEFAULT_BUCKETS + (30.0, 60.0))
+job_failures = metrics.counter('mypass_job_failures_total', 'Scheduled job runs that raised', ('job',))
+
+
+# ------------------------------------------------------- per-request sums
+
+class _RequestTimings(threading.local):
+    def __init__(self):
+        self.active = False
+        self.totals: Dict[str, List[float]] = {}
+
+
+request_timings = _RequestTimings()
+
+
+def start_request() -> None:
+    request_timings.active = True
+    request_timings.totals = {}
+
+
+def finish_request() -> Dict[str, List[float]]:
+    """{'db': [seconds, calls], ...} for the request on this thread."""
+    totals = request_timings.totals
+    request_timings.active = False
+    request_timings.totals = {}
+    return totals
+
+
+def _add_request_time(kind: str, elapsed: float) -> None:
+    if request_timings.active:
+        t = request_timings.totals.setdefault(kind, [0.0, 0])
+        t[0] += elapsed
+        t[1] += 1
+
+
+def server_timing(totals: Dict[str, List[float]], total: float) -> str:
+    """A ``Server-Timing`` header value (durations in milliseconds)."""
+    parts = [f'{kind};dur={seconds * 1000:.1f};desc="{int(calls)} calls"'
+             for kind, (seconds, calls) in sorted(totals.items())]
+    parts.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(parts)
+
+
+# ------------------------------------------------------------------ hooks
+
+def count_items(args: tuple) -> int:
+    # for batch helpers whose first argument is the sequence processed
+    try:
+        return len(args[0])
+    except (TypeError, IndexError):
+        return 1
+
+
+def timed(operation: str, count: Callable = None):
+    """Decorator for crypto helpers: call latency, plus ``count(args)``
+    objects processed (one by default)."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            if not metrics.enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                crypto_calls.observe(elapsed, operation)
+                crypto_items.inc(operation, amount=count(args) if count else 1)
+                _add_request_time('crypto', elapsed)
+        return inner
+    return wrap
+
+
+def _statement_kind(statement: str) -> str:
+    word = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ''
+    return word if word in ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'PRAGMA') else 'OTHER'
+
+
+def instrument_engine(engine) -> None:
+    """Time every SQL statement run through ``engine``."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('mypass_query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('mypass_query_start')
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        if metrics.enabled:
+            db_queries.observe(elapsed, _statement_kind(statement))
+            _add_request_time('db', elapsed)
+
+    @event.listens_for(engine, 'handle_error')
+    def _error(context):
+        starts = context.connection.info.get('mypass_query_start') if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+
+def instrument_templates(app) -> None:
+    """Time template rendering (Flask's render signals)."""
+    from flask import before_render_template, template_rendered
+    starts = threading.local()
+
+    def _before(sender, template, context, **extra):
+        if not hasattr(starts, 'stack'):
+            starts.stack = []
+        starts.stack.append(time.perf_counter())
+
+    def _after(sender, template, context, **extra):
+        stack = getattr(starts, 'stack', None)
+        if not stack:
+            return
+        elapsed = time.perf_counter() - stack.pop()
+        if metrics.enabled:
+            template_renders.observe(elapsed, template.name or 'inline')
+            _add_request_time('render', elapsed)
+
+    before_render_template.connect(_before, app, weak=False)
+    template_rendered.connect(_after, app, weak=False)
+
+
+def observe_job(name: str, elapsed: float, failed: bool = False) -> None:
+    if metrics.enabled:
+        job_runs.observe(elapsed, name)
+        if failed:
+            job_failures.inc(name)
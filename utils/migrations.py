@@ -0,0 +1,172 @@
+"""Small versioned schema migration runner.
+
+`db.create_all()` only creates missing tables, so changes to existing
+tables (new indexes, columns, data backfills) are applied here. The schema
+version is kept in SQLite's ``PRAGMA user_version``; every migration runs
+once, in order, and the version is bumped in the migration's final commit.
+
+Migrations are not atomic. Backfills (1, 3, 7, 8) commit per chunk so a
+large vault never holds the write lock for long, which means a crash
+leaves some rows filled while ``user_version`` still names the previous
+migration; the next start runs that migration again from the beginning.
+Every migration must therefore be safe to re-run over partial data (skip
+or overwrite what is already done), and idempotent anyway because a
+freshly created database already has the current schema.
+"""
+from typing import Callable, List, NamedTuple
+
+from sqlalchemy import text
+
+from models import db
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    func: Callable[[], None]
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, description: str):
+    def register(func):
+        MIGRATIONS.append(Migration(version, description, func))
+        return func
+    return register
+
+
+def _execute(sql: str) -> None:
+    db.session.execute(text(sql))
+
+
+def has_column(table: str, column: str) -> bool:
+    # also used by backfills that must cope with schemas from older migrations
+    rows = db.session.execute(text(f'PRAGMA table_info({table})')).all()
+    return any(r[1] == column for r in rows)
+
+
+def _add_column(table: str, column: str, ddl: str) -> None:
+    if not has_column(table, column):
+        _execute(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}')
+
+
+def current_version() -> int:
+    return db.session.execute(text('PRAGMA user_version')).scalar() or 0
+
+
+def run_migrations() -> List[Migration]:
+    """Apply pending migrations; must run inside an app context."""
+    version = current_version()
+    applied = []
+    for m in sorted(MIGRATIONS, key=lambda m: m.version):
+        if m.version <= version:
+            continue
+        try:
+            m.func()
+            _execute(f'PRAGMA user_version = {int(m.version)}')
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        applied.append(m)
+    return applied
+
+
+@migration(1, 'backfill expiry index for existing vault items')
+def _backfill_expiry_index():
+    from models.expiry_index import ExpiryIndex
+    ExpiryIndex.backfill()
+
+
+@migration(2, 'composite indexes for vault listing and notifications')
+def _composite_indexes():
+    _execute('CREATE INDEX IF NOT EXISTS ix_vault_item_user_type_title ON vault_item (user_id, item_type, title)')
+    _execute('CREATE INDEX IF NOT EXISTS ix_notification_user_read_ts ON notification (user_id, is_read, timestamp)')
+
+
+@migration(3, 'build blind search index for existing vault items')
+def _backfill_search_index():
+    from models.search_token import SearchToken
+    SearchToken.backfill()
+
+
+@migration(4, 'non-null titles and (user_id, title) index for keyset pagination')
+def _title_keyset_index():
+    # NULL never compares equal, which would break (title, id) cursors
+    _execute("UPDATE vault_item SET title = '' WHERE title IS NULL")
+    _execute('CREATE INDEX IF NOT EXISTS ix_vault_item_user_title ON vault_item (user_id, title)')
+
+
+@migration(5, 'encrypted preview snapshot column (backfilled lazily on read)')
+def _preview_column():
+    _add_column('vault_item', 'preview', 'TEXT')
+
+
+@migration(6, 'binary payload columns for vault items and fields')
+def _binary_payload_columns():
+    _add_column('vault_item', 'encrypted_blob', 'BLOB')
+    if has_column('vault_fields', 'value_blob'):
+        return
+    # SQLite can't drop NOT NULL from `ciphertext` in place: rebuild the table
+    _execute('''CREATE TABLE vault_fields_new (
+        id INTEGER NOT NULL PRIMARY KEY,
+        item_id INTEGER NOT NULL,
+        name VARCHAR(128) NOT NULL,
+        label VARCHAR(128) NOT NULL,
+        position INTEGER NOT NULL,
+        ciphertext TEXT,
+        value_blob BLOB,
+        CONSTRAINT uq_vault_fields_item_name UNIQUE (item_id, name))''')
+    _execute('''INSERT INTO vault_fields_new (id, item_id, name, label, position, ciphertext)
+                SELECT id, item_id, name, label, position, ciphertext FROM vault_fields''')
+    _execute('DROP TABLE vault_fields')
+    _execute('ALTER TABLE vault_fields_new RENAME TO vault_fields')
+
+
+@migration(7, 'per-user data keys (envelope encryption); rebuild blind index under them')
+def _user_data_keys():
+    from models.search_token import SearchToken
+    from utils.envelope import backfill_user_keys
+    _add_column('user', 'wrapped_key', 'BLOB')
+    backfill_user_keys()
+    SearchToken.backfill()
+
+
+@migration(8, 'password reuse / strength audit index for existing vault items')
+def _backfill_password_audit():
+    from models.password_audit import PasswordAudit
+    PasswordAudit.backfill()
+
+
+@migration(9, 'cached unread notification count per user')
+def _unread_notification_counter():
+    from models.notification import Notification
+    _add_column('user', 'unread_notifications', 'INTEGER NOT NULL DEFAULT 0')
+    _execute('CREATE INDEX IF NOT EXISTS ix_notification_user_read_id ON notification (user_id, is_read, id)')
+    Notification.recount()
+
+
+@migration(10, 'per-user change sequence and item revisions for delta sync')
+def _change_sequence():
+    _add_column('user', 'change_seq', 'INTEGER NOT NULL DEFAULT 0')
+    _add_column('vault_item', 'revision', 'INTEGER NOT NULL DEFAULT 0')
+    # existing items get distinct revisions 1..n per user, in id order, so a
+    # client starting from since=0 receives all of them
+    _execute("""UPDATE vault_item SET revision = r.n FROM
+                (SELECT id, row_number() OVER (PARTITION BY user_id ORDER BY id) AS n FROM vault_item) AS r
+                WHERE vault_item.id = r.id AND vault_item.revision = 0""")
+    _execute('CREATE INDEX IF NOT EXISTS ix_vault_item_user_revision ON vault_item (user_id, revision)')
+    _execute("""UPDATE user SET change_seq = max(change_seq,
+                (SELECT coalesce(max(revision), 0) FROM vault_item WHERE vault_item.user_id = user.id))""")
+
+
+@migration(11, 'binary preview snapshot column (filled on save and by reencrypt.py)')
+def _preview_blob_column():
+    _add_column('vault_item', 'preview_blob', 'BLOB')
+
+
+@migration(12, 'reported expiry state, so scans skip already notified rows')
+def _expiry_notified_state():
+    _add_column('expiry_index', 'notified_state', 'VARCHAR(16)')
+    _execute('CREATE INDEX IF NOT EXISTS ix_expiry_index_state_expires ON expiry_index (notified_state, expires_on)')
@@ -0,0 +1,69 @@
+import base64
+import json
+from typing import Any, List, NamedTuple, Optional, Sequence
+
+from sqlalchemy import tuple_
+
+
+class Page(NamedTuple):
+    items: List[Any]
+    next_cursor: Optional[str]
+    prev_cursor: Optional[str]
+
+
+def encode_cursor(values: Sequence) -> str:
+    raw = json.dumps(list(values), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(cursor: Optional[str], size: int) -> Optional[list]:
+    # Invalid or tampered cursors simply restart from the first page
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except Exception:
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    # only scalars can be bound as SQL parameters
+    if not all(v is None or isinstance(v, (str, int, float)) for v in values):
+        return None
+    return values
+
+
+def keyset_page(query, columns, descending: bool = False, limit: int = 50,
+                after: Optional[str] = None, before: Optional[str] = None) -> Page:
+    """Fetch one page of ``query`` ordered by ``columns`` (which must be
+    unique together, e.g. ``(title, id)``) using keyset pagination.
+
+    ``after`` continues forwards from a cursor, ``before`` goes back.
+    Cost is independent of how deep the page is: there is no OFFSET.
+    """
+    def key(row):
+        return [getattr(row, c.key) for c in columns]
+
+    cols = tuple_(*columns)
+    forward = [c.desc() if descending else c.asc() for c in columns]
+    backward = [c.asc() if descending else c.desc() for c in columns]
+
+    before_vals = decode_cursor(before, len(columns))
+    if before_vals is not None:
+        cmp = cols > tuple_(*before_vals) if descending else cols < tuple_(*before_vals)
+        rows = query.filter(cmp).order_by(*backward).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit][::-1]
+        prev_cursor = encode_cursor(key(rows[0])) if has_more and rows else None
+        next_cursor = encode_cursor(key(rows[-1])) if rows else None
+        return Page(rows, next_cursor, prev_cursor)
+
+    after_vals = decode_cursor(after, len(columns))
+    if after_vals is not None:
+        cmp = cols < tuple_(*after_vals) if descending else cols > tuple_(*after_vals)
+        query = query.filter(cmp)
+    rows = query.order_by(*forward).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(key(rows[-1])) if has_more else None
+    prev_cursor = encode_cursor(key(rows[0])) if after_vals is not None and rows else None
+    return Page(rows, next_cursor, prev_cursor)
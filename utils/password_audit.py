@@ -0,0 +1,101 @@
+"""Keyed fingerprints and strength scores of stored passwords.
+
+Each password field of a vault item is reduced to a truncated HMAC under a
+per-user key derived from the user's data key (see utils/envelope.py), and
+to a 0-4 strength score. Equal passwords of one user get equal digests, so
+reuse is a GROUP BY over the ``password_audit`` table, with no decryption
+and no pairwise comparisons. Digests of different users never match, and
+guessing a password from its digest needs the data key, like decrypting
+the item itself.
+"""
+import hmac
+import math
+import string
+from typing import List, Optional, Tuple
+
+from utils.envelope import index_key
+
+# scores below this are reported as weak
+WEAK_SCORE = 2
+SCORE_LABELS = ('very weak', 'weak', 'fair', 'strong', 'very strong')
+# entropy (bits) needed for scores 1..4
+SCORE_BITS = (28, 36, 60, 80)
+
+# well-known base words; a password built on one is only as strong as its extras
+COMMON_WORDS = frozenset((
+    'password', 'qwerty', 'qwertyuiop', 'asdfgh', 'zxcvbn', 'letmein', 'welcome', 'admin',
+    'login', 'master', 'monkey', 'dragon', 'football', 'baseball', 'iloveyou', 'sunshine', 'princess',
+    'shadow', 'superman', 'trustno', 'abc', 'secret', 'changeme', 'default', 'mypass', 'hunter',
+))
+_SEQUENCES = (string.ascii_lowercase, string.digits, 'qwertyuiopasdfghjklzxcvbnm')
+_LEET = str.maketrans('@4310$5!7', 'aaeiosstt')
+_AFFIXES = string.digits + string.punctuation + ' '
+
+
+def is_password_field(key) -> bool:
+    key = (key or '').lower()
+    return 'password' in key or 'passphrase' in key
+
+
+def password_fields(data: dict) -> List[Tuple[str, str]]:
+    """(field, value) pairs of the non-empty password fields of a payload."""
+    return [(k, str(v)) for k, v in (data or {}).items() if v and is_password_field(k)]
+
+
+def _pool_size(pw: str) -> int:
+    size = 0
+    if any(c.islower() for c in pw):
+        size += 26
+    if any(c.isupper() for c in pw):
+        size += 26
+    if any(c.isdigit() for c in pw):
+        size += 10
+    if any(not c.isalnum() for c in pw):
+        size += 33
+    return size or 1
+
+
+def _effective_length(pw: str) -> float:
+    # runs of one character and keyboard/alphabet sequences add little
+    length = 0.0
+    for i, c in enumerate(pw):
+        prev = pw[i - 1].lower() if i else ''
+        pair = prev + c.lower()
+        if prev == c.lower() or (len(pair) == 2 and any(pair in seq for seq in _SEQUENCES)):
+            length += 0.25
+        else:
+            length += 1
+    return length
+
+
+def estimate_bits(pw: str) -> float:
+    """Rough guessing entropy of ``pw`` in bits."""
+    if not pw:
+        return 0.0
+    bits = _effective_length(pw) * math.log2(_pool_size(pw))
+    # a common word (maybe in leetspeak) with digits/symbols around it
+    core = pw.lower().strip(_AFFIXES)
+    if core in COMMON_WORDS or core.translate(_LEET) in COMMON_WORDS:
+        extras = len(pw) - len(core)
+        bits = min(bits, 10 + extras * math.log2(43) / 2)
+    return bits
+
+
+def strength_score(pw: str) -> int:
+    """0 (very weak) to 4 (very strong)."""
+    bits = estimate_bits(pw)
+    return sum(1 for threshold in SCORE_BITS if bits >= threshold)
+
+
+def password_digest(user_id: int, password: str, hkey: Optional[bytes] = None) -> str:
+    hkey = hkey or index_key(user_id, 'password-audit')
+    return hmac.digest(hkey, password.encode('utf-8'), 'sha256').hex()[:32]
+
+
+def item_password_entries(user_id: int, data: dict) -> List[Tuple[str, str, int]]:
+    """(field, digest, score) for every password field of an item payload."""
+    fields = password_fields(data)
+    if not fields:
+        return []
+    hkey = index_key(user_id, 'password-audit')
+    return [(k, password_digest(user_id, v, hkey), strength_score(v)) for k, v in fields]
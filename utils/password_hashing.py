@@ -0,0 +1,161 @@
+"""Account password hashing on a small, bounded pool of threads.
+
+Login, registration and recovery hash with a deliberately slow KDF. Running
+that inline lets a burst of logins occupy every request thread, so the
+hashes run on their own executor instead. ``hashlib.scrypt`` and
+``pbkdf2_hmac`` release the GIL, so the pool uses real cores while the
+request threads only wait. At most ``workers + max_queue`` hashes are
+accepted at once; past that ``HashingBusy`` is raised and the app answers
+503 instead of queueing without limit.
+
+The cost is a werkzeug method string (``scrypt:n:r:p`` or
+``pbkdf2:sha256:iterations``). It is either pinned by configuration or
+calibrated at startup to a target latency, and never set below werkzeug's
+defaults. Hashes stored with a cheaper cost are upgraded on the next
+successful login (``needs_rehash``).
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+# werkzeug's own defaults double as the minimum cost
+DEFAULT_METHODS = {
+    'scrypt': 'scrypt:32768:8:1',
+    'pbkdf2': f'pbkdf2:sha256:{DEFAULT_PBKDF2_ITERATIONS}',
+}
+# scrypt needs 128 * n * r bytes per hash: 2**17 * 8 is 128 MiB
+MAX_SCRYPT_N = 2 ** 17
+MAX_PBKDF2_ITERATIONS = 10_000_000
+# calibrated pbkdf2 costs are rounded to this, so workers that measure
+# slightly differently still agree and don't keep rehashing each other's work
+PBKDF2_STEP = 100_000
+
+
+class HashingBusy(RuntimeError):
+    """The hashing queue is full; the request should be retried later."""
+
+
+def parse_method(stored: str) -> Tuple[str, str, int]:
+    """(algorithm, variant, cost) of a werkzeug hash or method string.
+
+    ``variant`` is what must match for costs to be comparable (the digest
+    for pbkdf2, r and p for scrypt).
+    """
+    name, *args = stored.split('$', 1)[0].split(':')
+    if name == 'scrypt':
+        n, r, p = (int(a) for a in args) if args else (2 ** 15, 8, 1)
+        return name, f'{r}:{p}', n
+    if name == 'pbkdf2':
+        digest = args[0] if args else 'sha256'
+        iterations = int(args[1]) if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return name, digest, iterations
+    return name, ':'.join(args), 0
+
+
+def _method(name: str, variant: str, cost: int) -> str:
+    if name == 'scrypt':
+        return f'scrypt:{cost}:{variant}'
+    return f'pbkdf2:{variant}:{cost}'
+
+
+def _time_hash(method: str, rounds: int = 2) -> float:
+    # best of a few runs, in seconds
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        generate_password_hash('calibration', method)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def calibrate(algorithm: str = 'scrypt', target_ms: float = 250) -> str:
+    """Method string whose hash takes about ``target_ms`` on this machine."""
+    name, variant, floor = parse_method(DEFAULT_METHODS[algorithm])
+    elapsed = _time_hash(DEFAULT_METHODS[algorithm])
+    scale = (target_ms / 1000.0) / elapsed if elapsed else 1.0
+    if name == 'scrypt':
+        # n must be a power of two
+        n = floor
+        while n * 2 <= MAX_SCRYPT_N and scale >= 2:
+            n *= 2
+            scale /= 2
+        return _method(name, variant, n)
+    iterations = int(floor * scale) // PBKDF2_STEP * PBKDF2_STEP
+    return _method(name, variant, min(max(iterations, floor), MAX_PBKDF2_ITERATIONS))
+
+
+class PasswordHasher:
+    """Hashes and verifies passwords on a bounded thread pool."""
+
+    def __init__(self, method: str = DEFAULT_METHODS['scrypt'], workers: int = 2, max_queue: int = 16):
+        self.method = method
+        self.workers = workers
+        self.max_queue = max_queue
+        self.hashed = 0
+        self.verified = 0
+        self.rejected = 0
+        self._pending = 0
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def configure(self, method: str = None, algorithm: str = 'scrypt', target_ms: float = 0,
+                  workers: int = None, max_queue: int = None) -> str:
+        """Pin ``method``, or calibrate one for ``algorithm`` (``target_ms`` > 0),
+        or fall back to werkzeug's default for it. Returns the method used."""
+        if not method:
+            method = calibrate(algorithm, target_ms) if target_ms > 0 else DEFAULT_METHODS[algorithm]
+        with self._lock:
+            self.method = method
+            if workers is not None and workers != self.workers and self._pool is not None:
+                self._pool.shutdown(wait=False)
+                self._pool = None
+            self.workers = workers if workers is not None else self.workers
+            self.max_queue = max_queue if max_queue is not None else self.max_queue
+        return method
+
+    def _done(self, _future) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    def _run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise HashingBusy('password hashing queue is full')
+            if self._pool is None:
+                # created lazily: CLIs that never hash don't start threads,
+                # and processes forked later don't inherit a live pool
+                self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='pwhash')
+            self._pending += 1
+            future = self._pool.submit(fn, *args)
+        future.add_done_callback(self._done)
+        return future.result()
+
+    def hash(self, password: str) -> str:
+        result = self._run(generate_password_hash, password, self.method)
+        self.hashed += 1
+        return result
+
+    def verify(self, stored: str, password: str) -> bool:
+        result = self._run(check_password_hash, stored, password)
+        self.verified += 1
+        return result
+
+    def needs_rehash(self, stored: str) -> bool:
+        """True if ``stored`` uses another algorithm or a lower cost than now."""
+        current = parse_method(self.method)
+        name, variant, cost = parse_method(stored)
+        return (name, variant) != current[:2] or cost < current[2]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'method': self.method, 'workers': self.workers, 'max_queue': self.max_queue,
+                    'pending': self._pending, 'hashed': self.hashed, 'verified': self.verified,
+                    'rejected': self.rejected}
+
+
+hasher = PasswordHasher()
@@ -0,0 +1,197 @@
+"""Opt-in profiling of single live requests.
+
+``RequestProfiler`` wraps the WSGI app. A request is profiled only when
+profiling is enabled and the request carries the profiling token, either
+in the ``X-Profile`` header or the ``_profile`` query parameter. There is
+no admin role in MyPass, so whoever holds the token is the admin. Every
+other request goes straight through, at the cost of one header lookup.
+
+Two profilers are available:
+
+* ``cprofile``: deterministic, exact call counts. It slows the profiled
+  request down a lot and writes a ``.prof`` file for ``pstats`` or
+  snakeviz.
+* ``sample``: a thread records the request thread's stack every
+  ``interval`` seconds. It is cheap and writes collapsed stacks
+  (``.folded``) for flamegraph.pl or speedscope.
+
+Profiling can never turn into a load problem of its own. Only one request
+is profiled at a time, at most ``max_per_window`` per ``window`` seconds,
+and only the newest ``keep`` files are kept. A request over the limit is
+served normally with ``X-Profile: rate-limited``. The response body is
+produced inside the profile, so streamed responses are buffered.
+"""
+import cProfile
+import hmac
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Optional
+from urllib.parse import parse_qs
+
+PROFILE_MODES = ('cprofile', 'sample')
+
+
+class RateLimiter:
+    """At most ``max_events`` per sliding ``window`` seconds."""
+
+    def __init__(self, max_events: int, window: float):
+        self.max_events = max_events
+        self.window = window
+        self._events = deque()
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            while self._events and self._events[0] <= now - self.window:
+                self._events.popleft()
+            if len(self._events) >= self.max_events:
+                return False
+            self._events.append(now)
+            return True
+
+
+class StackSampler:
+    """Samples one thread's Python stack on a background thread."""
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='mypass-sampler', daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self) -> 'StackSampler':
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path: str) -> None:
+        # collapsed-stack format: "frame;frame;frame count"
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+class RequestProfiler:
+    """WSGI middleware that profiles requests carrying the profiling token."""
+
+    def __init__(self, wsgi_app, token: str, directory: str, mode: str = 'cprofile',
+                 max_per_window: int = 6, window: float = 60.0, keep: int = 100, interval: float = 0.005):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f'unknown profile mode {mode!r}')
+        self.wsgi_app = wsgi_app
+        self.token = token.encode('utf-8')
+        self.directory = directory
+        self.mode = mode
+        self.keep = keep
+        self.interval = interval
+        self.limiter = RateLimiter(max_per_window, window)
+        self._busy = threading.Lock()
+        self._seq = 0
+
+    def _requested(self, environ) -> bool:
+        sent = environ.get('HTTP_X_PROFILE')
+        if sent is None and '_profile' in environ.get('QUERY_STRING', ''):
+            sent = (parse_qs(environ['QUERY_STRING']).get('_profile') or [''])[0]
+        return bool(sent) and hmac.compare_digest(sent.encode('utf-8'), self.token)
+
+    def __call__(self, environ, start_response):
+        if not self._requested(environ):
+            return self.wsgi_app(environ, start_response)
+        # one profiled request at a time, and only a few per window
+        if not self._busy.acquire(blocking=False):
+            return self.wsgi_app(environ, self._with_header(start_response, 'busy'))
+        try:
+            if not self.limiter.allow():
+                return self.wsgi_app(environ, self._with_header(start_response, 'rate-limited'))
+            return self._profile(environ, start_response)
+        finally:
+            self._busy.release()
+
+    @staticmethod
+    def _with_header(start_response, value: str, name: str = 'X-Profile'):
+        def _start(status, headers, exc_info=None):
+            return start_response(status, list(headers) + [(name, value)], exc_info)
+        return _start
+
+    def _profile(self, environ, start_response):
+        captured = {}
+
+        def _capture(status, headers, exc_info=None):
+            captured['args'] = (status, list(headers), exc_info)
+            return lambda data: captured.setdefault('written', []).append(data)
+
+        started = time.perf_counter()
+        profiler = sampler = None
+        if self.mode == 'cprofile':
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            sampler = StackSampler(threading.get_ident(), self.interval).start()
+        try:
+            result = self.wsgi_app(environ, _capture)
+            try:
+                body = captured.get('written', []) + list(result)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            else:
+                sampler.stop()
+        elapsed = time.perf_counter() - started
+        name = self._save(environ, elapsed, profiler, sampler)
+        status, headers, exc_info = captured['args']
+        headers.append(('X-Profile-File', name))
+        start_response(status, headers, exc_info)
+        return body
+
+    def _save(self, environ, elapsed: float, profiler: Optional[cProfile.Profile],
+              sampler: Optional[StackSampler]) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        path = re.sub(r'[^A-Za-z0-9]+', '_', environ.get('PATH_INFO', '')).strip('_') or 'root'
+        self._seq += 1  # only one profile at a time, see __call__
+        stamp = f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{self._seq}'
+        ext = 'prof' if profiler is not None else 'folded'
+        name = f'{stamp}-{environ.get("REQUEST_METHOD", "GET")}-{path[:60]}-{elapsed * 1000:.0f}ms.{ext}'
+        target = os.path.join(self.directory, name)
+        if profiler is not None:
+            profiler.dump_stats(target)
+        else:
+            sampler.dump(target)
+        self._prune()
+        return name
+
+    def _prune(self) -> None:
+        # keep only the newest `keep` profiles
+        entries = [e for e in os.scandir(self.directory)
+                   if e.is_file() and e.name.endswith(('.prof', '.folded'))]
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for e in entries[:max(0, len(entries) - self.keep)]:
+            try:
+                os.remove(e.path)
+            except OSError:
+                pass
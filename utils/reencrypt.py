@@ -0,0 +1,267 @@
+"""Resumable re-encryption of vault items (see ``reencrypt.py``).
+
+Walks ``vault_item`` in id order, one chunk at a time, and rewrites every
+item that is not yet in the target layout: storage format (``fields`` or
+``blob``), payload encoding (binary or Fernet text) and key (the owner's
+data key instead of the master key). Previews are re-encrypted too, in the
+same encoding as the payload.
+
+Per chunk:
+
+1. read the rows (no transaction is held while the pool works);
+2. decrypt and re-encrypt on a process pool;
+3. in one short write transaction: bump the checkpoint first (taking
+   SQLite's write lock up front), skip items whose ciphertext changed
+   since step 1 (a live edit already rewrote them), write the rest, commit.
+
+The checkpoint (``job_checkpoints``) moves in the same transaction as the
+rows, so a crashed run resumes after the last committed chunk. The next
+chunk is read and handed to the pool while the previous one is written.
+"""
+import os
+import time
+from datetime import datetime
+from typing import Callable, List, NamedTuple, Optional
+
+from models import db
+from models.job_checkpoint import JobCheckpoint
+from models.vault_field import VaultField
+from models.vault_item import VaultItem
+from patterns.data_proxy import mask_preview_dict
+from utils.crypto import Ciphers, decrypt_strict, encrypt_json, encrypt_payload, process_pool, uses_data_key
+from utils.envelope import user_key
+from utils.item_cache import fingerprint
+from utils.vault_storage import _entries, item_cache, preview_token
+
+JOB_NAME = 'reencrypt'
+
+
+class Target(NamedTuple):
+    fmt: str = 'fields'     # 'fields' or 'blob'
+    binary: bool = True     # binary payloads or Fernet text tokens
+
+    def params(self) -> str:
+        return f'fmt={self.fmt};binary={int(self.binary)}'
+
+
+class Progress(NamedTuple):
+    last_id: int
+    scanned: int        # items looked at in this run
+    rewritten: int      # items re-encrypted
+    rows: int           # item + field rows written
+    conflicts: int      # changed by live traffic meanwhile, left alone
+    failed: int         # could not be decrypted, left alone
+    elapsed: float
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+# ------------------------------------------------------------- the work
+
+def _token(v):
+    return v if v is None or isinstance(v, str) else bytes(v)
+
+
+def _recrypt(entries: list, keys: dict, target: Target) -> list:
+    """Runs in a pool worker: decrypt each entry and re-encrypt it for
+    ``target``. Returns one dict per entry (``error`` set on failure)."""
+    ciphers = {uid: Ciphers(k) if k else None for uid, k in keys.items()}
+    out = []
+    for e in entries:
+        dk = ciphers.get(e['user_id'])
+        try:
+            if e['fields'] is None:
+                data = decrypt_strict(e['token'], dk) if e['token'] else {}
+            else:
+                data = {label: decrypt_strict(tok, dk) for _, label, _, tok in e['fields']}
+            preview = decrypt_strict(e['preview'], dk) if e['preview'] else mask_preview_dict(data)
+        except Exception as exc:
+            out.append({'id': e['id'], 'error': f'{type(exc).__name__}: {exc}'})
+            continue
+        seal = (lambda obj: encrypt_payload(obj, dk)) if target.binary else (lambda obj: encrypt_json(obj, dk))
+        result = {'id': e['id'], 'error': None, 'preview': seal(preview),
+                  'token': None, 'fields': []}
+        if target.fmt == 'blob':
+            result['token'] = seal(data)
+        else:
+            result['fields'] = [(name, label, pos, seal(value))
+                                for pos, (name, (label, value)) in enumerate(_entries(data).items())]
+        out.append(result)
+    return out
+
+
+def _in_target(e: dict, has_key: bool, target: Target) -> bool:
+    tokens = [e['token']] if e['fields'] is None else [f[3] for f in e['fields']]
+    if (e['fields'] is None) != (target.fmt == 'blob'):
+        return False
+    if any(isinstance(t, str) == target.binary for t in tokens if t):
+        return False
+    if not e['preview'] or isinstance(e['preview'], str) == target.binary:
+        return False
+    return not has_key or all(uses_data_key(t) for t in tokens + [e['preview']] if t)
+
+
+def _read_chunk(last_id: int, chunk_size: int):
+    rows = (db.session.query(VaultItem.id, VaultItem.user_id, VaultItem.encrypted_data,
+                             VaultItem.encrypted_blob, VaultItem.preview, VaultItem.preview_blob)
+            .filter(VaultItem.id > last_id).order_by(VaultItem.id).limit(chunk_size).all())
+    entries = []
+    for r in rows:
+        token = r.encrypted_blob if r.encrypted_blob is not None else r.encrypted_data
+        entries.append({'id': r.id, 'user_id': r.user_id, 'token': _token(token),
+                        'preview': _token(preview_token(r)), 'fields': None if token is not None else [],
+                        'fingerprint': fingerprint(r)})
+    field_level = {e['id']: e for e in entries if e['fields'] is not None}
+    if field_level:
+        for f in (db.session.query(VaultField.item_id, VaultField.name, VaultField.label,
+                                   VaultField.ciphertext, VaultField.value_blob)
+                  .filter(VaultField.item_id.in_(list(field_level)))
+                  .order_by(VaultField.item_id, VaultField.position)):
+            tok = f.value_blob if f.value_blob is not None else f.ciphertext
+            field_level[f.item_id]['fields'].append((f.name, f.label, None, _token(tok)))
+    db.session.rollback()  # end the read; nothing is held while the pool works
+    return rows[-1].id if rows else None, entries
+
+
+def _write_chunk(checkpoint_name: str, new_last_id: int, entries: list, results: list):
+    """Returns (rewritten, rows written, conflicts, failed)."""
+    now = datetime.utcnow()
+    # write the checkpoint first: it takes the write lock before anything is
+    # re-read, so the fingerprint check below can't race a live save
+    db.session.execute(db.update(JobCheckpoint).where(JobCheckpoint.name == checkpoint_name)
+                       .values(last_id=new_last_id, updated_at=now,
+                               processed=JobCheckpoint.processed + len(entries)))
+    by_id = {r['id']: r for r in results}
+    ids = list(by_id)
+    current = {r.id: fingerprint(r) for r in
+               db.session.query(VaultItem.id, VaultItem.encrypted_data, VaultItem.encrypted_blob,
+                                VaultItem.preview, VaultItem.preview_blob).filter(VaultItem.id.in_(ids))} if ids else {}
+    failed = sum(1 for r in results if r['error'])
+    ok = [e for e in entries if e['id'] in by_id and not by_id[e['id']]['error']
+          and current.get(e['id']) == e['fingerprint']]
+    conflicts = len(results) - failed - len(ok)
+    if ok:
+        item_rows, field_rows = [], []
+        for e in ok:
+            r = by_id[e['id']]
+            token = r['token']
+            preview = r['preview']
+            item_rows.append({'id': e['id'],
+                              'preview_blob': preview if isinstance(preview, bytes) else None,
+                              'preview': preview if isinstance(preview, str) else None,
+                              'encrypted_blob': token if isinstance(token, bytes) else None,
+                              'encrypted_data': token if isinstance(token, str) else None})
+            for name, label, pos, tok in r['fields']:
+                field_rows.append({'item_id': e['id'], 'name': name, 'label': label, 'position': pos,
+                                   'value_blob': tok if isinstance(tok, bytes) else None,
+                                   'ciphertext': tok if isinstance(tok, str) else None})
+        ok_ids = [e['id'] for e in ok]
+        db.session.execute(VaultField.__table__.delete().where(VaultField.item_id.in_(ok_ids)))
+        db.session.execute(db.update(VaultItem), item_rows)
+        if field_rows:
+            db.session.execute(VaultField.__table__.insert(), field_rows)
+    db.session.commit()
+    for e in ok:
+        item_cache.invalidate_item(e['id'])
+    return len(ok), len(ok) + sum(len(by_id[e['id']]['fields']) for e in ok), conflicts, failed
+
+
+# ---------------------------------------------------------------- driver
+
+def _split(entries: list, parts: int) -> List[list]:
+    size = max(1, -(-len(entries) // parts))
+    return [entries[i:i + size] for i in range(0, len(entries), size)]
+
+
+class Reencryptor:
+    """Runs (or resumes) the re-encryption job; use inside an app context."""
+
+    def __init__(self, target: Target, chunk_size: int = 200, workers: int = None,
+                 pause: float = 0.0, force: bool = False, name: str = JOB_NAME):
+        self.target = target
+        self.chunk_size = chunk_size
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.pause = pause
+        self.force = force
+        self.name = name
+
+    def _checkpoint(self, restart: bool) -> JobCheckpoint:
+        cp = db.session.get(JobCheckpoint, self.name)
+        params = self.target.params() + (';force' if self.force else '')
+        if cp is None:
+            cp = JobCheckpoint(name=self.name, params=params)
+            db.session.add(cp)
+        elif restart or cp.params != params or cp.finished_at is not None:
+            # a different target (or a finished pass) starts from the beginning
+            cp.params, cp.last_id, cp.processed = params, 0, 0
+            cp.started_at, cp.finished_at = datetime.utcnow(), None
+        db.session.commit()
+        return cp
+
+    def _submit(self, pool, entries: list):
+        keys = {}
+        todo = []
+        for e in entries:
+            uid = e['user_id']
+            if uid not in keys:
+                c = user_key(uid)
+                keys[uid] = c.key if c is not None else None
+            if self.force or not _in_target(e, keys[uid] is not None, self.target):
+                todo.append(e)
+        if not todo:
+            return todo, None
+        if pool is None:
+            return todo, [_recrypt(todo, keys, self.target)]
+        return todo, [pool.submit(_recrypt, part, keys, self.target) for part in _split(todo, self.workers)]
+
+    @staticmethod
+    def _results(futures) -> list:
+        out = []
+        for f in futures or ():
+            out.extend(f if isinstance(f, list) else f.result())
+        return out
+
+    def run(self, restart: bool = False, progress: Callable[[Progress], None] = None) -> Progress:
+        cp = self._checkpoint(restart)
+        last_id = cp.last_id
+        scanned = rewritten = rows = conflicts = failed = 0
+        start = time.perf_counter()
+        pool = None
+        if self.workers > 1:
+            pool = process_pool(self.workers)
+        pending: Optional[tuple] = None
+        try:
+            while True:
+                next_last, entries = _read_chunk(last_id, self.chunk_size)
+                submitted = None
+                if entries:
+                    todo, futures = self._submit(pool, entries)
+                    submitted = (next_last, entries, todo, futures)
+                    last_id = next_last
+                if pending is not None:
+                    # write chunk N while the pool works on chunk N+1
+                    p_last, p_entries, p_todo, p_futures = pending
+                    done, written, clash, bad = _write_chunk(self.name, p_last, p_todo,
+                                                             self._results(p_futures))
+                    scanned += len(p_entries)
+                    rewritten += done
+                    rows += written
+                    conflicts += clash
+                    failed += bad
+                    if progress:
+                        progress(Progress(p_last, scanned, rewritten, rows, conflicts, failed,
+                                          time.perf_counter() - start))
+                    if self.pause:
+                        time.sleep(self.pause)  # let live writers in
+                pending = submitted
+                if pending is None:
+                    break
+            db.session.execute(db.update(JobCheckpoint).where(JobCheckpoint.name == self.name)
+                               .values(finished_at=datetime.utcnow()))
+            db.session.commit()
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        return Progress(last_id, scanned, rewritten, rows, conflicts, failed, time.perf_counter() - start)
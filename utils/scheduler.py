@@ -0,0 +1,76 @@
+import logging
+import threading
+import time
+from typing import Callable, List, Optional
+
+log = logging.getLogger(__name__)
+
+
+class Job:
+    def __init__(self, name: str, func: Callable[[], None], interval: float):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        # run on the first tick
+        self.next_run = 0.0
+
+
+class Scheduler:
+    """Runs periodic maintenance jobs on a daemon thread.
+
+    Every job runs inside an application context and gets a fresh database
+    session, so it never shares state with request handlers.
+    """
+
+    def __init__(self, app, tick: float = 1.0):
+        self.app = app
+        self.tick = tick
+        self._jobs: List[Job] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add_job(self, name: str, func: Callable[[], None], interval: float) -> 'Scheduler':
+        self._jobs.append(Job(name, func, interval))
+        return self
+
+    def run_pending(self, force: bool = False) -> None:
+        now = time.monotonic()
+        for job in self._jobs:
+            if not force and now < job.next_run:
+                continue
+            job.next_run = now + job.interval
+            self._run(job)
+
+    def _run(self, job: Job) -> None:
+        from models import db
+        from utils.metrics import observe_job
+        start = time.perf_counter()
+        failed = False
+        with self.app.app_context():
+            try:
+                job.func()
+            except Exception:
+                failed = True
+                log.exception('scheduled job %s failed', job.name)
+                db.session.rollback()
+            finally:
+                db.session.remove()
+                observe_job(job.name, time.perf_counter() - start, failed)
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run_forever, name='mypass-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def run_forever(self) -> None:
+        # blocking loop; used by the thread and by the standalone worker
+        while not self._stop.is_set():
+            self.run_pending()
+            self._stop.wait(self.tick)
@@ -0,0 +1,106 @@
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from utils.crypto import derive_key
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _unb64(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+class UsedTokenSet:
+    """In-memory record of consumed token nonces.
+
+    Entries only need to live until the token would have expired anyway, so
+    the set stays as small as the number of tokens used in one TTL window.
+    ``consume`` sweeps expired entries itself every ``sweep_every`` inserts,
+    so the set stays bounded in processes that run no scheduler.
+    """
+
+    def __init__(self, sweep_every: int = 256):
+        self.sweep_every = sweep_every
+        self._used: Dict[str, float] = {}
+        self._inserts = 0
+        self._lock = threading.Lock()
+
+    def consume(self, nonce: str, expires_at: float) -> bool:
+        # Mark nonce as used; False if it had already been used
+        with self._lock:
+            if nonce in self._used:
+                return False
+            self._used[nonce] = expires_at
+            self._inserts += 1
+            if self._inserts >= self.sweep_every:
+                self._sweep(time.time())
+            return True
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        with self._lock:
+            return self._sweep(now)
+
+    def _sweep(self, now: float) -> int:
+        # caller holds the lock
+        stale = [n for n, exp in self._used.items() if exp < now]
+        for n in stale:
+            del self._used[n]
+        self._inserts = 0
+        return len(stale)
+
+    def __len__(self) -> int:
+        return len(self._used)
+
+
+_used = UsedTokenSet()
+
+
+def _sign(payload: bytes) -> bytes:
+    return hmac.new(derive_key('unmask-token'), payload, hashlib.sha256).digest()
+
+
+def issue_signed(user_id: int, item_id: Optional[int] = None, field: Optional[str] = None,
+                 ttl_seconds: int = 30) -> Tuple[str, datetime]:
+    """Issue an HMAC-signed unmask token bound to (user, item, field, expiry).
+
+    Nothing is written anywhere; the token carries all of its claims.
+    """
+    exp = int(time.time()) + ttl_seconds
+    claims = [user_id, item_id, (field or '').lower(), exp, secrets.token_urlsafe(12)]
+    payload = json.dumps(claims, separators=(',', ':')).encode('utf-8')
+    token = _b64(payload) + '.' + _b64(_sign(payload))
+    return token, datetime.utcfromtimestamp(exp)
+
+
+def validate_signed(token: str, user_id: int, item_id: Optional[int] = None,
+                    field: Optional[str] = None) -> bool:
+    """Check signature, expiry and binding, then consume the token."""
+    try:
+        body, sig = token.split('.', 1)
+        payload = _unb64(body)
+        if not hmac.compare_digest(_unb64(sig), _sign(payload)):
+            return False
+        t_user, t_item, t_field, exp, nonce = json.loads(payload)
+    except Exception:
+        return False
+    if exp < time.time() or t_user != user_id:
+        return False
+    if item_id is not None and t_item is not None and t_item != item_id:
+        return False
+    if field is not None and t_field and t_field != field.lower():
+        return False
+    return _used.consume(nonce, exp)
+
+
+def sweep_used_tokens() -> int:
+    return _used.sweep()
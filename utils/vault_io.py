@@ -0,0 +1,495 @@
+"""Streaming vault import and export.
+
+Imports run as a generator pipeline so memory stays bounded no matter how
+large the file is:
+
+    parse (CSV / JSON / JSON Lines / archive)  ->  normalize  ->
+    chunks of N  ->  batch-encrypt  ->  bulk INSERT, one commit per chunk
+
+Understood layouts: MyPass' own exports, Bitwarden (JSON and CSV),
+LastPass, 1Password, Chrome/Edge and Firefox CSV, and generic CSV/JSON
+with recognisable column names. JSON arrays and JSON Lines are read
+incrementally; wrapper objects such as Bitwarden's ``{"items": [...]}``
+are read whole.
+
+Exports walk the vault in id order, one chunk at a time, and yield text
+so they can be written to a file or streamed as an HTTP response. The
+``archive`` format is re-encrypted under a passphrase (scrypt +
+AES-256-GCM per record) and does not depend on ``secret.key``.
+"""
+import base64
+import csv
+import hashlib
+import io
+import json
+import os
+import struct
+from itertools import islice
+from typing import Dict, Iterable, Iterator, NamedTuple, Optional, Tuple
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from models import db
+from models.expiry_index import ExpiryIndex
+from models.search_token import SearchToken
+from models.password_audit import PasswordAudit
+from models.user import User
+from models.vault_item import VaultItem
+from patterns.data_proxy import mask_preview_dict
+from utils.vault_storage import encrypt_items, encrypt_previews, read_items, write_new_fields
+
+IMPORT_FORMATS = ('auto', 'csv', 'json', 'archive')
+EXPORT_FORMATS = ('csv', 'jsonl', 'archive')
+DEFAULT_CHUNK_SIZE = 1000
+# bound on cached blind-index terms during an import
+MEMO_LIMIT = 100_000
+
+ITEM_TYPES = ('Login', 'CreditCard', 'Identity', 'SecureNote')
+
+ARCHIVE_MAGIC = 'mypass-archive'
+ARCHIVE_VERSION = 1
+# scrypt cost: ~50 ms and 16 MiB per derivation
+SCRYPT_N, SCRYPT_R, SCRYPT_P = 2 ** 14, 8, 1
+
+
+class ImportFormatError(ValueError):
+    """The input could not be parsed (or an archive could not be opened)."""
+
+
+class ImportResult(NamedTuple):
+    imported: int
+    skipped: int
+
+
+# ---------------------------------------------------------------- parsing
+
+def _text(stream) -> io.TextIOBase:
+    # uploads and CLI files arrive as bytes; utf-8-sig drops Excel's BOM
+    if isinstance(stream, io.TextIOBase):
+        return stream
+    return io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+
+def parse_csv(stream) -> Iterator[dict]:
+    for row in csv.DictReader(_text(stream)):
+        yield {k: v for k, v in row.items() if k is not None}
+
+
+def _iter_json_values(text, buf: str, chunk_size: int = 1 << 16) -> Iterator:
+    """Decode consecutive JSON values (separated by whitespace or commas,
+    optionally closed by ``]``) without reading the whole stream."""
+    decoder = json.JSONDecoder()
+    pos, eof = 0, False
+    while True:
+        while pos < len(buf) and buf[pos] in ' \t\r\n,':
+            pos += 1
+        if pos == len(buf):
+            if eof:
+                return
+            buf, pos = text.read(chunk_size), 0
+            eof = not buf
+            continue
+        if buf[pos] == ']':
+            return
+        try:
+            value, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            more = '' if eof else text.read(chunk_size)
+            if not more:
+                raise ImportFormatError('malformed JSON input')
+            buf, pos = buf[pos:] + more, 0
+            continue
+        if end == len(buf) and not eof and not isinstance(value, (dict, list)):
+            # a bare scalar may continue in the next chunk
+            more = text.read(chunk_size)
+            if more:
+                buf, pos = buf[pos:] + more, 0
+                continue
+            eof = True
+        yield value
+        buf, pos = buf[end:], 0
+
+
+def parse_json(stream) -> Iterator[dict]:
+    """Records from a JSON array, JSON Lines, or an ``{"items": [...]}``
+    wrapper (Bitwarden)."""
+    text = _text(stream)
+    head = text.read(1 << 16).lstrip()
+    if not head:
+        return
+    if head[0] == '[':
+        values = _iter_json_values(text, head[1:])
+    else:
+        values = _iter_json_values(text, head)
+        first = next(values, None)
+        if isinstance(first, dict) and isinstance(first.get('items'), list):
+            values = iter(first['items'])
+        elif first is not None:
+            yield first
+    for value in values:
+        if isinstance(value, dict):
+            yield value
+
+
+# ----------------------------------------------------------- normalizing
+
+# flat column name (lower-cased) -> MyPass field name; None drops the column
+COLUMN_ALIASES: Dict[str, Optional[str]] = {
+    'username': 'username', 'login_username': 'username', 'user': 'username',
+    'login': 'username', 'email': 'username', 'user name': 'username',
+    'password': 'password', 'login_password': 'password', 'pass': 'password',
+    'url': 'url', 'uri': 'url', 'website': 'url', 'login_uri': 'url', 'hostname': 'url',
+    'notes': 'notes', 'note': 'notes', 'extra': 'notes', 'comments': 'notes',
+    'totp': 'totp', 'login_totp': 'totp', 'otpauth': 'totp', 'one-time password': 'totp',
+    'card_number': 'card_number', 'card number': 'card_number', 'number': 'card_number',
+    'cvv': 'cvv', 'cvc': 'cvv', 'security code': 'cvv', 'code': 'cvv',
+    'expiry': 'expiry', 'expiration': 'expiry', 'expiration date': 'expiry',
+    'ssn': 'ssn', 'passport': 'passport', 'passport_expiry': 'passport_expiry',
+    'license': 'license', 'license_expiry': 'license_expiry',
+    # bookkeeping columns of other managers
+    'folder': None, 'grouping': None, 'favorite': None, 'fav': None, 'reprompt': None,
+    'guid': None, 'httprealm': None, 'formactionorigin': None, 'timecreated': None,
+    'timelastused': None, 'timepasswordchanged': None, 'collections': None,
+}
+TITLE_COLUMNS = ('title', 'name')
+TYPE_COLUMNS = ('item_type', 'type')
+TYPE_ALIASES = {
+    'login': 'Login', 'password': 'Login', '1': 'Login',
+    'creditcard': 'CreditCard', 'card': 'CreditCard', 'credit card': 'CreditCard', '3': 'CreditCard',
+    'identity': 'Identity', '4': 'Identity',
+    'securenote': 'SecureNote', 'note': 'SecureNote', 'secure note': 'SecureNote', '2': 'SecureNote',
+}
+# LastPass marks secure notes with this pseudo URL
+LASTPASS_NOTE_URL = 'http://sn'
+
+
+def _infer_type(fields: dict) -> str:
+    if 'card_number' in fields:
+        return 'CreditCard'
+    if any(k in fields for k in ('ssn', 'passport', 'license')):
+        return 'Identity'
+    if any(k in fields for k in ('username', 'password', 'url')):
+        return 'Login'
+    return 'SecureNote'
+
+
+def _clean(fields: dict) -> dict:
+    return {k: v for k, v in fields.items() if v not in (None, '')}
+
+
+def _card_expiry(month, year) -> str:
+    try:
+        return f'{int(year):04d}-{int(month):02d}'
+    except (TypeError, ValueError):
+        return ''
+
+
+def _dict(value) -> dict:
+    # sub-objects of foreign exports are not trusted to have the right shape
+    return value if isinstance(value, dict) else {}
+
+
+def _first_uri(uris) -> Optional[str]:
+    if not isinstance(uris, list) or not uris:
+        return None
+    first = uris[0]
+    return _dict(first).get('uri') if not isinstance(first, str) else first
+
+
+def _normalize_bitwarden(rec: dict) -> Tuple[str, str, dict]:
+    kind = TYPE_ALIASES.get(str(rec.get('type')), 'Login')
+    fields = {}
+    login = _dict(rec.get('login'))
+    card = _dict(rec.get('card'))
+    ident = _dict(rec.get('identity'))
+    if kind == 'Login':
+        fields.update(username=login.get('username'), password=login.get('password'),
+                      url=_first_uri(login.get('uris')), totp=login.get('totp'))
+    elif kind == 'CreditCard':
+        fields.update(cardholder=card.get('cardholderName'), brand=card.get('brand'),
+                      card_number=card.get('number'), cvv=card.get('code'),
+                      expiry=_card_expiry(card.get('expMonth'), card.get('expYear')))
+    elif kind == 'Identity':
+        name = ' '.join(filter(None, (ident.get('firstName'), ident.get('lastName'))))
+        fields.update(name=name, email=ident.get('email'), ssn=ident.get('ssn'),
+                      passport=ident.get('passportNumber'), license=ident.get('licenseNumber'))
+    customs = rec.get('fields')
+    for custom in customs if isinstance(customs, list) else []:
+        custom = _dict(custom)
+        if custom.get('name'):
+            fields[str(custom['name'])] = custom.get('value')
+    fields['notes'] = rec.get('notes')
+    return kind, rec.get('name') or '', _clean(fields)
+
+
+def _normalize_flat(rec: dict) -> Tuple[str, str, dict]:
+    title, kind, fields = '', '', {}
+    for key, value in rec.items():
+        name = str(key or '').strip().lower()
+        if name in TITLE_COLUMNS and not title:
+            title = value or ''
+        elif name in TYPE_COLUMNS and not kind:
+            kind = TYPE_ALIASES.get(str(value or '').strip().lower(), '')
+        elif name == 'other' and value:
+            # extra fields of a MyPass CSV export
+            try:
+                fields.update(json.loads(value))
+            except (TypeError, ValueError):
+                fields['other'] = value
+        elif name in COLUMN_ALIASES:
+            target = COLUMN_ALIASES[name]
+            if target and not fields.get(target):
+                fields[target] = value
+        elif name:
+            fields[str(key).strip()] = value
+    fields = _clean(fields)
+    if fields.get('url') == LASTPASS_NOTE_URL:
+        fields.pop('url')
+        kind = 'SecureNote'
+    return kind or _infer_type(fields), title, fields
+
+
+def normalize_record(rec: dict) -> Optional[Tuple[str, str, dict]]:
+    """(item_type, title, fields) for one parsed record, or None to skip."""
+    try:
+        if isinstance(rec.get('fields'), dict):
+            # MyPass JSON export
+            kind = rec.get('item_type')
+            fields = _clean(rec['fields'])
+            item = (kind if kind in ITEM_TYPES else _infer_type(fields), rec.get('title') or '', fields)
+        elif isinstance(rec.get('type'), int) and ('login' in rec or 'name' in rec):
+            item = _normalize_bitwarden(rec)
+        else:
+            item = _normalize_flat(rec)
+    except (KeyError, TypeError, AttributeError):
+        raise ImportFormatError('unexpected record structure')
+    kind, title, fields = item
+    if not fields and not title:
+        return None
+    return kind, str(title).strip() or fields.get('url', '') or 'Imported item', fields
+
+
+def parse(stream, fmt: str = 'auto', filename: str = '', passphrase: str = None) -> Iterator[dict]:
+    if fmt == 'auto':
+        ext = os.path.splitext(filename or '')[1].lower()
+        fmt = {'.csv': 'csv', '.mypass': 'archive'}.get(ext, 'json')
+    if fmt == 'csv':
+        return _format_errors(parse_csv(stream))
+    if fmt == 'archive':
+        return _format_errors(read_archive(stream, passphrase))
+    if fmt == 'json':
+        return _format_errors(parse_json(stream))
+    raise ImportFormatError(f'unknown import format {fmt!r}')
+
+
+def _format_errors(records: Iterator[dict]) -> Iterator[dict]:
+    # undecodable or oddly shaped input is the uploader's problem: report
+    # it as ImportFormatError (a 400) instead of letting it escape
+    try:
+        yield from records
+    except UnicodeDecodeError:
+        raise ImportFormatError('the file is not UTF-8 text')
+    except csv.Error as e:
+        raise ImportFormatError(f'malformed CSV input ({e})')
+    except (KeyError, TypeError, AttributeError):
+        raise ImportFormatError('unexpected record structure')
+
+
+# -------------------------------------------------------------- importing
+
+def chunked(iterable: Iterable, size: int) -> Iterator[list]:
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def import_records(user_id: int, records: Iterable[dict], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                   fmt: str = 'fields', binary: bool = True, progress=None) -> ImportResult:
+    """Normalize, encrypt and insert ``records`` for ``user_id``.
+
+    Every chunk is encrypted in one pass and written with bulk INSERTs in
+    its own transaction, so a failure keeps the chunks already committed.
+    ``progress(imported, skipped)`` is called after each commit.
+    """
+    imported = skipped = 0
+    # term -> digests of this user's blind index, shared across chunks
+    memo = {}
+    for chunk in chunked(records, chunk_size):
+        if len(memo) > MEMO_LIMIT:
+            memo.clear()
+        rows = []
+        for rec in chunk:
+            item = normalize_record(rec) if isinstance(rec, dict) else None
+            if item is None:
+                skipped += 1
+            else:
+                rows.append(item)
+        if not rows:
+            continue
+        # one block of change sequence values per chunk
+        first = User.next_change_seq(user_id, len(rows)) - len(rows) + 1
+        items = [VaultItem(user_id=user_id, item_type=kind, title=title, revision=first + i)
+                 for i, (kind, title, _) in enumerate(rows)]
+        datas = [fields for _, _, fields in rows]
+        if fmt == 'blob':
+            encrypt_items(items, datas, binary)
+        encrypt_previews(items, [mask_preview_dict(d) for d in datas], binary)
+        db.session.add_all(items)
+        db.session.flush()
+        if fmt != 'blob':
+            write_new_fields(items, datas, binary)
+        expiry_rows, search_rows, audit_rows = [], [], []
+        for it, data in zip(items, datas):
+            expiry_rows.extend(ExpiryIndex.rows_for_item(it, data))
+            search_rows.extend(SearchToken.rows_for_item(it, data, memo))
+            audit_rows.extend(PasswordAudit.rows_for_item(it, data))
+        if expiry_rows:
+            db.session.execute(ExpiryIndex.__table__.insert(), expiry_rows)
+        if audit_rows:
+            db.session.execute(PasswordAudit.__table__.insert(), audit_rows)
+        SearchToken.insert_rows(search_rows)
+        db.session.commit()
+        # keep the identity map from growing with the import
+        db.session.expunge_all()
+        imported += len(items)
+        if progress:
+            progress(imported, skipped)
+    return ImportResult(imported, skipped)
+
+
+# -------------------------------------------------------------- exporting
+
+def iter_vault(user_id: int, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Tuple[VaultItem, dict]]:
+    """(item, decrypted fields) for every item of ``user_id`` in id order,
+    decrypting one chunk at a time."""
+    last_id = 0
+    while True:
+        items = (VaultItem.query.filter(VaultItem.user_id == user_id, VaultItem.id > last_id)
+                 .order_by(VaultItem.id).limit(chunk_size).all())
+        if not items:
+            return
+        for it, data in zip(items, read_items(items)):
+            yield it, data
+        last_id = items[-1].id
+        db.session.expunge_all()
+
+
+def _record(it: VaultItem, data: dict) -> dict:
+    return {'item_type': it.item_type, 'title': it.title, 'fields': data}
+
+
+def export_jsonl(pairs) -> Iterator[str]:
+    for it, data in pairs:
+        yield json.dumps(_record(it, data), ensure_ascii=False) + '\n'
+
+
+CSV_COLUMNS = ('item_type', 'title', 'username', 'password', 'url', 'totp', 'card_number', 'cvv',
+               'expiry', 'ssn', 'passport', 'passport_expiry', 'license', 'license_expiry', 'notes')
+
+
+def export_csv(pairs) -> Iterator[str]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+
+    def take():
+        out = buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+        return out
+
+    writer.writerow(CSV_COLUMNS + ('other',))
+    yield take()
+    for it, data in pairs:
+        data = dict(data or {})
+        row = [it.item_type, it.title] + [data.pop(c, '') for c in CSV_COLUMNS[2:]]
+        # anything without a column of its own goes into a JSON cell
+        row.append(json.dumps(data, ensure_ascii=False) if data else '')
+        writer.writerow(row)
+        yield take()
+
+
+def _archive_key(passphrase: str, salt: bytes, n: int, r: int, p: int) -> AESGCM:
+    key = hashlib.scrypt(passphrase.encode('utf-8'), salt=salt, n=n, r=r, p=p,
+                         maxmem=256 * n * r + (1 << 20), dklen=32)
+    return AESGCM(key)
+
+
+def _archive_aad(salt: bytes, index: int) -> bytes:
+    # binds every line to this archive and its position, so lines cannot be
+    # reordered, dropped or spliced in from another archive
+    return salt + struct.pack('>Q', index)
+
+
+def export_archive(pairs, passphrase: str) -> Iterator[str]:
+    """Passphrase-encrypted archive: a JSON header line, then one base64
+    AES-GCM record per line, closed by an encrypted record count."""
+    if not passphrase:
+        raise ValueError('an archive passphrase is required')
+    salt = os.urandom(16)
+    header = {'format': ARCHIVE_MAGIC, 'version': ARCHIVE_VERSION, 'kdf': 'scrypt',
+              'n': SCRYPT_N, 'r': SCRYPT_R, 'p': SCRYPT_P,
+              'salt': base64.b64encode(salt).decode('ascii')}
+    yield json.dumps(header) + '\n'
+    aead = _archive_key(passphrase, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+    def seal(index, obj):
+        nonce = os.urandom(12)
+        body = json.dumps(obj, separators=(',', ':')).encode('utf-8')
+        return base64.b64encode(nonce + aead.encrypt(nonce, body, _archive_aad(salt, index))).decode('ascii') + '\n'
+
+    count = 0
+    for it, data in pairs:
+        yield seal(count, _record(it, data))
+        count += 1
+    yield seal(count, {'end': count})
+
+
+def read_archive(stream, passphrase: str) -> Iterator[dict]:
+    if not passphrase:
+        raise ImportFormatError('an archive passphrase is required')
+    text = _text(stream)
+    try:
+        header = json.loads(text.readline())
+        if header.get('format') != ARCHIVE_MAGIC or header.get('version') != ARCHIVE_VERSION:
+            raise ValueError
+        salt = base64.b64decode(header['salt'])
+        cost = (int(header['n']), int(header['r']), int(header['p']))
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise ImportFormatError('not a MyPass archive')
+    # the header is untrusted: never let an upload pick its own scrypt cost
+    if cost != (SCRYPT_N, SCRYPT_R, SCRYPT_P):
+        raise ImportFormatError('unsupported archive key derivation parameters')
+    aead = _archive_key(passphrase, salt, *cost)
+    index = 0
+    for line in text:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            raw = base64.b64decode(line)
+            obj = json.loads(aead.decrypt(raw[:12], raw[12:], _archive_aad(salt, index)))
+        except (InvalidTag, ValueError):
+            raise ImportFormatError('wrong passphrase or corrupted archive')
+        if 'end' in obj:
+            if obj['end'] != index:
+                raise ImportFormatError('corrupted archive')
+            return
+        yield obj
+        index += 1
+    raise ImportFormatError('truncated archive')
+
+
+def export_vault(user_id: int, fmt: str, passphrase: str = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[str]:
+    pairs = iter_vault(user_id, chunk_size)
+    if fmt == 'csv':
+        return export_csv(pairs)
+    if fmt == 'jsonl':
+        return export_jsonl(pairs)
+    if fmt == 'archive':
+        return export_archive(pairs, passphrase)
+    raise ValueError(f'unknown export format {fmt!r}')
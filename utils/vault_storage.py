@@ -0,0 +1,154 @@
+"""Reading and writing vault item payloads.
+
+Two storage formats exist side by side:
+
+* ``blob``: the whole field map encrypted as one payload in
+  ``VaultItem.encrypted_blob`` (or, originally, as a Fernet text token in
+  ``encrypted_data``);
+* ``fields``: every field encrypted on its own in ``vault_fields`` under
+  its normalized name, with both item columns left NULL, so a single
+  field can be fetched and decrypted without touching the others.
+
+Independently, ciphertexts are either compact binary payloads or legacy
+Fernet text tokens, under the owner's data key (``utils/envelope.py``) or,
+for older rows, the master key. Readers handle every combination
+transparently; the formats for new writes are chosen by the caller
+(``VAULT_STORAGE_FORMAT`` and ``PAYLOAD_FORMAT`` in the app config).
+"""
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from models import db
+from models.vault_field import VaultField
+from utils.envelope import decrypt_for, encrypt_for
+from utils.item_cache import DecryptedItemCache
+
+FORMATS = ('blob', 'fields')
+
+# decrypted payloads for the single-item paths (view/edit/copy/unmask)
+item_cache = DecryptedItemCache()
+
+
+def normalize_field(name) -> str:
+    return str(name or '').lower()
+
+
+def item_token(item):
+    # whole-item ciphertext (binary payload preferred), None for field-level items
+    blob = getattr(item, 'encrypted_blob', None)
+    return blob if blob is not None else item.encrypted_data
+
+
+def field_token(row):
+    return row.value_blob if row.value_blob is not None else row.ciphertext
+
+
+def preview_token(item):
+    # masked preview snapshot (binary payload preferred), None until built
+    blob = getattr(item, 'preview_blob', None)
+    return blob if blob is not None else item.preview
+
+
+def is_field_level(item) -> bool:
+    return item_token(item) is None
+
+
+def write_item(item, data: Dict[str, Any], fmt: str = 'fields', binary: bool = True) -> None:
+    """Store ``data`` for a flushed ``item`` in the given format (caller commits)."""
+    item_cache.invalidate_item(item.id)
+    VaultField.remove_for_item(item.id)
+    item.encrypted_data = None
+    item.encrypted_blob = None
+    if fmt == 'blob':
+        encrypt_items([item], [data], binary)
+        return
+    write_new_fields([item], [data], binary)
+
+
+def _entries(data: Dict[str, Any]) -> Dict[str, tuple]:
+    # one entry per normalized name; the last submitted value wins
+    entries = {}
+    for label, value in (data or {}).items():
+        entries[normalize_field(label)] = (label, value)
+    return entries
+
+
+def encrypt_items(items, datas, binary: bool = True) -> None:
+    """Set whole-item ciphertexts for a batch with one encryption pass."""
+    tokens = encrypt_for([it.user_id for it in items], datas, binary)
+    for item, token in zip(items, tokens):
+        item.encrypted_blob, item.encrypted_data = (token, None) if binary else (None, token)
+
+
+def encrypt_previews(items, snapshots, binary: bool = True) -> None:
+    """Set the encrypted masked preview snapshots of a batch in one pass."""
+    tokens = encrypt_for([it.user_id for it in items], snapshots, binary)
+    for item, token in zip(items, tokens):
+        item.preview_blob, item.preview = (token, None) if binary else (None, token)
+
+
+def write_new_fields(items, datas, binary: bool = True) -> None:
+    """Insert field-level rows for flushed items that have none yet: one
+    encryption pass and one executemany INSERT for the whole batch."""
+    rows, owners, plain = [], [], []
+    for item, data in zip(items, datas):
+        for pos, (name, (label, value)) in enumerate(_entries(data).items()):
+            rows.append({'item_id': item.id, 'name': name, 'label': label, 'position': pos})
+            owners.append(item.user_id)
+            plain.append(value)
+    if not rows:
+        return
+    column = 'value_blob' if binary else 'ciphertext'
+    for row, token in zip(rows, encrypt_for(owners, plain, binary)):
+        row[column] = token
+    # Core insert: plain executemany, without ORM bulk bookkeeping
+    db.session.execute(VaultField.__table__.insert(), rows)
+
+
+def read_items(items) -> List[dict]:
+    """Decrypt the payloads of several items (any mix of formats), in order."""
+    out: List[Optional[dict]] = [None] * len(items)
+    blob_idx = [i for i, it in enumerate(items) if not is_field_level(it)]
+    blob_tokens = [item_token(items[i]) for i in blob_idx]
+    for i, data in zip(blob_idx, decrypt_for([items[i].user_id for i in blob_idx], blob_tokens)):
+        out[i] = data or {}
+    owner = {it.id: it.user_id for it in items if is_field_level(it)}
+    if owner:
+        rows = (VaultField.query.filter(VaultField.item_id.in_(list(owner)))
+                .order_by(VaultField.item_id, VaultField.position).all())
+        by_item = defaultdict(dict)
+        values = decrypt_for([owner[r.item_id] for r in rows], [field_token(r) for r in rows])
+        for row, value in zip(rows, values):
+            by_item[row.item_id][row.label] = value
+        for i, it in enumerate(items):
+            if out[i] is None:
+                out[i] = by_item.get(it.id, {})
+    return out
+
+
+def read_item(item) -> dict:
+    data = item_cache.get_item(item)
+    if data is None:
+        data = read_items([item])[0]
+        item_cache.put_item(item, data)
+    return data
+
+
+def read_field(item, field) -> Any:
+    """Value of one field (matched case-insensitively) or None."""
+    name = normalize_field(field)
+    found, value = item_cache.get_field(item, name)
+    if found:
+        return value
+    if is_field_level(item):
+        row = VaultField.query.filter_by(item_id=item.id, name=name).first()
+        value = decrypt_for([item.user_id], [field_token(row)])[0] if row else None
+        item_cache.put_field(item, name, value)
+        return value
+    # legacy whole-blob item: decrypt everything once and cache it
+    data = decrypt_for([item.user_id], [item_token(item)])[0] or {}
+    item_cache.put_item(item, data)
+    for k, v in data.items():
+        if normalize_field(k) == name:
+            return v
+    return None
@@ -0,0 +1,27 @@
+"""Standalone background worker for MyPass periodic jobs.
+
+Importing the app never starts the periodic jobs; only ``python app.py``
+runs them on a thread. Under a WSGI server (one or many workers), run this
+once next to the web processes:
+
+    python worker.py            # loop forever
+    python worker.py --once     # run every job once and exit (cron)
+"""
+import argparse
+
+from app import app, scheduler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run MyPass background jobs.')
+    parser.add_argument('--once', action='store_true', help='run all jobs once and exit')
+    args = parser.parse_args()
+    if args.once:
+        scheduler.run_pending(force=True)
+        return
+    app.logger.info('worker started')
+    scheduler.run_forever()
+
+
+if __name__ == '__main__':
+    main()